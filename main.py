@@ -1,8 +1,13 @@
 import json
+import io
 from sys import print_exception
 import _thread
 from MicroWebSrv2 import *
-from time import sleep, sleep_ms, time
+from time import sleep, sleep_ms, time, ticks_ms, ticks_diff
+import heapq
+import gc
+import struct
+from array import array
 from max31865 import MAX31865
 import machine
 import SIM800L
@@ -12,6 +17,10 @@ from SDI12 import SDI12
 import sdcard
 import ubinascii
 import mpyaes
+try:
+    from cryptolib import aes
+except ImportError:
+    from ucryptolib import aes
 from network import WLAN, AP_IF
 import lvgl as lv
 from imagetools import get_png_info, open_png
@@ -46,6 +55,91 @@ _check_update_interval = const(3600) # s
 _ais_update_interval   = const(30)   # s
 _sms_check_interval    = const(300)  # s
 _get_time_interval     = const(86400)# s
+_location_interval     = const(300)  # s
+_sim800_poll_interval  = const(30)   # s
+_gprs_retry_interval   = const(60)   # s
+_gprs_idle_timeout     = const(60)   # s
+_csq_interval          = const(300)  # s between signal strength queries
+_outbox_retry_interval = const(300)  # s
+_outbox_batch          = const(6)    # records per http post
+_outbox_backlog        = const(288)  # records kept on flash
+_outbox_max_batches    = const(4)    # per flush job
+_delta_keyframe        = const(12)   # posts between full snapshots in delta mode
+_json_base_bytes       = const(256)  # bytes of a json payload besides the sensors
+_json_sensor_bytes     = const(56)   # bytes per sensor in a json payload
+_form_prefix           = const(64)   # bytes, id=<device id>&enc=b64&data=
+_seal_chunk            = const(64)   # bytes encrypted per aes call
+_hex_chunk             = const(64)   # record bytes hexlified per call
+_b64_chunk             = const(48)   # record bytes base64 encoded per call
+_log_flush_records     = const(4)    # records buffered before an sd write
+_log_flush_interval    = const(1200) # s a record may wait in ram
+_alarm_debounce        = const(2)    # consecutive samples before a transition
+_alarm_cooldown        = const(3600) # s between alarm sms of one sensor
+_alarm_retry_interval  = const(300)  # s between resends of an undelivered alarm sms
+_nan = float('nan')
+_sched_max_sleep       = const(5000) # ms
+_percip_slots          = const(289)  # 24h of _write_percip_interval + 1
+_job_aging_interval    = const(120)  # s waited per priority class gained
+_adc_samples           = const(10)   # read_uv() rounds per acquisition
+_adc_trim              = const(2)    # samples dropped at each end by 'trim'
+_adc_gap               = const(2)    # ms between interleaved rounds
+_adc_budget            = const(300)  # ms an acquisition may take
+_rain_debounce         = const(100)  # ms, closer falling edges are contact bounce
+_rain_stamps           = const(128)  # tip timestamps kept for intensity
+_rain_window           = const(3600) # s looked back for the peak intensity
+_log_ring              = const(4096) # bytes of recent log lines kept in ram
+_syslog_batch          = const(1024) # log bytes buffered before an sd write
+_syslog_max            = const(65536)# bytes before syslog.txt is rotated
+_log_sms_chars         = const(150)  # newest log bytes sent for a #log sms
+_bus_timeout           = const(5000) # ms a bus acquire waits before giving up
+_bus_poll              = const(5)    # ms between checks of a queued bus waiter
+_pool_workers          = const(2)    # long lived worker threads
+_pool_depth            = const(6)    # runs queued for the workers at most
+_modbus_timeout        = const(1000) # ms spent on one slave per poll at most
+_modbus_retries        = const(2)    # extra attempts per request after a timeout
+_modbus_max_regs       = const(125)  # registers in one fc 3/4 request
+_modbus_backoff        = const(8)    # polls a dead slave is skipped at most
+_sdi12_retries         = const(2)    # extra tries of a failed or early aDn! read
+_sdi12_backoff         = const(8)    # cycles a silent sdi-12 probe is skipped at most
+_metrics_window        = const(32)   # run durations kept per task for the p95
+_metrics_interval      = const(30)   # s between info tab metrics refreshes
+_display_frame         = const(200)  # ms between display refresh passes
+
+_prio_alarm  = const(0)
+_prio_time   = const(1)
+_prio_post   = const(2)
+_prio_sms    = const(3)
+_prio_update = const(4)
+_prio_levels = const(5)
+
+_warn_ok    = const(0)
+_warn_nc    = const(1)
+_warn_none  = const(255)
+
+_log_debug  = const(0)
+_log_info   = const(1)
+_log_warn   = const(2)
+_log_error  = const(3)
+_log_levels = ('debug', 'info', 'warn', 'error')
+_log_colors = (Cyan, White, Yellow, Red)
+
+_alarm_ok   = const(0)
+_alarm_high = const(2)
+_alarm_low  = const(3)
+
+# name: (priority class, seconds before a queued job is stale)
+_job_classes = {
+    'send_alarm_sms':       (_prio_alarm,  None),
+    'get_time':             (_prio_time,   3600),
+    'get_location':         (_prio_time,   3600),
+    'post_data':            (_prio_post,   1800),
+    'flush_outbox':         (_prio_post,   1800),
+    'send_data_sms':        (_prio_post,   3600),
+    'send_gps_sms':         (_prio_post,   3600),
+    'send_loc_request_sms': (_prio_post,   3600),
+    'check_for_sms':        (_prio_sms,    _sms_check_interval),
+    'check_update':         (_prio_update, 3600),
+}
 
 _sim800_tx = const(18)
 _sim800_rx = const(17)
@@ -102,24 +196,130 @@ modbus = ModbusRTU(0, uart, ctrl_pin=45)
 
 thread_lock = _thread.allocate_lock()
 sdi_lock    = _thread.allocate_lock()
-def print_colored(text, color=Red):
-    print(f'{color}{text}{White}')
+_sdi12_addrs = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_sdi12_cache = '/sdi12.json'
+class Logger:
+    # leveled log kept in a fixed bytearray ring as "<time> <L> <msg>\n"
+    # lines. a record below `level` returns before its message is formatted,
+    # so chatty paths pass a %-format and args instead of an f-string. kept
+    # lines are echoed to the repl when `echo` is set and appended to the sd
+    # in batches by flush()
+    def __init__(self, size=_log_ring, level=_log_info, echo=True):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.size = size
+        self.head = 0   # bytes ever written
+        self.saved = 0  # bytes ever flushed (or overwritten before a flush)
+        self.lost = 0
+        self.level = level
+        self.echo = echo
+        self._lock = _thread.allocate_lock()
+    
+    def _put(self, data):
+        n = len(data)
+        if n > self.size:
+            data = data[n - self.size:]
+            n = self.size
+        ofs = self.head % self.size
+        first = min(n, self.size - ofs)
+        self.buf[ofs:ofs + first] = data[:first]
+        if first < n:
+            self.buf[:n - first] = data[first:]
+        self.head += n
+    
+    def log(self, level, msg, args):
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        line = f'{time()} {"DIWE"[level]} {msg}\n'
+        if self.echo:
+            print(f'{_log_colors[level]}{line}{White}', end='')
+        with self._lock:
+            self._put(line.encode())
+    
+    def debug(self, msg, *args):
+        if self.level <= _log_debug:
+            self.log(_log_debug, msg, args)
+    
+    def info(self, msg, *args):
+        if self.level <= _log_info:
+            self.log(_log_info, msg, args)
+    
+    def warn(self, msg, *args):
+        if self.level <= _log_warn:
+            self.log(_log_warn, msg, args)
+    
+    def error(self, msg, *args):
+        self.log(_log_error, msg, args)
+    
+    def exc(self, e):
+        # print_exception wants a real stream, the traceback goes through a StringIO
+        buf = io.StringIO()
+        print_exception(e, buf)
+        text = buf.getvalue()
+        if self.echo:
+            print(text, end='')
+        with self._lock:
+            self._put(text.encode())
+    
+    def pending(self):
+        return self.head - self.saved
+    
+    def flush(self, path):
+        # append what was logged since the last flush, losing what the ring
+        # already overwrote
+        with self._lock:
+            n = self.head - self.saved
+            if n > self.size:
+                self.lost += n - self.size
+                n = self.size
+            if n:
+                ofs = (self.head - n) % self.size
+                end = ofs + n
+                with open(path, 'ab') as f:
+                    if end <= self.size:
+                        f.write(self.mv[ofs:end])
+                    else:
+                        f.write(self.mv[ofs:])
+                        f.write(self.mv[:end - self.size])
+            self.saved = self.head
+        return n
+    
+    def recent(self, limit=_log_ring):
+        # the newest whole lines that fit in `limit` bytes
+        with self._lock:
+            n = min(self.head, self.size, limit)
+            ofs = (self.head - n) % self.size
+            if ofs + n <= self.size:
+                out = bytes(self.mv[ofs:ofs + n])
+            else:
+                out = bytes(self.mv[ofs:]) + bytes(self.mv[:ofs + n - self.size])
+            # once the ring is full the byte before the oldest is overwritten
+            whole = n == self.head or n < self.size and self.buf[ofs - 1] == 10
+        if not whole:
+            i = out.find(b'\n')
+            if 0 <= i < len(out) - 1:
+                out = out[i + 1:]
+        return out.decode()
+
+log = Logger()
 
 def print_reset_cause():
     code = machine.reset_cause()
-    print_colored('reset reason: ')
     if code == machine.PWRON_RESET:
-        print_colored('Power ON')
+        cause = 'Power ON'
     elif code == machine.HARD_RESET:
-        print_colored('Hard reset')
+        cause = 'Hard reset'
     elif code == machine.WDT_RESET:
-        print_colored('Watchdog rset')
+        cause = 'Watchdog reset'
     elif code == machine.DEEPSLEEP_RESET:
-        print_colored('Deep sleep reset')
+        cause = 'Deep sleep reset'
     elif code == machine.SOFT_RESET:
-        print_colored('Soft reset')
+        cause = 'Soft reset'
     else:
-        print_colored('Unknown')
+        cause = 'Unknown'
+    log.info(f'reset reason: {cause}')
 
 def roundup(num_to_round) -> int:
     rm = num_to_round % _write_percip_interval
@@ -158,6 +358,22 @@ def check_config(config):
         int(config['gprs']['interval'])
     except:
         return False, 'invalid gprs interval'
+    try:
+        if int(config['gprs'].get('batch', 1)) < 1:
+            return False, 'invalid gprs batch'
+        if int(config['gprs'].get('backlog', 1)) < 1:
+            return False, 'invalid gprs backlog'
+    except:
+        return False, 'invalid gprs batch or backlog'
+    if config['gprs'].get('format', 'json') not in ['json', 'compact']:
+        return False, 'invalid gprs format'
+    if config['gprs'].get('delta', 0) not in [0, 1]:
+        return False, 'invalid gprs delta'
+    try:
+        if int(config['gprs'].get('keyframe', 1)) < 1:
+            return False, 'invalid gprs keyframe'
+    except:
+        return False, 'invalid gprs keyframe'
     
     if 'interval' not in config['log']:
         return False, 'interval not in log'
@@ -165,6 +381,35 @@ def check_config(config):
         int(config['log']['interval'])
     except:
         return False, 'invalid log interval'
+    try:
+        if int(config['log'].get('flush_records', 1)) < 1:
+            return False, 'invalid log flush_records'
+        int(config['log'].get('flush_interval', 0))
+    except:
+        return False, 'invalid log flush policy'
+    if config['log'].get('level', 'info') not in _log_levels:
+        return False, 'invalid log level'
+    if config['log'].get('echo', 1) not in [0, 1]:
+        return False, 'invalid log echo'
+    
+    try:
+        if int(config.get('alarm', {}).get('debounce', 1)) < 1:
+            return False, 'invalid alarm debounce'
+        if int(config.get('alarm', {}).get('cooldown', 0)) < 0:
+            return False, 'invalid alarm cooldown'
+    except:
+        return False, 'invalid alarm policy'
+    
+    adc = config.get('adc', {})
+    if adc.get('filter', 'mean') not in ['mean', 'median', 'trim']:
+        return False, 'invalid adc filter'
+    try:
+        if int(adc.get('samples', 1)) < 1:
+            return False, 'invalid adc samples'
+        if int(adc.get('trim', 0)) < 0 or int(adc.get('gap', 0)) < 0 or int(adc.get('budget', 0)) < 0:
+            return False, 'invalid adc trim, gap or budget'
+    except:
+        return False, 'invalid adc policy'
     
     if 'key' not in config['enc']:
         return False, 'key not in enc'
@@ -175,8 +420,18 @@ def check_config(config):
         return False, 'addr not in sdi12'
     if config['sdi12']['en'] not in [0,1]:
         return False, 'invalid sdi12 en'
-    if len(config['sdi12']['addr']) != 1 and config['sdi12']['addr'] not in '0123456789':
+    addrs = config['sdi12']['addr']
+    if len(set(addrs)) != len(addrs) or any(a not in _sdi12_addrs for a in addrs):
         return False, 'invalid sdi12 addr'
+    for sensor, point in config['sdi12'].get('map', {}).items():
+        if sensor not in config['sensors'] or sensor[0] != 's' or not sensor[1:].isdigit():
+            return False, f'sdi12 map: {sensor} is not an sdi12 slot'
+        try:
+            addr, index = point
+            if addr not in addrs or not 0 <= int(index) < 100:
+                return False, f'invalid sdi12 map for {sensor}'
+        except:
+            return False, f'invalid sdi12 map for {sensor}'
     
     if 'en' not in config['rs485']:
         return False, 'en not in rs485'
@@ -190,6 +445,35 @@ def check_config(config):
         return False, 'invalid rs485 addr'
     if config['rs485']['baud'] not in bauds:
         return False, 'invalid rs485 baudrate'
+    try:
+        if int(config['rs485'].get('gap', 0)) < 0:
+            return False, 'invalid rs485 gap'
+        for addr, lim in config['rs485'].get('slaves', {}).items():
+            if not 1 <= int(addr) <= 247:
+                return False, f'invalid rs485 slave {addr}'
+            if int(lim.get('timeout', 0)) < 0 or int(lim.get('retries', 0)) < 0:
+                return False, f'invalid rs485 slave {addr} timeout or retries'
+        if int(config['rs485'].get('timeout', 0)) < 0 or int(config['rs485'].get('retries', 0)) < 0:
+            return False, 'invalid rs485 timeout or retries'
+    except:
+        return False, 'invalid rs485 slave policy'
+    for point in config['rs485'].get('map', []):
+        name = point.get('name')
+        if name not in config['sensors']:
+            return False, f'rs485 point {name} not in sensors'
+        if point.get('fc', 3) not in [3, 4]:
+            return False, f'invalid rs485 {name} fc'
+        if point.get('type', 'int16') not in ModbusMap.kinds:
+            return False, f'invalid rs485 {name} type'
+        if point.get('order', 'abcd') not in ModbusMap.orders:
+            return False, f'invalid rs485 {name} order'
+        try:
+            if not 0 <= int(point['reg']) <= 0xffff:
+                return False, f'invalid rs485 {name} reg'
+            if not 1 <= int(point.get('addr', 1)) <= 247:
+                return False, f'invalid rs485 {name} addr'
+        except:
+            return False, f'invalid rs485 {name} reg or addr'
         
     for sensor in sensors:
         if sensor not in config['sensors']:
@@ -199,6 +483,16 @@ def check_config(config):
                 return False, f'{p}  not in {sensor}'
         if config['sensors'][sensor]['en'] not in [0, 1]:
             return False, f'invalid {sensor} en'
+        try:
+            if float(config['sensors'][sensor].get('hyst') or 0) < 0:
+                return False, f'invalid {sensor} hyst'
+        except:
+            return False, f'invalid {sensor} hyst'
+        try:
+            if float(config['sensors'][sensor].get('deadband') or 0) < 0:
+                return False, f'invalid {sensor} deadband'
+        except:
+            return False, f'invalid {sensor} deadband'
     
     return True, 'config saved successfully.'
 
@@ -208,7 +502,7 @@ def save_config(config:dict) -> int:
             json.dump(config, f)
             return 0
     except:
-        print_colored("Failed to save config on flash")
+        log.warn("Failed to save config on flash")
         return -1
 
 def load_config() -> dict:
@@ -221,6 +515,7 @@ def load_config() -> dict:
     
 def delayed_restart():
     sleep(1)
+    main_app.shutdown()
     thread_lock.acquire()
     machine.reset()
     
@@ -301,8 +596,8 @@ def save(microWebSrv2, request):
             save_config(config)
 
     except Exception as e:
-        print_colored("Exception from handle form:", Magenta)
-        print_exception(e)
+        log.error("Exception from handle form:")
+        log.exc(e)
         msg = 'Failed to save config'
         result = False
 
@@ -319,11 +614,18 @@ def loading(microWebSrv2, request):
     
 @WebRoute(GET, '/scan_sdi')
 def scan_sdi(microWebSrv2, request):
-    sdi_lock.acquire()
-    result  = sdi12.scan()
-    sdi_lock.release()
+    # probes identified by the sdi12 driver answer from its cache, the bus
+    # is only scanned when there are none
+    driver = main_app.drivers.get('sdi12')
+    known = driver.known() if driver else {}
+    if known:
+        result = sorted(known)
+    else:
+        sdi_lock.acquire()
+        result = sdi12.scan()
+        sdi_lock.release()
     if result:
-        request.Response.ReturnOkJSON({'result': True, 'addr': result[0]})
+        request.Response.ReturnOkJSON({'result': True, 'addr': result[0], 'probes': known})
     else:
         request.Response.ReturnOkJSON({'result': False})
     
@@ -343,56 +645,1957 @@ def change_sdi(microWebSrv2, request):
         request.Response.ReturnOkJSON({'result': False, 'msg': 'Sensor not found'})
     sdi_lock.release()
 
+@WebRoute(GET, '/metrics')
+def get_metrics(microWebSrv2, request):
+    report = metrics.report(main_app.scheduler, (main_app.spi_bus, main_app.channels.bus))
+    report['uart'] = main_app.channels.report()
+    report['pool'] = main_app.pool.report()
+    report['display'] = main_app.display.report()
+    report['gprs'] = main_app.gprs.report()
+    for name in ('sdi12', 'rs485'):
+        if name in main_app.drivers:
+            report[name] = main_app.drivers[name].report()
+    request.Response.ReturnOkJSON(report)
+
+@WebRoute(GET, '/log')
+def get_log(microWebSrv2, request):
+    request.Response.ReturnOkJSON({'result': True, 'log': log.recent()})
+
 @WebRoute(GET, '/restart')
 def restart(microWebSrv2, request):
-    _thread.start_new_thread(delayed_restart, ())
+    main_app.pool.submit('restart', delayed_restart)
     request.Response.ReturnOkJSON({'msg': 'Restarting device...', 'result': True})
 
 class Job:
-    def __init__(self, name, func, args):
+    def __init__(self, name, func, args, prio=_prio_update, created=0, deadline=None):
         self.name = name
         self.func = func
         self.args = args
+        self.key = (name, args)
+        self.prio = prio
+        self.created = created
+        self.deadline = deadline
+    
+    def __str__(self):
+        return self.name
+    
+    def __repr__(self):
+        return self.name
+
+class JobQueue:
+    # one fifo per priority class, dict keyed (name, args) for dedup; a job
+    # gains one class per _job_aging_interval waited so nothing starves
+    def __init__(self, clock):
+        self.clock = clock
+        self.classes = [[] for _ in range(_prio_levels)]
+        self.keys = {}
+        self.dropped = 0
+        self._lock = _thread.allocate_lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __repr__(self):
+        return repr([job for jobs in self.classes for job in jobs])
+
+    def push(self, job):
+        with self._lock:
+            if job.key in self.keys:
+                return False
+            self.keys[job.key] = job
+            self.classes[job.prio].append(job)
+            return True
+
+    def _drop_stale(self, now):
+        for jobs in self.classes:
+            for job in [job for job in jobs if job.deadline is not None and now > job.deadline]:
+                log.warn(f'dropping stale job {job}')
+                jobs.remove(job)
+                del self.keys[job.key]
+                self.dropped += 1
+
+    def peek(self):
+        with self._lock:
+            now = self.clock()
+            self._drop_stale(now)
+            best = None
+            best_prio = None
+            for jobs in self.classes:
+                if jobs:
+                    job = jobs[0]
+                    prio = job.prio - (now - job.created) // (_job_aging_interval * 1000)
+                    if best is None or prio < best_prio:
+                        best = job
+                        best_prio = prio
+            return best
+
+    def remove(self, job):
+        with self._lock:
+            if self.keys.get(job.key) is job:
+                del self.keys[job.key]
+                self.classes[job.prio].remove(job)
+
+class TaskStats:
+    # timings of one task or job in fixed size counters: durations of the last
+    # _metrics_window runs in a ring for the p95, plus lock wait and heap use
+    # (the gc.mem_free() drop over a run, negative when a collect ran)
+    def __init__(self, size=_metrics_window):
+        self.ring = array('I', [0] * size)
+        self.size = size
+        self.count = 0
+        self.last = 0
+        self.max = 0
+        self.wait = 0
+        self.wait_max = 0
+        self.mem = 0
+        self.mem_max = 0
+        self.start = 0
+        self.free = 0
+        self.waited = 0
+        self.outer = None
+    
+    def p95(self):
+        n = min(self.count, self.size)
+        if not n:
+            return 0
+        return sorted(self.ring[:n])[(95 * n + 99) // 100 - 1]
+    
+    def as_dict(self):
+        return {'count': self.count, 'last': self.last, 'max': self.max, 'p95': self.p95(),
+                'wait': self.wait, 'wait_max': self.wait_max, 'mem': self.mem, 'mem_max': self.mem_max}
+
+class Metrics:
+    # TaskStats by task or job name. begin()/end() bracket a run on the
+    # calling thread, runs nest (a job inside the sim800 task) and waited()
+    # charges lock wait to every run open on the thread
+    def __init__(self):
+        self.stats = {}
+        self.active = {}
+        self._lock = _thread.allocate_lock()
+    
+    def begin(self, name):
+        ident = _thread.get_ident()
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = TaskStats()
+            stats.outer = self.active.get(ident)
+            self.active[ident] = stats
+        stats.waited = 0
+        stats.free = gc.mem_free()
+        stats.start = ticks_ms()
+        return stats
+    
+    def end(self, stats):
+        ms = ticks_diff(ticks_ms(), stats.start)
+        mem = stats.free - gc.mem_free()
+        with self._lock:
+            ident = _thread.get_ident()
+            if stats.outer is None:
+                self.active.pop(ident, None)
+            else:
+                self.active[ident] = stats.outer
+            stats.outer = None
+        stats.ring[stats.count % stats.size] = ms
+        stats.count += 1
+        stats.last = ms
+        if ms > stats.max:
+            stats.max = ms
+        stats.wait = stats.waited
+        if stats.waited > stats.wait_max:
+            stats.wait_max = stats.waited
+        stats.mem = mem
+        if mem > stats.mem_max:
+            stats.mem_max = mem
+    
+    def waited(self, ms):
+        stats = self.active.get(_thread.get_ident())
+        while stats is not None:
+            stats.waited += ms
+            stats = stats.outer
+    
+    def report(self, scheduler, buses=()):
+        tasks = {}
+        for name, stats in self.stats.items():
+            tasks[name] = stats.as_dict()
+        for task in scheduler.tasks.values():
+            d = tasks.setdefault(task.name, {})
+            d['missed'] = task.missed
+            d['max_late'] = task.max_late
+        return {'uptime': scheduler.now() // 1000, 'mem_free': gc.mem_free(),
+                'mem_alloc': gc.mem_alloc(), 'tasks': tasks,
+                'buses': {bus.name: bus.report() for bus in buses}}
+    
+    def summary(self, n=6):
+        # the n slowest by max duration, for the info tab
+        names = sorted(self.stats, key=lambda name: self.stats[name].max, reverse=True)
+        text = f'heap free: {gc.mem_free() // 1024} kB\nlast/p95/max ms:'
+        for name in names[:n]:
+            stats = self.stats[name]
+            text += f'\n{name}: {stats.last}/{stats.p95()}/{stats.max}'
+        return text
+
+metrics = Metrics()
+
+class Bus:
+    # arbitrates a bus shared by several threads. acquire() queues fifo
+    # behind the owner and release() hands the bus straight to the oldest
+    # waiter. _thread locks take no timeout on micropython, so a waiter polls
+    # its own gate every _bus_poll ms and leaves the queue after `timeout` ms.
+    # per owner: [acquires, timeouts, wait ms, max wait, hold ms, max hold]
+    def __init__(self, name):
+        self.name = name
+        self.owner = None
+        self.since = 0
+        self.waiters = []
+        self.stats = {}
+        self._lock = _thread.allocate_lock()
+    
+    def _stat(self, owner):
+        stat = self.stats.get(owner)
+        if stat is None:
+            stat = self.stats[owner] = [0, 0, 0, 0, 0, 0]
+        return stat
+    
+    def acquire(self, owner, timeout=_bus_timeout):
+        start = ticks_ms()
+        gate = None
+        with self._lock:
+            if self.owner is None:
+                self.owner = owner
+                self.since = start
+            else:
+                gate = [False]
+                self.waiters.append((gate, owner))
+        while gate is not None and not gate[0]:
+            if ticks_diff(ticks_ms(), start) >= timeout:
+                with self._lock:
+                    if not gate[0]:
+                        for i in range(len(self.waiters)):
+                            if self.waiters[i][0] is gate:
+                                del self.waiters[i]
+                                break
+                        self._stat(owner)[1] += 1
+                        log.warn('%s bus: %s timed out behind %s', self.name, owner, self.owner)
+                        return False
+                break
+            sleep_ms(_bus_poll)
+        waited = ticks_diff(ticks_ms(), start)
+        with self._lock:
+            stat = self._stat(owner)
+            stat[0] += 1
+            stat[2] += waited
+            if waited > stat[3]:
+                stat[3] = waited
+        metrics.waited(waited)
+        return True
+    
+    def release(self):
+        now = ticks_ms()
+        with self._lock:
+            stat = self._stat(self.owner)
+            held = ticks_diff(now, self.since)
+            stat[4] += held
+            if held > stat[5]:
+                stat[5] = held
+            if self.waiters:
+                gate, self.owner = self.waiters.pop(0)
+                self.since = now
+                gate[0] = True
+            else:
+                self.owner = None
+    
+    def report(self):
+        owners = {}
+        for owner, stat in self.stats.items():
+            owners[owner] = {'count': stat[0], 'timeouts': stat[1], 'wait': stat[2], 'wait_max': stat[3],
+                             'hold': stat[4], 'hold_max': stat[5]}
+        return {'owner': self.owner, 'waiters': len(self.waiters), 'owners': owners}
+
+class UartChannels:
+    # owns UART1, shared by the sim800 and the rs485 transceiver. every
+    # endpoint keeps its full uart.init() settings; open() takes the uart bus
+    # and reinitializes only when the endpoint changes, parking the old pins
+    # high (idle) and draining what the switch glitched into the rx buffer
+    def __init__(self, uart, endpoints):
+        self.uart = uart
+        self.endpoints = endpoints
+        self.bus = Bus('uart')
+        self.current = None
+        self.switches = 0
+        self.skips = 0
+        self.switch_ms = 0
+        self.switch_max = 0
+    
+    def configure(self, name, **settings):
+        self.endpoints[name].update(settings)
+        if name == self.current:
+            self.current = None
+    
+    def _select(self, name):
+        if name == self.current:
+            self.skips += 1
+            return
+        start = ticks_ms()
+        if self.current is not None:
+            old = self.endpoints[self.current]
+            machine.Pin(old['tx'], machine.Pin.OUT, value=1)
+            machine.Pin(old['rx'], machine.Pin.OUT, value=1)
+        self.uart.init(**self.endpoints[name])
+        while self.uart.any():
+            self.uart.read()
+        self.current = name
+        ms = ticks_diff(ticks_ms(), start)
+        self.switches += 1
+        self.switch_ms += ms
+        if ms > self.switch_max:
+            self.switch_max = ms
+        log.debug('uart switched to %s in %s ms', name, ms)
+    
+    def open(self, name, owner, timeout=_bus_timeout):
+        if not self.bus.acquire(owner, timeout):
+            return False
+        try:
+            self._select(name)
+        except:
+            self.bus.release()
+            raise
+        return True
+    
+    def close(self):
+        self.bus.release()
+    
+    def report(self):
+        return {'current': self.current, 'switches': self.switches, 'skips': self.skips,
+                'switch_ms': self.switch_ms, 'switch_max': self.switch_max}
+
+class WorkerPool:
+    # a fixed set of long lived threads fed from a bounded fifo instead of a
+    # thread per run. submit() refuses a key that is still queued or running
+    # and anything past `depth` queued runs, so an overrunning task is
+    # skipped rather than stacked up. idle workers block on `_ready`, which
+    # is released (signalled) while there is queued work
+    def __init__(self, workers=_pool_workers, depth=_pool_depth):
+        self.queue = []
+        self.keys = set()
+        self.depth = depth
+        self.workers = workers
+        self.active = 0
+        self.submitted = 0
+        self.overlaps = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._lock = _thread.allocate_lock()
+        self._ready = _thread.allocate_lock()
+        self._ready.acquire()
+        for _ in range(workers):
+            _thread.start_new_thread(self._work, ())
+    
+    def submit(self, key, func, args=()):
+        with self._lock:
+            if key in self.keys:
+                self.overlaps += 1
+                return False
+            if len(self.queue) >= self.depth:
+                self.rejected += 1
+                return False
+            self.queue.append((key, func, args))
+            self.keys.add(key)
+            self.submitted += 1
+            if len(self.queue) > self.max_depth:
+                self.max_depth = len(self.queue)
+            if self._ready.locked():
+                self._ready.release()
+        return True
+    
+    def _work(self):
+        while True:
+            self._ready.acquire()
+            key = None
+            try:
+                with self._lock:
+                    if not self.queue:
+                        continue
+                    key, func, args = self.queue.pop(0)
+                    # submit() may have signalled since this worker woke
+                    if self.queue and self._ready.locked():
+                        self._ready.release()
+                    self.active += 1
+                func(*args)
+            except Exception as e:
+                log.error(f"Exception from {key} on the worker pool:")
+                log.exc(e)
+            finally:
+                if key is not None:
+                    with self._lock:
+                        self.active -= 1
+                        self.keys.discard(key)
+    
+    def report(self):
+        return {'workers': self.workers, 'active': self.active, 'depth': len(self.queue),
+                'max_depth': self.max_depth, 'submitted': self.submitted,
+                'overlaps': self.overlaps, 'rejected': self.rejected}
+
+class Task:
+    def __init__(self, name, func, period, phase=0, threaded=False, args=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.period = period * 1000
+        self.phase = phase * 1000
+        self.threaded = threaded
+        self.due = 0
+        self.seq = -1
+        self.running = False
+        self.runs = 0
+        self.missed = 0
+        self.max_late = 0
+
+    def run(self):
+        self.running = True
+        stats = metrics.begin(self.name)
+        try:
+            self.func(*self.args)
+        except Exception as e:
+            log.error(f"Exception from {self.name} task:")
+            log.exc(e)
+        finally:
+            metrics.end(stats)
+            self.running = False
+
+    def __repr__(self):
+        return self.name
+
+class Scheduler:
+    # deadlines are kept on a private monotonic ms clock so rtc changes
+    # (get_time, location sms) and ticks_ms wraparound don't move them
+    def __init__(self, pool):
+        self.pool = pool
+        self.tasks = {}
+        self._heap = []
+        self._seq = 0
+        self._lock = _thread.allocate_lock()
+        self._ticks = ticks_ms()
+        self._now = 0
+
+    def _clock(self):
+        t = ticks_ms()
+        self._now += ticks_diff(t, self._ticks)
+        self._ticks = t
+        return self._now
+
+    def now(self):
+        with self._lock:
+            return self._clock()
+
+    def _push(self, task, due):
+        task.due = due
+        task.seq = self._seq
+        self._seq += 1
+        heapq.heappush(self._heap, (due, task.seq, task))
+
+    def add(self, name, func, period, phase=0, threaded=False, args=()):
+        task = Task(name, func, period, phase, threaded, args)
+        with self._lock:
+            self.tasks[name] = task
+            self._push(task, self._clock() + task.phase)
+        return task
+
+    def trigger(self, name, delay=0):
+        task = self.tasks.get(name)
+        if task is None:
+            return
+        with self._lock:
+            self._push(task, self._clock() + delay * 1000)
+
+    def run_pending(self):
+        with self._lock:
+            now = self._clock()
+            ready = []
+            while self._heap and self._heap[0][0] <= now:
+                due, seq, task = heapq.heappop(self._heap)
+                if seq != task.seq:
+                    continue
+                late = now - due
+                if task.period:
+                    skipped = late // task.period
+                    task.missed += skipped
+                    self._push(task, due + (skipped + 1) * task.period)
+                if task.running:
+                    task.missed += 1
+                    continue
+                if late > task.max_late:
+                    task.max_late = late
+                task.runs += 1
+                ready.append(task)
+        for task in ready:
+            feed_wdt()
+            if task.threaded:
+                task.running = True
+                if not self.pool.submit(task.name, task.run):
+                    task.running = False
+                    task.missed += 1
+                    log.warn(f'worker pool full, {task.name} skipped')
+            else:
+                task.run()
+
+    def idle(self):
+        with self._lock:
+            wait = self._heap[0][0] - self._clock() if self._heap else _sched_max_sleep
+        if wait > 0:
+            sleep_ms(min(wait, _sched_max_sleep))
+
+class GprsSession:
+    # keeps the bearer attached across back to back http jobs; closed by the
+    # gprs_idle task once nothing used it for _gprs_idle_timeout
+    def __init__(self, modem, clock):
+        self.modem = modem
+        self.clock = clock
+        self.apn = None
+        self.is_open = False
+        self.last_used = 0
+        self.requests = 0
+        self.attaches = 0
+        self.resets = 0
+
+    def connect(self, apn):
+        self.requests += 1
+        if self.is_open and apn == self.apn:
+            self.last_used = self.clock()
+            return
+        self.close()
+        self.modem.connect(apn)
+        self.apn = apn
+        self.is_open = True
+        self.attaches += 1
+        self.last_used = self.clock()
+
+    def release(self):
+        self.last_used = self.clock()
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            try:
+                self.modem.disconnect()
+            except Exception as e:
+                log.error("Exception from gprs disconnect:")
+                log.exc(e)
+
+    def invalidate(self):
+        # the modem was re-initialized and took the bearer down with it
+        if self.is_open:
+            self.is_open = False
+            self.resets += 1
+
+    def idle(self):
+        return self.clock() - self.last_used if self.is_open else 0
+
+    def saved(self):
+        return self.requests - self.attaches
+
+    def report(self):
+        return {'open': self.is_open, 'requests': self.requests, 'attaches': self.attaches,
+                'saved': self.saved(), 'resets': self.resets}
+
+class Outbox:
+    # encrypted records waiting for upload, one file per record named by a
+    # running sequence number so the oldest is always the lowest name
+    def __init__(self, path, max_records):
+        self.path = path
+        self.max_records = max_records
+        self.dropped = 0
+        try:
+            names = os.listdir(path)
+        except OSError:
+            os.mkdir(path)
+            names = []
+        seqs = [int(name) for name in names if name.isdigit()]
+        self.head = min(seqs) if seqs else 0
+        self.tail = max(seqs) + 1 if seqs else 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def _name(self, seq):
+        return f'{self.path}/{seq:08d}'
+
+    def put(self, record):
+        with open(self._name(self.tail), 'wb') as f:
+            f.write(record)
+        self.tail += 1
+        while len(self) > self.max_records:
+            self.ack(1)
+            self.dropped += 1
+
+    def paths(self, n):
+        return [self._name(seq) for seq in range(self.head, min(self.head + n, self.tail))]
+
+    def ack(self, n):
+        for _ in range(min(n, len(self))):
+            try:
+                os.remove(self._name(self.head))
+            except OSError:
+                pass
+            self.head += 1
+        if not len(self):
+            self.head = self.tail = 0
+
+class CompactPayload:
+    # format 2 post payload, positional over config['sensor_list']:
+    #   <BBIIB  version, flags, schema (crc32 of the joined names), ts, columns
+    #   bitmap  one bit per column, set when the sensor is enabled (and in a
+    #           delta post, when DeltaFilter picked it)
+    #   bitmap  with flag bit 6 only: one bit per wide column (a 32 bit
+    #           integer modbus point), packed <qfB with its exact raw value
+    #   <ffB    raw, scaled (nan when not connected), warning (255 for
+    #           none) per set column
+    # then by flag bit: 0 bat <f, 1 location <ff, 2 sd_warning <B,
+    # 3 rain intensity/peak <ff, 4 firmware version <f (first post only);
+    # flag bit 5 marks a delta post.
+    # a json payload starts with '{', so the first byte tells the two apart.
+    # the device id is not in the payload but in the form body (FormBody);
+    # tools/decode_payload.py is the reference decoder
+    version = 2
+    
+    def __init__(self, columns, wide=()):
+        self.columns = columns
+        self.schema = ubinascii.crc32(','.join(columns).encode())
+        self.nmap = (len(columns) + 7) // 8
+        self.wide = bytearray(self.nmap)
+        for j, name in enumerate(columns):
+            if name in wide:
+                self.wide[j >> 3] |= 1 << (j & 7)
+        self.wmap = self.nmap if any(self.wide) else 0
+        self.buf = bytearray(11 + self.nmap + self.wmap + 13 * len(columns) + 29)
+        self.mv = memoryview(self.buf)
+        self.version_sent = False
+    
+    def pack(self, ts, readings, data, mask=None):
+        buf = self.buf
+        ofs = 11 + self.nmap
+        for j in range(self.nmap):
+            buf[11 + j] = 0
+        if self.wmap:
+            buf[ofs:ofs + self.wmap] = self.wide
+            ofs += self.wmap
+        for j, name in enumerate(self.columns):
+            i = readings.index.get(name)
+            if i is None or (mask is not None and not mask[i]):
+                continue
+            bit = 1 << (j & 7)
+            buf[11 + (j >> 3)] |= bit
+            if self.wide[j >> 3] & bit:
+                struct.pack_into('<qfB', buf, ofs, readings.ints[i], readings.scaled[i], readings.warning[i])
+                ofs += 13
+            else:
+                struct.pack_into('<ffB', buf, ofs, readings.raw[i], readings.scaled[i], readings.warning[i])
+                ofs += 9
+        flags = 32 if mask is not None else 0
+        if self.wmap:
+            flags |= 64
+        if data.get('bat') is not None:
+            flags |= 1
+            struct.pack_into('<f', buf, ofs, data['bat'])
+            ofs += 4
+        loc = data.get('location')
+        if loc and loc.get('lat') is not None:
+            # lat/lon come from the server or an sms, one that does not
+            # parse is left out rather than failing the post
+            try:
+                struct.pack_into('<ff', buf, ofs, float(loc['lat']), float(loc['lon']))
+                flags |= 2
+                ofs += 8
+            except (KeyError, TypeError, ValueError):
+                log.warn(f'bad location {loc} left out')
+        if 'sd_warning' in data:
+            flags |= 4
+            buf[ofs] = data['sd_warning']
+            ofs += 1
+        if 'ra_int' in data:
+            flags |= 8
+            struct.pack_into('<ff', buf, ofs, data['ra_int'], data['ra_int_max'])
+            ofs += 8
+        if not self.version_sent:
+            flags |= 16
+            struct.pack_into('<f', buf, ofs, data['firmware_version'])
+            ofs += 4
+            self.version_sent = True
+        struct.pack_into('<BBIIB', buf, 0, self.version, flags, self.schema, ts, len(self.columns))
+        return self.mv[:ofs]
+
+class PayloadSealer(io.IOBase):
+    # json.dump target (an io.IOBase so the port treats it as a stream):
+    # text is copied into one reused buffer behind a 16 byte iv and aes-cbc
+    # encrypted in place every _seal_chunk bytes; close() adds the pkcs7
+    # padding mpyaes used and returns a view of iv + ciphertext, valid until
+    # the next open()
+    def __init__(self, key, size):
+        self.key = key
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.aes = None
+        self.pos = 16
+        self.done = 16
+    
+    def open(self):
+        iv = mpyaes.generate_IV(16)
+        self.mv[0:16] = iv
+        self.aes = aes(self.key, 2, iv)
+        self.pos = self.done = 16
+        return self
+    
+    def _reserve(self, n):
+        if self.pos + n > len(self.buf):
+            buf = bytearray(max(2 * len(self.buf), self.pos + n))
+            buf[:self.pos] = self.mv[:self.pos]
+            log.info(f'payload buffer grown to {len(buf)} bytes')
+            self.buf = buf
+            self.mv = memoryview(buf)
+    
+    def _seal(self, end):
+        n = (end - self.done) & ~15
+        if n:
+            chunk = self.mv[self.done:self.done + n]
+            self.aes.encrypt(chunk, chunk)
+            self.done += n
+    
+    def write(self, s):
+        if isinstance(s, str):
+            s = s.encode()
+        n = len(s)
+        self._reserve(n + 16)
+        self.mv[self.pos:self.pos + n] = s
+        self.pos += n
+        if self.pos - self.done >= _seal_chunk:
+            self._seal(self.pos)
+        return n
+    
+    def close(self):
+        if self.aes is None:
+            return self.mv[:self.pos]
+        pad = 16 - (self.pos - 16) % 16
+        self._reserve(pad)
+        for i in range(self.pos, self.pos + pad):
+            self.buf[i] = pad
+        self.pos += pad
+        self._seal(self.pos)
+        self.aes = None
+        return self.mv[:self.pos]
+
+class FormBody:
+    # <prefix>data=<hex>,<hex>,... for a batch of outbox files, or with b64
+    # <prefix>enc=b64&data=<b64>,... in url safe base64, assembled in one
+    # buffer that only grows; files are encoded a chunk at a time so no
+    # record is held whole besides its encoding in the body
+    def __init__(self, size):
+        self.buf = bytearray(size)
+        self.chunk = bytearray(max(_hex_chunk, _b64_chunk))
+    
+    def build(self, paths, b64=False, prefix=b''):
+        prefix += b'enc=b64&data=' if b64 else b'data='
+        step = _b64_chunk if b64 else _hex_chunk
+        sizes = []
+        total = len(prefix) + len(paths) - 1
+        for path in paths:
+            try:
+                size = os.stat(path)[6]
+            except OSError:
+                size = 0
+            sizes.append(size)
+            total += 4 * ((size + 2) // 3) if b64 else 2 * size
+        if total > len(self.buf):
+            self.buf = bytearray(total)
+        buf = self.buf
+        mv = memoryview(buf)
+        chunk = memoryview(self.chunk)[:step]
+        mv[0:len(prefix)] = prefix
+        pos = len(prefix)
+        for i, path in enumerate(paths):
+            if i:
+                buf[pos] = 44 # ','
+                pos += 1
+            if not sizes[i]:
+                continue
+            start = pos
+            with open(path, 'rb') as f:
+                while True:
+                    n = f.readinto(chunk)
+                    if not n:
+                        break
+                    if b64:
+                        enc = ubinascii.b2a_base64(chunk[:n])
+                        k = len(enc) - 1 # trailing newline
+                        mv[pos:pos + k] = enc[:k]
+                    else:
+                        k = 2 * n
+                        mv[pos:pos + k] = ubinascii.hexlify(chunk[:n])
+                    pos += k
+            if b64:
+                for j in range(start, pos):
+                    if buf[j] == 43:   # '+'
+                        buf[j] = 45    # '-'
+                    elif buf[j] == 47: # '/'
+                        buf[j] = 95    # '_'
+        return mv[:pos]
+
+def post_sizes(payload, batch, b64):
+    # sealer and form body sizes for `batch` records of a `payload` byte
+    # plaintext: iv + pkcs7 padded ciphertext, then hex or base64 plus commas
+    record = 16 + (payload // 16 + 1) * 16
+    enc = 4 * ((record + 2) // 3) if b64 else 2 * record
+    return record, _form_prefix + batch * (enc + 1)
+
+class LogFormat:
+    # day files under /sd/data: a header (magic, version, column count,
+    # header size, record size, schema id) followed by one (name, a, b)
+    # entry per sensor_list column, then fixed size records of a u32
+    # timestamp and one f32 raw value per column (nan when missing), so
+    # record n of a day starts at header size + n * record size.
+    # scaled values are a * raw + b from the header; tools/export_log.py
+    # turns a day file back into the raw and scaled csv layout.
+    # with wide columns (32 bit integer modbus points) the file is version
+    # 2: a bitmap of them follows the entries and each takes an i64 in the
+    # record, `missing` when not read
+    magic = b'RTUL'
+    missing = -0x8000000000000000
+
+    def __init__(self, columns, scales, wide=()):
+        self.columns = columns
+        self.wide = [name in wide for name in columns]
+        self.offsets = []
+        ofs = 4
+        for w in self.wide:
+            self.offsets.append(ofs)
+            ofs += 8 if w else 4
+        self.size = ofs
+        nmap = (len(columns) + 7) // 8 if any(self.wide) else 0
+        cols = bytearray(16 * len(columns) + nmap)
+        for i, name in enumerate(columns):
+            a, b = scales[i]
+            struct.pack_into('<8sff', cols, i * 16, name.encode(), a, b)
+            if nmap and self.wide[i]:
+                cols[16 * len(columns) + (i >> 3)] |= 1 << (i & 7)
+        self.version = 2 if nmap else 1
+        self.schema = ubinascii.crc32(cols)
+        self.header = struct.pack('<4sBBHHI', self.magic, self.version, len(columns),
+                                  14 + len(cols), self.size, self.schema) + cols
+        self.record = bytearray(self.size)
+        self.nan = float('nan')
+
+    def pack(self, ts, values):
+        struct.pack_into('<I', self.record, 0, ts)
+        for i, value in enumerate(values):
+            if self.wide[i]:
+                struct.pack_into('<q', self.record, self.offsets[i], self.missing if value is None else value)
+            else:
+                struct.pack_into('<f', self.record, self.offsets[i], self.nan if value is None else value)
+        return self.record
+
+class LogWriter:
+    # buffers packed records in ram and keeps the day file open between
+    # flushes; a new day only closes the old file and opens the next one.
+    # while flushes fail (sd gone, bus busy) a full buffer drops its oldest
+    # record for each new one and counts it in `dropped`. add() runs on the
+    # log task's worker and flush() on the main loop, the writer's own lock
+    # covers the buffer and a flush's write-and-reset
+    def __init__(self, fmt, directory, max_records, max_age, clock):
+        self.fmt = fmt
+        self.directory = directory
+        self.max_records = max_records
+        self.max_age = max_age * 1000
+        self.clock = clock
+        self.buf = bytearray(fmt.size * max_records)
+        self.mv = memoryview(self.buf)
+        self.count = 0
+        self.first = 0
+        self.buf_day = None
+        self.file = None
+        self.file_day = None
+        self.writes = 0
+        self.dropped = 0
+        self.lost = 0
+        self._lock = _thread.allocate_lock()
+
+    def pending(self, day):
+        return self.count and day != self.buf_day
+
+    def due(self):
+        return self.count and (self.count >= self.max_records or self.clock() - self.first >= self.max_age)
+
+    def add(self, day, ts, values):
+        with self._lock:
+            if not self.count:
+                self.first = self.clock()
+                self.buf_day = day
+            size = self.fmt.size
+            if self.count >= self.max_records:
+                self.buf[:len(self.buf) - size] = self.buf[size:]
+                self.count = self.max_records - 1
+                self.dropped += 1
+                self.lost += 1
+            ofs = self.count * size
+            self.mv[ofs:ofs + size] = self.fmt.pack(ts, values)
+            self.count += 1
+
+    def _open(self, day):
+        self.close_file()
+        filename = f'{self.directory}/{day[0]}-{day[1]:02d}-{day[2]:02d}.bin'
+        try:
+            with open(filename, 'rb') as f:
+                if f.read(len(self.fmt.header)) != self.fmt.header:
+                    filename = f'{filename[:-4]}_{self.fmt.schema:08x}.bin'
+        except OSError:
+            pass
+        self.file = open(filename, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(self.fmt.header)
+        self.file_day = day
+
+    def flush(self):
+        with self._lock:
+            if not self.count:
+                return
+            try:
+                if self.file is None or self.file_day != self.buf_day:
+                    self._open(self.buf_day)
+                self.file.write(self.mv[:self.count * self.fmt.size])
+                self.file.flush()
+                self.writes += 1
+                self.count = 0
+                if self.lost:
+                    log.warn(f'log buffer was full, {self.lost} oldest records dropped')
+                    self.lost = 0
+            except:
+                self.close_file()
+                raise
+
+    def close_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+            self.file_day = None
+
+class AlarmEngine:
+    # thresholds parsed once per sensor, one row each:
+    # [high, low, hyst, state, candidate, count, last_sent, notified, pending]
+    # pending is the state whose sms is not delivered yet; it stays set
+    # until delivered() so a failed send is queued again by undelivered()
+    def __init__(self, sensors, debounce, cooldown, clock, notify):
+        self.debounce = max(1, debounce)
+        self.cooldown = cooldown * 1000
+        self.clock = clock
+        self.notify = notify
+        self.rows = {}
+        self.raised = 0
+        self.cleared = 0
+        self.suppressed = 0
+        for name, cfg in sensors.items():
+            high = cfg.get('high_th')
+            low = cfg.get('low_th')
+            high = None if high in (None, '') else float(high)
+            low = None if low in (None, '') else float(low)
+            if high is None and low is None:
+                continue
+            self.rows[name] = [high, low, abs(float(cfg.get('hyst') or 0)), _alarm_ok, _alarm_ok, 0, None, False, None]
+    
+    def state(self, name):
+        row = self.rows.get(name)
+        return _alarm_ok if row is None else row[3]
+    
+    def pending(self, name):
+        row = self.rows.get(name)
+        return None if row is None else row[8]
+    
+    def delivered(self, name, state):
+        row = self.rows.get(name)
+        if row is None or row[8] != state:
+            return
+        row[8] = None
+        row[7] = state != _alarm_ok
+    
+    def undelivered(self):
+        return [(name, row[8]) for name, row in self.rows.items() if row[8] is not None]
+    
+    def evaluate(self, name, value):
+        row = self.rows.get(name)
+        if row is None:
+            return _alarm_ok
+        high, low, hyst, state = row[0], row[1], row[2], row[3]
+        if high is not None and (value > high or (state == _alarm_high and value > high - hyst)):
+            target = _alarm_high
+        elif low is not None and (value < low or (state == _alarm_low and value < low + hyst)):
+            target = _alarm_low
+        else:
+            target = _alarm_ok
+        
+        if target == state:
+            row[5] = 0
+            return state
+        if target != row[4]:
+            row[4] = target
+            row[5] = 0
+        row[5] += 1
+        if row[5] < self.debounce:
+            return state
+        
+        row[3] = target
+        row[5] = 0
+        now = self.clock()
+        if target != _alarm_ok:
+            if row[6] is None or now - row[6] >= self.cooldown:
+                row[6] = now
+                row[8] = target
+                self.raised += 1
+                self.notify(name, target)
+            else:
+                row[7] = False
+                row[8] = None
+                self.suppressed += 1
+        elif row[7]:
+            row[7] = False
+            row[8] = _alarm_ok
+            self.cleared += 1
+            self.notify(name, _alarm_ok)
+        else:
+            # cleared before the raise went out, neither sms is due
+            row[8] = None
+        return target
+
+class Readings:
+    # one slot per enabled sensor channel: raw and scaled values in float
+    # arrays (nan until read or while not connected), warning codes in a
+    # bytearray and scaling coefficients parsed once from config. `wide`
+    # channels (32 bit integer modbus points) also keep their exact raw
+    # value in `ints`, a float only holds 24 bits of it
+    def __init__(self, names, sensors, wide=()):
+        n = len(names)
+        self.names = names
+        self.index = {}
+        for i, name in enumerate(names):
+            self.index[name] = i
+        self.a = array('f', [float(sensors[name].get('a', 1.0)) for name in names])
+        self.b = array('f', [float(sensors[name].get('b', 0.0)) for name in names])
+        self.raw = array('f', [_nan] * n)
+        self.scaled = array('f', [_nan] * n)
+        self.warning = bytearray([_warn_none] * n)
+        self.wide = bytearray([name in wide for name in names])
+        self.ints = array('q', [0] * n)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __contains__(self, name):
+        return name in self.index
+    
+    def slots(self, names):
+        return [self.index[name] for name in names]
+    
+    def is_wide(self, name):
+        i = self.index.get(name)
+        return i is not None and self.wide[i] == 1
+    
+    def put(self, i, raw):
+        scaled = round(self.a[i] * raw + self.b[i], 2)
+        if self.wide[i]:
+            self.ints[i] = raw
+        self.raw[i] = raw
+        self.scaled[i] = scaled
+        return scaled
+    
+    def lost(self, i):
+        self.raw[i] = _nan
+        self.scaled[i] = _nan
+        self.warning[i] = _warn_nc
+    
+    def get_raw(self, name):
+        i = self.index.get(name)
+        if i is None or self.raw[i] != self.raw[i]:
+            return None
+        return self.ints[i] if self.wide[i] else self.raw[i]
+    
+    def get_scaled(self, name):
+        i = self.index.get(name)
+        if i is None or self.scaled[i] != self.scaled[i]:
+            return None
+        return self.scaled[i]
+    
+    def export(self, d, mask=None):
+        for i, name in enumerate(self.names):
+            if mask is not None and not mask[i]:
+                continue
+            raw = self.raw[i]
+            scaled = self.scaled[i]
+            warning = self.warning[i]
+            if self.wide[i] and raw == raw:
+                raw = self.ints[i]
+            d[name] = {'raw': None if raw != raw else round(raw, 2),
+                       'scaled': None if scaled != scaled else round(scaled, 2),
+                       'warning': None if warning == _warn_none else warning}
+        return d
+
+class DeltaFilter:
+    # delta mode of post_data: picks the readings whose scaled value moved by
+    # more than the sensor's 'deadband' (or whose warning changed) since it
+    # last went up. every keyframe-th post, the first after boot and the
+    # first after the outbox dropped records carry everything. the outbox
+    # delivers in order and only drops by overflow, so the last queued
+    # values are the server's picture once the backlog is acked. a wide
+    # reading without a deadband also goes up when its exact integer moved
+    # by less than the float can show
+    def __init__(self, readings, sensors, keyframe=_delta_keyframe):
+        n = len(readings)
+        self.band = array('f', [float(sensors[name].get('deadband') or 0) for name in readings.names])
+        self.sent = array('f', [_nan] * n)
+        self.sent_ints = array('q', [0] * n)
+        self.sent_warning = bytearray([_warn_none] * n)
+        self.mask = bytearray(n)
+        self.keyframe = keyframe
+        self.count = keyframe
+        self.dropped = 0
+    
+    def select(self, readings, dropped=0):
+        key = self.count >= self.keyframe or dropped != self.dropped
+        self.dropped = dropped
+        self.count = 1 if key else self.count + 1
+        sent = self.sent
+        for i in range(len(self.mask)):
+            scaled = readings.scaled[i]
+            warning = readings.warning[i]
+            last = sent[i]
+            if key or warning != self.sent_warning[i] or (scaled != scaled) != (last != last):
+                changed = True
+            else:
+                changed = scaled == scaled and abs(scaled - last) > self.band[i]
+                if not changed and scaled == scaled and readings.wide[i] and not self.band[i]:
+                    changed = readings.ints[i] != self.sent_ints[i]
+            self.mask[i] = changed
+            if changed:
+                sent[i] = scaled
+                self.sent_ints[i] = readings.ints[i]
+                self.sent_warning[i] = warning
+        return key
+
+class SensorDriver:
+    # a source of one or more sensor channels, read() returns one raw value
+    # per channel and None for a channel that did not answer, or None as a
+    # whole while a reading is still under way
+    name = 'sensor'
+    th = None
+    wide = ()
+    def __init__(self, channels):
+        self.channels = channels
+        self.slots = None
+    
+    def read(self):
+        return [None] * len(self.channels)
+
+def sdi_crc(line):
+    # the three character crc the sensor appends to an aCC! data line
+    crc = 0
+    for c in line:
+        crc ^= ord(c)
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+    return chr(0x40 | crc >> 12) + chr(0x40 | (crc >> 6) & 0x3f) + chr(0x40 | crc & 0x3f)
+
+def sdi_values(body):
+    # '+1.5-0.25+3' -> [1.5, -0.25, 3.0]
+    values = []
+    start = None
+    for i, c in enumerate(body):
+        if c in '+-':
+            if start is not None:
+                values.append(float(body[start:i]))
+            start = i
+    if start is not None:
+        values.append(float(body[start:]))
+    return values
+
+class SdiProbe:
+    # one sdi-12 address. `due` is the scheduler ms its concurrent
+    # measurement is ready, None while idle; `ident` (the aI! answer) and
+    # `count` (values advertised by aCC!) are cached in flash, `checked`
+    # once aI! confirmed the cached ident since boot or since the probe
+    # last went silent
+    def __init__(self, addr, ident='', count=0):
+        self.addr = addr
+        self.due = None
+        self.ident = ident
+        self.count = count
+        self.checked = False
+        self.values = []
+        self.page = 0
+        self.tries = 0
+        self.fails = 0
+        self.wait = 0
+        self.cycles = 0
+        self.errors = 0
+        self.skipped = 0
+    
+    def report(self):
+        return {'id': self.ident, 'count': self.count, 'cycles': self.cycles,
+                'errors': self.errors, 'skipped': self.skipped, 'fails': self.fails}
+
+class SdiDriver(SensorDriver):
+    # concurrent measurements on every address instead of one blocking aM!.
+    # a cycle sends aCC! to each probe (cheap, the answer only advertises
+    # ttt seconds and the value count) and returns; the one shot sdi12_read
+    # task is triggered for the earliest due probe and collect()s it with
+    # aD0!, aD1! .. so nothing waits out a measurement. read() returns None
+    # until every probe is collected or has failed. a probe failing a cycle
+    # is skipped for 1, 2, 4 .. up to _sdi12_backoff cycles. sdi_lock is
+    # held per command only.
+    # `points` maps each channel to (addr, value index), from sdi12.map or
+    # else positionally over the probes in address order, each taking the
+    # slots it advertised. idents and counts come from _sdi12_cache; aI!
+    # is sent once per boot (and after a probe was silent) and the cache is
+    # only rewritten when an ident or count changes
+    name = 'sdi12'
+    th = 'sdi_th'
+    def __init__(self, app, channels, addrs, points=None):
+        super().__init__(channels)
+        self.app = app
+        cache = {}
+        try:
+            with open(_sdi12_cache) as f:
+                cache = json.load(f)
+        except:
+            pass
+        self.probes = [SdiProbe(a, *cache.get(a, ('', 0))) for a in addrs]
+        self.points = None
+        if points:
+            self.points = [points.get(ch) for ch in channels]
+        self.idx = [int(ch[1:]) - 1 for ch in channels]
+        self.busy = False
+    
+    def read(self):
+        if not self.busy:
+            self._start(self.app.scheduler.now())
+        return self.collect()
+    
+    def collect(self):
+        if not self.busy:
+            return None
+        now = self.app.scheduler.now()
+        self._collect(now)
+        due = [p.due for p in self.probes if p.due is not None]
+        if due:
+            self.app.scheduler.trigger('sdi12_read', max(0, min(due) - now) / 1000)
+            return None
+        self.busy = False
+        values = [self.value(addr, i) for addr, i in self.mapping()]
+        log.debug('sdi12: %s', values)
+        return values
+    
+    def mapping(self):
+        if self.points is not None:
+            return [(None, None) if pt is None else (pt[0], int(pt[1])) for pt in self.points]
+        where = []
+        for p in self.probes:
+            where.extend((p.addr, i) for i in range(p.count))
+        return [where[i] if i < len(where) else (None, None) for i in self.idx]
+    
+    def value(self, addr, i):
+        for p in self.probes:
+            if p.addr == addr:
+                return p.values[i] if i < len(p.values) else None
+        return None
+    
+    def known(self):
+        return {p.addr: {'id': p.ident, 'count': p.count} for p in self.probes if p.ident}
+    
+    def _save(self):
+        try:
+            with open(_sdi12_cache, 'w') as f:
+                json.dump({p.addr: (p.ident, p.count) for p in self.probes if p.ident}, f)
+        except:
+            log.warn("Failed to save sdi12 cache on flash")
+    
+    def _identify(self, p):
+        # before aCC!: any command to the address aborts its measurement
+        r = self._command(p.addr + 'I!')
+        if len(r) < 2 or r[0] != p.addr:
+            return
+        p.checked = True
+        if r[1:] != p.ident:
+            log.info(f'sdi12 {p.addr}: {r[1:]}' + (f', was {p.ident}' if p.ident else ''))
+            p.ident = r[1:]
+            self._save()
+    
+    def _command(self, cmd):
+        t = ticks_ms()
+        sdi_lock.acquire()
+        metrics.waited(ticks_diff(ticks_ms(), t))
+        try:
+            feed_wdt()
+            return (sdi12.send(cmd) or '').strip()
+        except Exception as e:
+            log.debug('sdi12 %s: %s', cmd, e)
+            return ''
+        finally:
+            sdi_lock.release()
+    
+    def _start(self, now):
+        self.busy = True
+        for p in self.probes:
+            p.values = []
+            if p.wait:
+                p.wait -= 1
+                p.skipped += 1
+                continue
+            p.cycles += 1
+            if not p.checked:
+                self._identify(p)
+            r = self._command(p.addr + 'CC!')
+            # atttnn: ready in ttt s with nn values
+            if len(r) == 6 and r[0] == p.addr and r[1:].isdigit() and int(r[4:]):
+                p.due = now + int(r[1:4]) * 1000
+                if int(r[4:]) != p.count:
+                    log.info(f'sdi12 {p.addr}: {int(r[4:])} values, was {p.count}')
+                    p.count = int(r[4:])
+                    # a different count may be a different probe
+                    p.checked = False
+                    self._save()
+                p.page = 0
+                p.tries = 0
+            else:
+                self._failed(p, r)
+    
+    def _collect(self, now):
+        for p in self.probes:
+            if p.due is None or p.due > now:
+                continue
+            while len(p.values) < p.count and p.page < 10:
+                r = self._command(f'{p.addr}D{p.page}!')
+                ok = len(r) > 3 and r[0] == p.addr and sdi_crc(r[:-3]) == r[-3:]
+                values = sdi_values(r[1:-3]) if ok else None
+                if values:
+                    p.values.extend(values)
+                    p.page += 1
+                    continue
+                p.tries += 1
+                if p.tries > _sdi12_retries:
+                    break
+                if ok:
+                    # no values yet, ttt was optimistic
+                    p.due = now + 1000
+                    break
+            if p.due > now:
+                continue
+            p.due = None
+            if len(p.values) >= p.count:
+                p.values = p.values[:p.count]
+                p.fails = 0
+            else:
+                self._failed(p, r)
+    
+    def _failed(self, p, r):
+        p.due = None
+        p.values = []
+        p.checked = False
+        p.errors += 1
+        p.fails += 1
+        p.wait = min(1 << (p.fails - 1), _sdi12_backoff)
+        log.debug('sdi12 %s failed (%s), skipped for %s cycles', p.addr, r, p.wait)
+    
+    def report(self):
+        return {p.addr: p.report() for p in self.probes}
+
+class Pt100Driver(SensorDriver):
+    name = 'pt100'
+    th = 'pt_th'
+    def __init__(self, app):
+        super().__init__(['pt'])
+        self.app = app
+    
+    def read(self):
+        app = self.app
+        tmp = None
+        if not app.spi_bus.acquire('pt100'):
+            return [tmp]
+        try:
+            spi2.init(baudrate=5000000, phase=1)
+            for _ in range(3):
+                feed_wdt()
+                try:
+                    tmp = pt.temperature
+                    if -100 < tmp < 100:
+                        break
+                except:
+                    pass
+                tmp = None
+        finally:
+            app.spi_bus.release()
+        log.debug('pt100: %s', "NC" if tmp is None else tmp)
+        return [tmp]
+
+class AdcSampler:
+    # round robin oversampling of several adcs into one preallocated
+    # array('i'), channel c owning buf[c * samples:(c + 1) * samples]. rounds
+    # stop early once `budget` ms are spent, each channel is then reduced by
+    # `filt`: 'mean', 'median' or 'trim' (mean without `trim` samples per end)
+    def __init__(self, adcs, samples=_adc_samples, filt='mean', trim=_adc_trim,
+                 gap=_adc_gap, budget=_adc_budget):
+        if filt not in ('mean', 'median', 'trim'):
+            raise ValueError(f'unknown adc filter {filt}')
+        self.adcs = adcs
+        self.samples = max(1, samples)
+        self.filt = filt
+        self.trim = trim
+        self.gap = gap
+        self.budget = budget
+        self.buf = array('i', [0] * (len(adcs) * self.samples))
+        self.values = array('f', [0.0] * len(adcs))
+        self.rounds = 0
+        self.elapsed = 0
+    
+    def acquire(self):
+        adcs = self.adcs
+        buf = self.buf
+        n = self.samples
+        start = ticks_ms()
+        rounds = 0
+        while rounds < n:
+            for c in range(len(adcs)):
+                buf[c * n + rounds] = adcs[c].read_uv()
+            rounds += 1
+            if ticks_diff(ticks_ms(), start) >= self.budget:
+                break
+            if self.gap and rounds < n:
+                sleep_ms(self.gap)
+        self.elapsed = ticks_diff(ticks_ms(), start)
+        self.rounds = rounds
+        for c in range(len(adcs)):
+            self.values[c] = self._reduce(c * n, rounds)
+        return self.values
+    
+    def _reduce(self, ofs, cnt):
+        buf = self.buf
+        if self.filt == 'mean':
+            lo, hi = ofs, ofs + cnt
+        else:
+            # insertion sort in place, cnt is a handful of samples
+            for i in range(ofs + 1, ofs + cnt):
+                v = buf[i]
+                j = i - 1
+                while j >= ofs and buf[j] > v:
+                    buf[j + 1] = buf[j]
+                    j -= 1
+                buf[j + 1] = v
+            if self.filt == 'median':
+                mid = ofs + cnt // 2
+                if cnt & 1:
+                    return buf[mid]
+                return (buf[mid - 1] + buf[mid]) / 2
+            t = self.trim if 2 * self.trim < cnt else (cnt - 1) // 2
+            lo, hi = ofs + t, ofs + cnt - t
+        tmp = 0
+        for i in range(lo, hi):
+            tmp += buf[i]
+        return tmp / (hi - lo)
+
+class AdcDriver(SensorDriver):
+    # analog and current loop inputs plus the battery, sampled together by one
+    # AdcSampler. gain converts a filtered read_uv() value to the raw value,
+    # the battery (last sampler channel) goes to App.update_bat
+    name = 'ais'
+    th = 'ai_th'
+    def __init__(self, app, channels, gains, sampler):
+        super().__init__(channels)
+        self.app = app
+        self.gains = gains
+        self.sampler = sampler
+        if not channels:
+            self.th = None
+    
+    def read(self):
+        sampler = self.sampler
+        raw = sampler.acquire()
+        values = [raw[i] * gain for i, gain in enumerate(self.gains)]
+        log.debug('ais: %s (%sx%s in %s ms)', values, sampler.rounds, len(raw), sampler.elapsed)
+        self.app.update_bat(raw[len(raw) - 1] * 0.00000475)
+        return values
+
+def modbus_value(regs, ofs, kind, order):
+    # decode the point at regs[ofs] (unsigned 16 bit words as read). order
+    # names the value's bytes as they arrive, 'abcd' being big endian with
+    # the high word first; 16 bit kinds only honour the byte swap
+    hi = regs[ofs]
+    if order[0] in 'bd':
+        hi = ((hi & 0xff) << 8) | (hi >> 8)
+    if kind == 'uint16':
+        return hi
+    if kind == 'int16':
+        return hi - 0x10000 if hi & 0x8000 else hi
+    lo = regs[ofs + 1]
+    if order[0] in 'bd':
+        lo = ((lo & 0xff) << 8) | (lo >> 8)
+    if order in ('cdab', 'dcba'):
+        hi, lo = lo, hi
+    v = (hi << 16) | lo
+    if kind == 'uint32':
+        return v
+    if kind == 'int32':
+        return v - 0x100000000 if v & 0x80000000 else v
+    return struct.unpack('>f', struct.pack('>I', v))[0]
+
+class ModbusSlave:
+    # one rs485 slave: its read blocks [fc, first, count, [(column, ofs,
+    # kind, order), ...]], its own timeout (ms per poll) and retries, and
+    # counters for the metrics. `down` counts polls in a row without an
+    # answer, `wait` the polls still to skip because of them
+    def __init__(self, addr, timeout=_modbus_timeout, retries=_modbus_retries):
+        self.addr = addr
+        self.timeout = timeout
+        self.retries = retries
+        self.blocks = []
+        self.polls = 0
+        self.requests = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped = 0
+        self.codes = {}
+        self.down = 0
+        self.wait = 0
+        self.ms = 0
+        self.ms_max = 0
+    
+    def report(self):
+        return {'polls': self.polls, 'requests': self.requests, 'timeouts': self.timeouts,
+                'errors': self.errors, 'exceptions': self.codes, 'skipped': self.skipped,
+                'down': self.down, 'ms': self.ms, 'ms_max': self.ms_max}
+
+class ModbusMap:
+    # the rs485 points of config['rs485']['map'], each {'name', 'addr', 'fc',
+    # 'reg', 'type', 'order'} with addr, fc, type and order defaulting to the
+    # rs485 addr, 3, 'int16' and 'abcd'; points of disabled sensors are left
+    # out. the points of a slave are sorted per function code and merged into
+    # blocks of contiguous registers (up to `gap` unused ones in between,
+    # _modbus_max_regs per request), so a slave costs one request per block
+    # rather than one per point. `wide` names the int32 and uint32 points,
+    # which Readings keeps as exact integers
+    kinds = {'int16': 1, 'uint16': 1, 'int32': 2, 'uint32': 2, 'float32': 2}
+    orders = ('abcd', 'cdab', 'badc', 'dcba')
+    
+    def __init__(self, cfg, sensors):
+        points = cfg.get('map') or [{'name': 'rs_1', 'reg': 1}, {'name': 'rs_2', 'reg': 2}]
+        points = [p for p in points if sensors[p['name']]['en']]
+        limits = cfg.get('slaves', {})
+        gap = int(cfg.get('gap', 0))
+        self.names = [p['name'] for p in points]
+        self.wide = [p['name'] for p in points if p.get('type') in ('int32', 'uint32')]
+        self.slaves = []
+        by_addr = {}
+        for col, p in enumerate(points):
+            addr = int(p.get('addr', cfg['addr']))
+            if addr not in by_addr:
+                lim = limits.get(str(addr), {})
+                slave = ModbusSlave(addr, int(lim.get('timeout', cfg.get('timeout', _modbus_timeout))),
+                                    int(lim.get('retries', cfg.get('retries', _modbus_retries))))
+                by_addr[addr] = slave
+                self.slaves.append(slave)
+            by_addr[addr].blocks.append((int(p.get('fc', 3)), int(p['reg']), col,
+                                         p.get('type', 'int16'), p.get('order', 'abcd')))
+        for slave in self.slaves:
+            points = sorted(slave.blocks)
+            slave.blocks = []
+            block = None
+            for fc, reg, col, kind, order in points:
+                end = reg + self.kinds[kind]
+                if (block is None or block[0] != fc or reg > block[1] + block[2] + gap
+                        or end - block[1] > _modbus_max_regs):
+                    block = [fc, reg, 0, []]
+                    slave.blocks.append(block)
+                block[2] = max(block[2], end - block[1])
+                block[3].append((col, reg - block[1], kind, order))
+    
+    def requests(self):
+        return sum(len(slave.blocks) for slave in self.slaves)
+
+class ModbusDriver(SensorDriver):
+    # polls every slave of a ModbusMap, one request per block. a failed
+    # request is retried up to the slave's `retries` while it has had less
+    # than `timeout` ms this poll, and a slave that timed out stops at its
+    # first dead block. an exception response is the slave's answer and is
+    # counted per code, not retried. a slave with no answer at all is then
+    # skipped for 1, 2, 4 .. up to _modbus_backoff polls, so one dead meter
+    # costs the rs485 window a single request now and then
+    name = 'rs485'
+    th = 'rs_th'
+    def __init__(self, app, rmap):
+        super().__init__(rmap.names)
+        self.app = app
+        self.map = rmap
+        self.wide = rmap.wide
+    
+    def read(self):
+        app = self.app
+        values = [None] * len(self.channels)
+        if not app.channels.open('rs485', 'rs485'):
+            return values
+        try:
+            for slave in self.map.slaves:
+                self._poll(slave, values)
+        finally:
+            app.channels.close()
+        log.debug('rs485: %s', values)
+        return values
+    
+    def _poll(self, slave, values):
+        if slave.wait:
+            slave.wait -= 1
+            slave.skipped += 1
+            return
+        itf = modbus._itf
+        slave.polls += 1
+        start = ticks_ms()
+        answered = False
+        for fc, first, count, points in slave.blocks:
+            read = itf.read_holding_registers if fc == 3 else itf.read_input_registers
+            regs = None
+            dead = False
+            attempt = 0
+            while True:
+                feed_wdt()
+                slave.requests += 1
+                try:
+                    regs = read(slave.addr, first, count, signed=False)
+                    break
+                except Exception as e:
+                    msg = str(e)
+                    if 'exception code' in msg:
+                        code = msg.rsplit(':', 1)[-1].strip()
+                        slave.codes[code] = slave.codes.get(code, 0) + 1
+                        answered = True
+                        break
+                    if 'no data' in msg:
+                        slave.timeouts += 1
+                        dead = True
+                    else:
+                        slave.errors += 1
+                attempt += 1
+                if attempt > slave.retries or ticks_diff(ticks_ms(), start) >= slave.timeout:
+                    break
+            if regs is not None:
+                answered = True
+                dead = False
+                for col, ofs, kind, order in points:
+                    values[col] = modbus_value(regs, ofs, kind, order)
+            if dead or ticks_diff(ticks_ms(), start) >= slave.timeout:
+                break
+        slave.ms = ticks_diff(ticks_ms(), start)
+        if slave.ms > slave.ms_max:
+            slave.ms_max = slave.ms
+        if answered:
+            if slave.down:
+                log.info(f'rs485 slave {slave.addr} back after {slave.down} failed polls')
+            slave.down = 0
+        else:
+            slave.down += 1
+            slave.wait = min(1 << (slave.down - 1), _modbus_backoff)
+            if slave.down == 1:
+                log.warn(f'rs485 slave {slave.addr} not answering, backing off')
+    
+    def report(self):
+        return {str(slave.addr): slave.report() for slave in self.map.slaves}
+
+class RainGauge:
+    # tip counter fed by the percip pin irq. a falling edge within
+    # _rain_debounce ms of the last accepted one is bounce, accepted tips are
+    # counted and their ticks_ms stamps kept in a ring for intensity figures
+    def __init__(self, size=_rain_stamps, debounce=_rain_debounce):
+        self.stamps = array('L', [0] * size)
+        self.size = size
+        self.debounce = debounce
+        self.head = 0
+        self.n = 0
+        self.count = 0
+    
+    def tip(self, pin):
+        # irq handler, no allocation
+        t = ticks_ms()
+        if self.n:
+            if ticks_diff(t, self.stamps[self.head - 1 if self.head else self.size - 1]) < self.debounce:
+                return
+        self.stamps[self.head] = t
+        self.head = (self.head + 1) % self.size
+        if self.n < self.size:
+            self.n += 1
+        self.count += 1
+    
+    def take(self):
+        state = machine.disable_irq()
+        n = self.count
+        self.count = 0
+        machine.enable_irq(state)
+        return n
+    
+    def intensity(self, now=None):
+        # (current, peak) in tips per hour. current comes from the last
+        # inter-tip interval, or from the time since the last tip once that is
+        # longer; peak is the shortest interval within the last _rain_window s
+        if now is None:
+            now = ticks_ms()
+        state = machine.disable_irq()
+        head = self.head
+        n = self.n
+        machine.enable_irq(state)
+        if n < 2:
+            return 0.0, 0.0
+        window = _rain_window * 1000
+        i = (head - 1) % self.size
+        last = self.stamps[i]
+        since = ticks_diff(now, last)
+        if since > window:
+            # forget stale stamps before ticks_ms wraps onto them
+            self.n = 0
+            return 0.0, 0.0
+        dt = ticks_diff(last, self.stamps[(i - 1) % self.size])
+        cur = 3600000 / max(dt, since)
+        best = dt
+        i = (i - 1) % self.size
+        for _ in range(n - 2):
+            if ticks_diff(now, self.stamps[i]) > window:
+                break
+            j = (i - 1) % self.size
+            dt = ticks_diff(self.stamps[i], self.stamps[j])
+            if dt < best:
+                best = dt
+            i = j
+        return cur, 3600000 / best
+
+class PulseDriver(SensorDriver):
+    # rain gauge tips counted by App.rain, turned into total, 1h and 12h sums
+    # and the current/peak intensity shown on the DI tab
+    name = 'percip'
+    th = 'ra_th'
+    def __init__(self, app):
+        super().__init__(['ra', 'ra_1', 'ra_12'])
+        self.app = app
+        self.a = float(app.config['sensors']['ra'].get('a', 1.0))
+    
+    def read(self):
+        app = self.app
+        store = app.percip_store
+        tm = roundup(time())
+        k = tm // _write_percip_interval
+        thread_lock.acquire()
+        try:
+            cnt = app.rain.take()
+            app.percip_tot += cnt
+            app.percip_cur += cnt
+            
+            if cnt != 0 or store.at(k) is None:
+                log.debug('update percip db: %s -> %s', tm, app.percip_tot) 
+                store.record(k, app.percip_tot)
+            
+            pr_1h = store.window(k, 3600 // _write_percip_interval)
+            if pr_1h is None:
+                pr_1h = app.percip_cur
+                
+            pr_12 = store.window(k, 43200 // _write_percip_interval)
+            if pr_12 is None:
+                pr_12 = app.percip_cur
+            tot = app.percip_tot
+            
+            cur, peak = app.rain.intensity()
+            cur = round(self.a * cur, 2)
+            peak = round(self.a * peak, 2)
+            app.data['ra_int'] = cur
+            app.data['ra_int_max'] = peak
+            app.display.text('ra_int', str(cur))
+            app.display.text('ra_int_max', str(peak))
+        finally:
+            thread_lock.release()
         
-    def __eq__(self, other: Job):
-        return self.name == other.name and self.args == other.args
+        log.debug('percip -> t: %s 1h: %s 12h: %s int: %s max: %s', tot, pr_1h, pr_12, cur, peak)
+        return [tot, pr_1h, pr_12]
+
+class PercipStore:
+    # ring of cumulative percip totals, one 8 byte (interval, total) slot per
+    # _write_percip_interval, kept whole in ram and mirrored slot by slot to flash
+    def __init__(self, path):
+        self.buf = bytearray(_percip_slots * 8)
+        self.mv = memoryview(self.buf)
+        self.last = None
+        self.total = 0
+        try:
+            self.file = open(path, 'r+b')
+            self.file.readinto(self.buf)
+        except OSError:
+            self.file = open(path, 'w+b')
+            self.file.write(self.buf)
+            self.file.flush()
+        for i in range(_percip_slots):
+            k, tot = struct.unpack_from('>II', self.buf, i * 8)
+            if k and (self.last is None or k > self.last):
+                self.last = k
+                self.total = tot
+
+    def _write(self, k, total):
+        ofs = (k % _percip_slots) * 8
+        struct.pack_into('>II', self.buf, ofs, k, total)
+        self.file.seek(ofs)
+        self.file.write(self.mv[ofs:ofs + 8])
+
+    def at(self, k):
+        kk, tot = struct.unpack_from('>II', self.buf, (k % _percip_slots) * 8)
+        return tot if kk == k else None
+
+    def window(self, k, n):
+        start = self.at(k - n)
+        end = self.at(k)
+        if start is None or end is None:
+            return None
+        return end - start
+
+    def record(self, k, total):
+        # intervals the device was off carry the previous total forward so
+        # every window inside the ring has a baseline
+        if self.last is not None and k > self.last + 1:
+            for j in range(max(self.last + 1, k - _percip_slots + 1), k):
+                self._write(j, self.total)
+        self._write(k, total)
+        if self.last is None or k >= self.last:
+            self.last = k
+            self.total = total
+        self.file.flush()
+
+    def clear(self):
+        for i in range(len(self.buf)):
+            self.buf[i] = 0
+        self.file.seek(0)
+        self.file.write(self.buf)
+        self.file.flush()
+        self.last = None
+        self.total = 0
+
+    def migrate(self, db):
+        for key in db:
+            k = int.from_bytes(key, 'big') // _write_percip_interval
+            if k:
+                self.record(k, int.from_bytes(db[key], 'big'))
+
+class DisplayModel:
+    # what each widget of `widgets` (the App's lcd_objs) shows and what it
+    # should show next, per (key, attr) with attr 0 text, 1 text colour and
+    # 2 image source. any thread records writes, only flush(), an lv timer
+    # every _display_frame ms and so running in the lvgl context, touches
+    # lvgl: once per frame and only for values that really changed, so
+    # several writes between two frames cost at most two redraws and a
+    # rewrite of the same value none. the first change of a slot in a frame
+    # is always shown for a frame, later ones wait in `later` for the next,
+    # so a green -> white activity pulse still reaches the screen
+    def __init__(self, widgets):
+        self.widgets = widgets
+        self.shown = {}
+        self.wanted = {}
+        self.later = {}
+        self.frames = 0
+        self.writes = 0
+        self.pushed = 0
+        self._lock = _thread.allocate_lock()
+    
+    def _set(self, slot, value):
+        # under _lock
+        self.writes += 1
+        if slot in self.wanted:
+            if value == self.wanted[slot]:
+                self.later.pop(slot, None)
+            else:
+                self.later[slot] = value
+        elif slot not in self.shown or self.shown[slot] != value:
+            self.wanted[slot] = value
+    
+    def _latest(self, slot):
+        # under _lock
+        if slot in self.later:
+            return self.later[slot]
+        return self.wanted.get(slot, self.shown.get(slot, ''))
+    
+    def _want(self, key, attr, value):
+        with self._lock:
+            self._set((key, attr), value)
+    
+    def text(self, key, text):
+        self._want(key, 0, text)
+    
+    def current(self, key):
+        # the text the widget will end up showing
+        with self._lock:
+            return self._latest((key, 0))
+    
+    def append(self, key, text):
+        slot = (key, 0)
+        with self._lock:
+            self._set(slot, self._latest(slot) + text)
+    
+    def color(self, key, color):
+        self._want(key, 1, color)
+    
+    def src(self, key, src):
+        self._want(key, 2, src)
+    
+    def flush(self, timer=None):
+        # shown is what writers compare against, so it is updated under the
+        # lock together with the widgets
+        with self._lock:
+            if not self.wanted:
+                return
+            wanted = self.wanted
+            self.wanted = self.later
+            self.later = {}
+            shown = self.shown
+            for slot, value in wanted.items():
+                if slot in shown and shown[slot] == value:
+                    continue
+                key, attr = slot
+                widget = self.widgets[key]
+                if attr == 0:
+                    widget.set_text(value)
+                elif attr == 1:
+                    widget.set_style_text_color(value, 0)
+                else:
+                    widget.set_src(value)
+                shown[slot] = value
+                self.pushed += 1
+            self.frames += 1
     
-    def __str__(self):
-        return self.name
+    def report(self):
+        return {'frames': self.frames, 'writes': self.writes, 'pushed': self.pushed}
+
+class DisplayLine:
+    # stands in for a label where library code wants one to report on
+    # (modem.download's progress), its set_text goes through the model
+    def __init__(self, display, key):
+        self.display = display
+        self.key = key
     
-    def __repr__(self):
-        return self.name
+    def set_text(self, text):
+        self.display.text(self.key, text)
 
 class App:
     def __init__(self):
-        self.spi_lock = False
-        self.uart_lock = False
+        self.spi_bus = Bus('spi')
+        self.channels = UartChannels(uart, {
+            'sim800': {'baudrate': 115200, 'tx': _sim800_tx, 'rx': _sim800_rx, 'rxbuf': 2048},
+            'rs485':  {'baudrate': _rs485_baud, 'tx': _rs485_tx, 'rx': _rs485_rx},
+        })
         self.data = {}
         self.config = {}
         self.data['firmware_version'] = _firmware_version
-        self.uart_tx = 18
-        self.uart_rx = 17
-        
-        self.last_prcip_write  = float('-inf')
-        self.last_prcip_update = float('-inf')
-        self.last_sdi12_update = float('-inf')
-        self.last_pt100_update = float('-inf')
-        self.last_rs485_update = float('-inf')
-        self.last_update_check = float('-inf')
-        self.last_ais_update   = float('-inf')
-        self.last_sms_check    = float('-inf')
-        self.last_data_post    = float('-inf')
-        self.last_get_time     = float('-inf')
-        self.last_data_sms     = float('-inf')
-        self.last_sd_log       = float('-inf')
-        
-        self.prcip_update_running = False
-        self.sdi12_update_running = False
-        self.pt100_update_running = False
-        self.rs485_update_running = False
+        
+        self.pool = WorkerPool()
+        self.scheduler = Scheduler(self.pool)
+        
         self.loc_request_sms_sent = False
-        self.ais_update_running   = False
-        self.sd_log_running       = False
         self.server_running       = False
         
         self.next_ready = False
@@ -400,7 +2603,19 @@ class App:
         
         self.sms_time_set = False
         self.time_set = False
-        self.sim800_jobs = []
+        self.sim800_jobs = JobQueue(self.scheduler.now)
+        self.gprs = GprsSession(modem, self.scheduler.now)
+        self.signal_icons = []
+        self.csq_at = None
+        self.outbox = None
+        self.sealer = None
+        self.form_body = None
+        self.compact = None
+        self.delta = None
+        self.alarms = None
+        self.readings = None
+        self.drivers = {}
+        self.rain = RainGauge()
         self.sensor_jobs = []
         self.sensors_handler1_running = False
         self.sensors_handler2_running = False
@@ -410,7 +2625,7 @@ class App:
         self.decoder.open_cb = open_png
         
     def init_display(self):
-        print_colored('Initializing display...')
+        log.info('Initializing display...')
         self.scr = lv.scr_act()
         self.scr.set_scrollbar_mode(lv.SCROLLBAR_MODE.OFF)
         
@@ -424,7 +2639,8 @@ class App:
         self.tabview.set_size(240, 255)
         self.cur_tab = 0
         
-        self.lcd_objs = {}
+        self.lcd_objs = {'clock': self.time_label}
+        self.display = DisplayModel(self.lcd_objs)
         
         self.sdi_tab = self.tabview.add_tab("sdi12")
         self.sdi_tab.set_style_pad_left(5, 0)
@@ -495,6 +2711,13 @@ class App:
         label.set_style_text_font(lv.font_montserrat_18, 0)
         self.lcd_objs['rad'] = label
         
+        label = lv.label(self.info_tab)
+        label.set_text("")
+        label.set_pos(0, 200)
+        label.set_width(225)
+        label.set_style_text_font(lv.font_montserrat_12, 0)
+        self.lcd_objs['metrics'] = label
+        
         label = lv.label(self.scr)
         label.set_text("Initializing...")
         label.set_pos(5, 280)
@@ -507,11 +2730,19 @@ class App:
         self.wifi_icon.set_size(20, 20)
         self.wifi_icon.set_pos(220, 0)
         self.wifi_icon.set_src(lv.SYMBOL.CLOSE)
+        self.lcd_objs['signal'] = self.wifi_icon
+        # the four signal bucket icons, read once and kept for the uptime
+        self.signal_icons = []
+        for i in range(1, 5):
+            with open(f"/icons/{i}.png", 'rb') as f:
+                icon = f.read()
+            self.signal_icons.append(lv.img_dsc_t({'data_size': len(icon), 'data': icon}))
         
         self.bat_label = lv.label(main_app.scr)
         self.bat_label.set_text("")
         self.bat_label.set_pos(165, 0)
         self.bat_label.set_style_text_font(lv.font_montserrat_12, 0)
+        self.lcd_objs['battery'] = self.bat_label
         
         label = lv.label(self.scr)
         label.set_text("sdi12")
@@ -558,70 +2789,102 @@ class App:
         self.lcd_objs['sd_th'] = label
         
         self.time_timer = lv.timer_create(self.update_time, 1000, None)
+        self.display_timer = lv.timer_create(self.display.flush, _display_frame, None)
         self.btn_timer = lv.timer_create(self.scan_btns, 200, None)
 #         self.btn_timer = machine.Timer(2)
 #         self.btn_timer.init(mode=machine.Timer.PERIODIC, period=200, callback=self.scan_btns)
         
     def update_time(self, timer):
+        # minutes only, the label is redrawn once a minute rather than every second
         try:
             tm = rtc.datetime()
-            self.time_label.set_text(f"{tm[0]:04d}-{tm[1]:02d}-{tm[2]:02d} {tm[4]:02d}:{tm[5]:02d}:{tm[6]:02d}")
+            self.display.text('clock', f"{tm[0]:04d}-{tm[1]:02d}-{tm[2]:02d} {tm[4]:02d}:{tm[5]:02d}")
         except Exception as e:
-            print_exception(e)
+            log.exc(e)
+    
+    def update_signal(self):
+        # csq at most every _csq_interval s (and after a failed modem init);
+        # the cached icon of its bucket is set, which the display model
+        # only pushes when the bucket changed. 99 is "not known"
+        now = self.scheduler.now()
+        if self.csq_at is not None and now - self.csq_at < _csq_interval * 1000:
+            return
+        self.csq_at = now
+        csq = modem.get_signal_strength()
+        if csq == 99 or csq < 10:
+            bucket = 0
+        elif csq < 15:
+            bucket = 1
+        elif csq < 20:
+            bucket = 2
+        else:
+            bucket = 3
+        log.debug('csq: %s', csq)
+        self.display.src('signal', self.signal_icons[bucket])
     
     def sim800_handler(self):
         if self.sim800_jobs:
-            print_colored(f'jobs: {self.sim800_jobs}', Green)
-            while self.uart_lock:
-                sleep_ms(100)
-            self.uart_lock = True
-            self.switch_uart_to('sim800')
-            self.lcd_objs['status'].set_text("Initializing modem...")
-            if not self.init_modem():
-                self.wifi_icon.set_src(lv.SYMBOL.CLOSE)
-                self.lcd_objs['status'].ins_text(lv.LABEL_POS.LAST, "Failed")
-                self.last_get_time = time()
-                self.get_time_running = False
-                self.uart_lock = False
-                self.sim_handler_running = False
+            log.debug('jobs: %s', self.sim800_jobs)
+            if not self.channels.open('sim800', 'sim800'):
+                self.scheduler.trigger('sim800', 1)
                 return
-            self.lcd_objs['status'].ins_text(lv.LABEL_POS.LAST, "done")
-            if uart.any():
-                uart.read()
-            csq = modem.get_signal_strength()
-            if csq >= 20:
-                with open("/icons/4.png", 'rb') as f:
-                    icon = f.read()
-                    img_data = lv.img_dsc_t({'data_size':len(icon), 'data':icon})
-            elif csq >= 15:
-                with open("/icons/3.png", 'rb') as f:
-                    icon = f.read()
-                    img_data = lv.img_dsc_t({'data_size':len(icon), 'data':icon})
-            elif csq >= 10:
-                with open("/icons/2.png", 'rb') as f:
-                    icon = f.read()
-                    img_data = lv.img_dsc_t({'data_size':len(icon), 'data':icon})
-            else:
-                with open("/icons/1.png", 'rb') as f:
-                    icon = f.read()
-                    img_data = lv.img_dsc_t({'data_size':len(icon), 'data':icon})
-            self.wifi_icon.set_src(img_data)
-            self.lcd_objs['status'].set_text(f'{self.sim800_jobs[0].name}...')
-            print_colored(f'running {self.sim800_jobs[0].name} job', Green)
             try:
-                self.sim800_jobs[0].func(*self.sim800_jobs[0].args)
-                self.lcd_objs['status'].ins_text(lv.LABEL_POS.LAST, "done")
-            except Exception as e:
-                print_colored("Exception from sim800 handle:", Cyan)
-                self.lcd_objs['status'].ins_text(lv.LABEL_POS.LAST, "Failed")
-                print_exception(e)
+                self.display.text('status', "Initializing modem...")
+                if not self.init_modem():
+                    self.display.src('signal', lv.SYMBOL.CLOSE)
+                    self.csq_at = None
+                    self.display.append('status', "Failed")
+                    return
+                self.display.append('status', "done")
+                if uart.any():
+                    uart.read()
+                self.update_signal()
+                job = self.sim800_jobs.peek()
+                if job is None:
+                    return
+                self.display.text('status', f'{job.name}...')
+                log.debug('running %s job', job.name)
+                stats = metrics.begin('job:' + job.name)
+                try:
+                    job.func(*job.args)
+                    self.display.append('status', "done")
+                except Exception as e:
+                    log.error("Exception from sim800 handle:")
+                    self.display.append('status', "Failed")
+                    log.exc(e)
+                    self.gprs.close()
+                finally:
+                    metrics.end(stats)
+                    self.sim800_jobs.remove(job)
+                    if self.sim800_jobs:
+                        self.scheduler.trigger('sim800')
+                    if self.gprs.is_open:
+                        log.debug('gprs attaches: %s saved: %s', self.gprs.attaches, self.gprs.saved())
+                        self.scheduler.trigger('gprs_idle', _gprs_idle_timeout)
             finally:
-                self.uart_lock = False
-                thread_lock.acquire()
-                self.sim800_jobs.pop(0)
-                thread_lock.release()
+                self.channels.close()
+    
+    def close_idle_gprs(self):
+        if not self.gprs.is_open:
+            return
+        idle = self.gprs.idle() // 1000
+        if idle < _gprs_idle_timeout:
+            self.scheduler.trigger('gprs_idle', _gprs_idle_timeout - idle)
+            return
+        if not self.channels.open('sim800', 'gprs_idle'):
+            self.scheduler.trigger('gprs_idle', 1)
+            return
+        try:
+            log.info('closing idle gprs session')
+            self.gprs.close()
+        finally:
+            self.channels.close()
 
     def init_sensors(self):
+        sdi_channels = []
+        ai_channels = []
+        rs_channels = []
+        self.drivers = {}
         sdi_th = False
         if self.config['sdi12']['en']:
             idx = 0
@@ -629,7 +2892,7 @@ class App:
                 sensor = f's{i+1}'
                 if self.config['sensors'][sensor]['en']:
                     sdi_th = True
-                    self.data[f"s{i+1}"] = {"raw": None, "scaled": None, "warning": None}
+                    sdi_channels.append(sensor)
                     label = lv.label(self.sdi_tab)
                     label.set_text(f"{self.config['sensors'][sensor]['disp_name']}:")
                     label.set_pos(0, idx * 25)
@@ -657,7 +2920,7 @@ class App:
         idx = 0
         sensor = 'pt'
         if self.config['sensors'][sensor]['en']:
-            self.data[sensor] = {"raw": None, "scaled": None, "warning": None}
+            self.drivers['pt100'] = Pt100Driver(self)
             label = lv.label(self.ai_tab)
             label.set_text(f"{self.config['sensors'][sensor]['disp_name']}:")
             label.set_pos(0, idx * 35)
@@ -684,7 +2947,7 @@ class App:
         for sensor in ['a1', 'a2', 'a3', 'c1', 'c2']:
             if self.config['sensors'][sensor]['en']:
                 ai_th = True
-                self.data[sensor] = {"raw": None, "scaled": None, "warning": None}
+                ai_channels.append(sensor)
                 label = lv.label(self.ai_tab)
                 label.set_text(f"{self.config['sensors'][sensor]['disp_name']}:")
                 label.set_pos(0, idx * 35)
@@ -709,10 +2972,8 @@ class App:
         
         idx = 0
         if self.config['sensors']['ra']['en']:
-            self.percip_cnt = 0
-            self.percip_ready = False
+            self.drivers['percip'] = PulseDriver(self)
             for sensor in ['ra', 'ra_1', 'ra_12']:
-                self.data[sensor] = {"raw": 0, "scaled": 0, "warning": 0}
                 label = lv.label(self.di_tab)
                 label.set_text(f"{self.config['sensors'][sensor]['disp_name']}:")
                 label.set_pos(0, idx * 35)
@@ -732,15 +2993,39 @@ class App:
                 label.set_style_text_font(lv.font_montserrat_12, 0)
                 label.set_text(self.config['sensors'][sensor]['unit'])
                 idx += 1
+            for sensor, name in (('ra_int', 'intensity'), ('ra_int_max', 'peak 1h')):
+                label = lv.label(self.di_tab)
+                label.set_text(f"{name}:")
+                label.set_pos(0, idx * 35)
+                label.set_size(110, 35)
+                label.set_style_text_font(lv.font_montserrat_18, 0)
+                label.set_long_mode(lv.label.LONG.DOT)
+                label = lv.label(self.di_tab)
+                label.set_text('0.0')
+                label.set_pos(115, idx * 35)
+                label.set_size(85, 35)
+                label.set_style_text_font(lv.font_montserrat_18, 0)
+                label.set_long_mode(lv.label.LONG.SCROLL_CIRCULAR)
+                self.lcd_objs[sensor] = label
+                label = lv.label(self.di_tab)
+                label.set_pos(200, idx * 35 + 2)
+                label.set_size(30, 35)
+                label.set_style_text_font(lv.font_montserrat_12, 0)
+                label.set_text(f"{self.config['sensors']['ra']['unit']}/h")
+                idx += 1
+            percip.irq(trigger=machine.Pin.IRQ_FALLING, handler=self.rain.tip)
+            log.info("percip irq attached")
         else:
             self.lcd_objs['ra_th'].set_style_text_color(lv_red, 0)
         
         if self.config['rs485']['en']:
-            modbus._addr_list = [self.config['rs485']['addr']]
-            _rs485_baud = self.config['rs485']['baud']
+            rs_map = ModbusMap(self.config['rs485'], self.config['sensors'])
+            modbus._addr_list = [slave.addr for slave in rs_map.slaves]
+            self.channels.configure('rs485', baudrate=int(self.config['rs485']['baud']))
+            log.info(f'rs485: {len(rs_map.names)} points, {len(rs_map.slaves)} slaves, {rs_map.requests()} requests per poll')
             
-            for sensor in ['rs_1', 'rs_2']:
-                self.data[sensor] = {"raw": 0, "scaled": 0, "warning": 0}
+            for sensor in rs_map.names:
+                rs_channels.append(sensor)
                 label = lv.label(self.di_tab)
                 label.set_text(f"{self.config['sensors'][sensor]['disp_name']}:")
                 label.set_pos(0, idx * 35)
@@ -762,18 +3047,24 @@ class App:
                 idx += 1
         else:
             self.lcd_objs['rs_th'].set_style_text_color(lv_red, 0)
-
-        self.pin_timer = machine.Timer(3)
-        self.pin_timer.init(mode=machine.Timer.PERIODIC, period=100, callback=self.scan_pins)
-        print_colored("started scan pins timer")
-            
-    def scan_pins(self, t):
-        if percip.value():
-            self.percip_ready = True
         
-        if not percip.value() and self.percip_ready:
-            self.percip_ready = False
-            self.percip_cnt += 1
+        if sdi_channels:
+            self.drivers['sdi12'] = SdiDriver(self, sdi_channels, str(self.config['sdi12']['addr']),
+                                              self.config['sdi12'].get('map'))
+        cfg = self.config.get('adc', {})
+        sampler = AdcSampler([AIs[ch] for ch in ai_channels] + [bat],
+                             int(cfg.get('samples', _adc_samples)),
+                             cfg.get('filter', 'mean'),
+                             int(cfg.get('trim', _adc_trim)),
+                             int(cfg.get('gap', _adc_gap)),
+                             int(cfg.get('budget', _adc_budget)))
+        # filtered read_uv() to volts for a*, to the old 10 sample sum scaling for c*
+        self.drivers['ais'] = AdcDriver(self, ai_channels,
+                                        [0.000004636636 - 0.000000022 if ch[0] == 'a' else 10 * 0.00000144
+                                         for ch in ai_channels], sampler)
+        if rs_channels:
+            self.drivers['rs485'] = ModbusDriver(self, rs_map)
+        self.init_readings()
               
     def scan_btns(self, t):
         if next_btn.value():
@@ -790,427 +3081,114 @@ class App:
             self.prev_ready = False
             self.go_to_previous_tab()
     
-    def ap_and_srv_ctrl(self, start):
-        if start and not app.IsRunning:
-            ap.active(True)
-            app.StartManaged()
-        else:
-            app.Stop()
-            ap.active(False)
+    def ap_and_srv_ctrl(self):
+        # runs on the worker pool, which refuses a second submit while this
+        # one runs, so it loops until a tab change made meanwhile is applied
+        while True:
+            start = self.cur_tab == 3
+            if start and not app.IsRunning:
+                ap.active(True)
+                app.StartManaged()
+            elif not start and app.IsRunning:
+                app.Stop()
+                ap.active(False)
+            if (self.cur_tab == 3) == start:
+                break
     
     def go_to_next_tab(self):
         self.cur_tab += 1
         if self.cur_tab == 4:
             self.cur_tab = 0
         self.tabview.set_act(self.cur_tab, 0)
-        _thread.start_new_thread(self.ap_and_srv_ctrl, (self.cur_tab == 3,))
+        self.pool.submit('ap', self.ap_and_srv_ctrl)
         
     def go_to_previous_tab(self):
         self.cur_tab -= 1
         if self.cur_tab == -1:
             self.cur_tab = 3
         self.tabview.set_act(self.cur_tab, 0)
-        _thread.start_new_thread(self.ap_and_srv_ctrl, (self.cur_tab == 3,))
+        self.pool.submit('ap', self.ap_and_srv_ctrl)
     
     def create_old_percip_record(self):
         try:
-            tm = roundup(time())
-            tm -= _write_percip_interval
-            tm = tm.to_bytes(4, 'big')
+            k = roundup(time()) // _write_percip_interval - 1
             thread_lock.acquire()
-            if tm not in self.db:
-                print_colored(f'update percip db: {int.from_bytes(tm, "big")} -> {self.percip_tot}', Cyan)
-                self.db[tm] = self.percip_tot.to_bytes(4, 'big')
-                self.db.flush()
-                self.db_file.flush()
+            if self.percip_store.at(k) is None:
+                log.debug('update percip db: %s -> %s', k * _write_percip_interval, self.percip_tot)
+                self.percip_store.record(k, self.percip_tot)
         except Exception as e:
-            print_colored("Exception from create_old_percip_record:", Cyan)
-            print_exception(e)
+            log.error("Exception from create_old_percip_record:")
+            log.exc(e)
         finally:
             if thread_lock.locked():
                 thread_lock.release()
             
     
     def init_percip_db(self):
-        try:
-            self.db_file = open("percip.db", "r+b")
-        except OSError:
-            self.db_file = open("percip.db", "w+b")
-            
-        self.db = btree.open(self.db_file)
-        self.percip_cnt = 0
+        ls = os.listdir('/')
+        self.percip_store = PercipStore('percip.bin')
+        if 'percip.db' in ls and 'percip.bin' not in ls:
+            log.info('migrating percip.db to percip.bin')
+            try:
+                with open('percip.db', 'r+b') as f:
+                    db = btree.open(f)
+                    self.percip_store.migrate(db)
+                    db.close()
+                os.rename('percip.db', 'percip.db.old')
+            except Exception as e:
+                log.error("Exception from percip db migration:")
+                log.exc(e)
         self.percip_cur = 0
-        self.percip_tot = 0
-        keys = list(self.db)
+        self.percip_tot = self.percip_store.total
         
-        if keys:
-            self.percip_tot = int.from_bytes(self.db[keys[-1]], 'big')
-        else:
-            print_colored(f'update percip db: 0 -> {self.percip_tot}', Cyan)
-            self.db[bytes(4)] = self.percip_tot.to_bytes(4, 'big')
-            self.db.flush()
-            self.db_file.flush()
-        
-    def update_percip(self, *args):
-        self.prcip_update_running = True
-        self.lcd_objs['ra_th'].set_style_text_color(lv_green, 0)
+    def poll(self, driver, collect=False):
+        if driver.th:
+            self.display.color(driver.th, lv_green)
         try:
-            a = self.config["sensors"]["ra"]["a"]
-            b = self.config["sensors"]["ra"]["b"]
-
-            tm = roundup(time())
-            thread_lock.acquire()
-            
-            keys = list(self.db)
-            if len(keys) >= 300:
-                print_colored(f"dblen: {len(keys)} remove 10 keys from db", Cyan)
-                for i in range(10):
-                    del self.db[keys[i]]
-                self.db.flush()
-                self.db_file.flush()
-            
-            self.percip_tot += self.percip_cnt
-            self.percip_cur += self.percip_cnt
-
-            if self.percip_cnt != 0 or tm.to_bytes(4, 'big') not in self.db:
-                print_colored(f'update percip db: {tm} -> {self.percip_tot}', Cyan) 
-                self.db[tm.to_bytes(4, 'big')] = self.percip_tot.to_bytes(4, 'big')
-                self.db.flush()
-                self.db_file.flush()
-            self.percip_cnt = 0
-            tm_1h = tm - 3600
-            
-            while tm > tm_1h:
-                b_tm = tm_1h.to_bytes(4, 'big')
-                if b_tm in self.db:
-                    pr_1h = self.percip_tot - int.from_bytes(self.db[b_tm], 'big')
-                    break
-                tm_1h += _write_percip_interval
-            else:
-                pr_1h = self.percip_cur
-                
-            tm_12 = tm - 43200
-            while tm > tm_12:
-                b_tm = tm_12.to_bytes(4, 'big')
-                if b_tm in self.db:
-                    pr_12 = self.percip_tot - int.from_bytes(self.db[b_tm], 'big')
-                    break
-                tm_12 += _write_percip_interval
-            else:
-                pr_12 = self.percip_cur
-            
-            print_colored(f'percip -> t: {self.percip_tot} 1h: {pr_1h} 12h: {pr_12}', Cyan)
-            self.data["ra"]["raw"] = round(self.percip_tot, 2)
-            self.data["ra"]["scaled"] = round(a * self.percip_tot + b, 2)
-            self.data["ra_1"]["raw"] = round(pr_1h, 2)
-            self.data["ra_1"]["scaled"] = round(a * pr_1h + b, 2)
-            self.data["ra_12"]["raw"] = round(pr_12, 2)
-            self.data["ra_12"]["scaled"] = round(a * pr_12 + b, 2)
-            
-            self.lcd_objs["ra"].set_text(f'{self.data["ra"]["scaled"]}')
-            self.lcd_objs["ra_1"].set_text(f'{self.data["ra_1"]["scaled"]}')
-            self.lcd_objs["ra_12"].set_text(f'{self.data["ra_12"]["scaled"]}')
-            
-            if self.config["sensors"]["ra"]["high_th"] and self.data["ra"]["scaled"] > float(self.config["sensors"]["ra"]["high_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra', True)
-                
-            if self.config["sensors"]["ra_1"]["high_th"] and self.data["ra_1"]["scaled"] > float(self.config["sensors"]["ra_1"]["high_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra_1', True)
-                
-            if self.config["sensors"]["ra_12"]["high_th"] and self.data["ra_12"]["scaled"] > float(self.config["sensors"]["ra_12"]["high_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra_12', True)
-            
-            if self.config["sensors"]["ra"]["low_th"] and self.data["ra"]["scaled"] < float(self.config["sensors"]["ra"]["low_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra', False)
-                
-            if self.config["sensors"]["ra_1"]["low_th"] and self.data["ra_1"]["scaled"] < float(self.config["sensors"]["ra_1"]["low_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra_1', False)
-                
-            if self.config["sensors"]["ra_12"]["low_th"] and self.data["ra_12"]["scaled"] < float(self.config["sensors"]["ra_12"]["low_th"]):
-                self.add_sim800_job('send_alarm_sms', 'ra_12', False)
-
+            values = driver.collect() if collect else driver.read()
+            if values is None:
+                return
+            with thread_lock:
+                self.publish(driver.slots, values)
         except Exception as e:
-            print_colored("Exception from percip handle:", Cyan)
-            print_exception(e)
+            log.error(f"Exception from {driver.name} handle:")
+            log.exc(e)
         finally:
-            self.last_prcip_update = time()
-            self.prcip_update_running = False
-            self.lcd_objs['ra_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
+            if driver.th:
+                self.display.color(driver.th, lv_white)
+    
+    def publish(self, slots, values):
+        readings = self.readings
+        for i, raw in zip(slots, values):
+            name = readings.names[i]
+            if raw is None:
+                readings.lost(i)
+                self.display.text(name, 'NC')
+            else:
+                scaled = readings.put(i, raw)
+                readings.warning[i] = self.alarms.evaluate(name, scaled)
+                self.display.text(name, str(scaled))
     
     def zero_db(self):
         thread_lock.acquire()
-        keys = list(self.db)
-        for key in keys:
-            del self.db[key]
-        self.percip_cnt = 0
+        self.percip_store.clear()
+        self.rain.take()
         self.percip_tot = 0
         self.percip_cur = 0
-        self.db.flush()
-        self.db_file.flush()
         thread_lock.release()
     
-    def update_sdi(self, *args):
-        self.sdi12_update_running = True
-        self.lcd_objs['sdi_th'].set_style_text_color(lv_green, 0)
-        addr = str(self.config['sdi12']['addr'])
-        retries = 0
-        sdi_lock.acquire()
-        while retries < 10:
-            try:
-                feed_wdt()
-                result = sdi12.measure_data(addr, request_crc = True)
-                print_colored(f'sdi {addr} data: {result}', Cyan)
-                if result[0] > 0:
-                    cnt, data = result
-                    break
-                sleep(1)
-                retries += 1
-            except:
-                retries += 1
-                sleep(1)
-                continue
-        else:
-            cnt = 0
-            data = []
-        sdi_lock.release()
-        feed_wdt()
-        try:
-            thread_lock.acquire()
-            if data:
-                for i in range(9):
-                    sensor = f's{i+1}'
-                    if self.config['sensors'][sensor]['en']:
-                        a = float(self.config['sensors'][sensor]['a'])
-                        b = float(self.config['sensors'][sensor]['b'])
-                        self.data[sensor]['raw'] = round(data[i], 2)
-                        self.data[sensor]['scaled'] = round(a * data[i] + b, 2)
-                        self.data[sensor]['warning'] = 0
-                        if self.config["sensors"][sensor]["high_th"] and self.data[sensor]["scaled"] > float(self.config["sensors"][sensor]["high_th"]):
-                            self.add_sim800_job('send_alarm_sms', sensor, True)
-                            self.data[sensor]['warning'] = 2
-                        
-                        if self.config["sensors"][sensor]["low_th"] and self.data[sensor]["scaled"] < float(self.config["sensors"][sensor]["low_th"]):
-                            self.add_sim800_job('send_alarm_sms', sensor, False)
-                            self.data[sensor]['warning'] = 3
-                        self.lcd_objs[sensor].set_text(f"{self.data[sensor]['scaled']}")
-            else:
-                for i in range(9):
-                    sensor = f's{i+1}'
-                    if self.config['sensors'][sensor]['en']:
-                        self.data[sensor]['raw'] = None
-                        self.data[sensor]['scaled'] = None
-                        self.data[sensor]['warning'] = 1
-                        self.lcd_objs[sensor].set_text('NC')
-        except Exception as e:
-            print_colored(f"Exception from sdi12 update:", Cyan)
-            print_exception(e)
-        finally:
-            self.last_sdi12_update = time()
-            self.sdi12_update_running = False
-            self.lcd_objs['sdi_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
-                        
-    def update_pt100(self, *args):
-        self.pt100_update_running = True
-        self.lcd_objs['pt_th'].set_style_text_color(lv_green, 0)
-        try:
-            a = self.config["sensors"]["pt"]["a"]
-            b = self.config["sensors"]["pt"]["b"]
-
-            while self.spi_lock:
-                sleep_ms(100)
-            self.spi_lock = True
-            spi2.init(baudrate=5000000, phase=1)
-            for _ in range(3):
-                feed_wdt()
-                try:
-                    tmp = pt.temperature
-                    if -100 < tmp < 100:
-                        break
-                except:
-                    tmp = None
-            else:
-                tmp = None
-            
-            self.spi_lock = False
-            thread_lock.acquire()
-            if tmp is not None:
-                print_colored(f'pt100: {tmp}', Cyan)
-                self.data['pt']['raw'] = round(tmp, 2)
-                self.data['pt']['scaled'] = round(a * tmp + b, 2)
-                self.data['pt']['warning'] = 0
-                
-                if self.config["sensors"]['pt']["high_th"] and self.data['pt']["scaled"] > float(self.config["sensors"]['pt']["high_th"]):
-                    self.add_sim800_job('send_alarm_sms', 'pt', True)
-                    self.data['pt']['warning'] = 2
-                    
-                if self.config["sensors"]['pt']["low_th"] and self.data['pt']["scaled"] < float(self.config["sensors"]['pt']["low_th"]):
-                    self.add_sim800_job('send_alarm_sms', 'pt', False)
-                    self.data['pt']['warning'] = 3
-                self.lcd_objs['pt'].set_text(f'{self.data["pt"]["scaled"]}')
-            else:
-                print_colored(f'pt100: NC', Cyan)
-                self.data['pt']['raw'] = None
-                self.data['pt']['scaled'] = None
-                self.data['pt']['warning'] = 1
-                self.lcd_objs['pt'].set_text('NC')
-
-        except Exception as e:
-            print_colored(f"Exception from pt100 handle:", Cyan)
-            print_exception(e)
-        finally:
-            self.last_pt100_update = time()
-            self.pt100_update_running = False
-            self.lcd_objs['pt_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
-
-    def update_ais(self, *args):
-        self.ais_update_running = True
-        ai_th = False
-        try:
-            for sensor in ['a1', 'a2', 'a3']:
-                if sensor in self.config['sensors'] and self.config['sensors'][sensor]['en']:
-                    self.lcd_objs['ai_th'].set_style_text_color(lv_green, 0)
-                    ai_th = True
-                    a = self.config["sensors"][sensor].get("a", 1.0)
-                    b = self.config["sensors"][sensor].get("b", 0.0)
-                    tmp = 0
-                    for _ in range(10):
-                        tmp += AIs[sensor].read_uv()
-                        sleep_ms(10)
-                    tmp /= 10
-                    tmp = tmp * 0.000004636636 - (tmp * 0.000000022)
-                    thread_lock.acquire()
-                    self.data[sensor]['raw'] = round(tmp, 2)                
-                    self.data[sensor]['scaled'] = round(a * tmp + b, 2)
-                    self.data[sensor]['warning'] = 0
-                    print_colored(f'{sensor} : {self.data[sensor]}', Cyan)
-                    self.lcd_objs[sensor].set_text(f'{self.data[sensor]["scaled"]}')
-                    if self.config["sensors"][sensor]["high_th"] and self.data[sensor]["scaled"] > float(self.config["sensors"][sensor]["high_th"]):
-                        self.add_sim800_job('send_alarm_sms', sensor, True)
-                        self.data[sensor]['warning'] = 2
-                        
-                    if self.config["sensors"][sensor]["low_th"] and self.data[sensor]["scaled"] < float(self.config["sensors"][sensor]["low_th"]):
-                        self.add_sim800_job('send_alarm_sms', sensor, False)
-                        self.data[sensor]['warning'] = 3
-                    thread_lock.release()
-            for sensor in ['c1', 'c2']:
-                
-                if sensor in self.config['sensors'] and self.config['sensors'][sensor]['en']:
-                    a = self.config["sensors"][sensor].get("a", 1.0)
-                    b = self.config["sensors"][sensor].get("b", 0.0)
-                    tmp = 0
-                    for _ in range(10):
-                        tmp += AIs[sensor].read_uv()
-                        sleep_ms(10)
-                    tmp *= 0.00000144
-                    thread_lock.acquire()
-                    self.data[sensor]['raw'] = round(tmp, 2)                
-                    self.data[sensor]['scaled'] = round(a * tmp + b, 2)
-                    self.data[sensor]['warning'] = 0
-                    print_colored(f'{sensor} : {self.data[sensor]}', Cyan)
-                    self.lcd_objs[sensor].set_text(f'{self.data[sensor]["scaled"]}')
-                    if self.config["sensors"][sensor]["high_th"] and self.data[sensor]["scaled"] > float(self.config["sensors"][sensor]["high_th"]):
-                        self.add_sim800_job('send_alarm_sms', sensor, True)
-                        self.data[sensor]['warning'] = 2
-                    if self.config["sensors"][sensor]["low_th"] and self.data[sensor]["scaled"] < float(self.config["sensors"][sensor]["low_th"]):
-                        self.add_sim800_job('send_alarm_sms', sensor, False)
-                        self.data[sensor]['warning'] = 3
-                    thread_lock.release()
-        except Exception as e:
-            print_colored(f"Exception from AIs handle:", Cyan)
-            print_exception(e)
-        finally:
-            self.last_ais_update = time()
-            self.ais_update_running = False
-            if ai_th:
-                self.lcd_objs['ai_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
-    
-    def update_rs485(self, *args):
-        self.rs485_update_running = True
-        self.lcd_objs['rs_th'].set_style_text_color(lv_green, 0)
+    def init_sd(self):
+        log.info('Init sd card')
+        self.sd_available = False
+        self.data['sd_warning'] = 1
+        if not self.spi_bus.acquire('init_sd'):
+            return
         try:
-            addr = self.config['rs485']['addr']
-            while self.uart_lock:
-                sleep_ms(100)
-            self.uart_lock = True
-            self.switch_uart_to('rs485')
-            for _ in range(3):
-                try:
-                    feed_wdt()
-                    rs_1, rs_2 = modbus._itf.read_holding_registers(addr, 1, 2)
-                    break
-                except:
-                    rs_1, rs_2 = None, None
-            else:
-                rs_1, rs_2 = None, None
-            self.uart_lock = False
-            print_colored(f'rs485: {rs_1} {rs_2}', Cyan)
-            
-            thread_lock.acquire()
-            if self.config["sensors"]["rs_1"]['en']:
-                if rs_1 is not None:
-                    a1 = self.config["sensors"]["rs_1"]["a"]
-                    b1 = self.config["sensors"]["rs_1"]["b"]
-                    self.data['rs_1']['raw'] = round(rs_1, 2)
-                    self.data['rs_1']['scaled'] = round(a1 * rs_1 + b1, 2)
-                    self.data['rs_1']['warning'] = 0
-                    self.lcd_objs['rs_1'].set_text(f'{self.data["rs_1"]["scaled"]}')
-                    if self.config["sensors"]['rs_1']["high_th"] and self.data['rs_1']["scaled"] > float(self.config["sensors"]['rs_1']["high_th"]):
-                        self.add_sim800_job('send_alarm_sms', 'rs_1', True)
-                        self.data['rs_1']['warning'] = 2
-                        
-                    if self.config["sensors"]['rs_1']["low_th"] and self.data['rs_1']["scaled"] < float(self.config["sensors"]['rs_1']["low_th"]):
-                        self.add_sim800_job('send_alarm_sms', 'rs_1', False)
-                        self.data['rs_1']['warning'] = 3
-                else:
-                    self.data['rs_1']['raw'] = None
-                    self.data['rs_1']['scaled'] = None
-                    self.data['rs_1']['warning'] = 1
-                    self.lcd_objs['rs_1'].set_text('NC')
-                    
-            if self.config["sensors"]["rs_2"]['en']:
-                if rs_2 is not None:
-                    a2 = self.config["sensors"]["rs_2"]["a"]
-                    b2 = self.config["sensors"]["rs_2"]["b"]
-                    self.data['rs_2']['raw'] = round(rs_2, 2)
-                    self.data['rs_2']['scaled'] = round(a2 * rs_2 + b2, 2)
-                    self.data['rs_2']['warning'] = 0
-                    self.lcd_objs['rs_2'].set_text(f'{self.data["rs_2"]["scaled"]}')
-                    if self.config["sensors"]['rs_2']["high_th"] and self.data['rs_2']["scaled"] > float(self.config["sensors"]['rs_2']["high_th"]):
-                        self.add_sim800_job('send_alarm_sms', 'rs_2', True)
-                        self.data['rs_2']['warning'] = 2
-                        
-                    if self.config["sensors"]['rs_2']["low_th"] and self.data['rs_2']["scaled"] < float(self.config["sensors"]['rs_2']["low_th"]):
-                        self.add_sim800_job('send_alarm_sms', 'rs_2', False)
-                        self.data['rs_2']['warning'] = 3
-                else:
-                    self.data['rs_2']['raw'] = None
-                    self.data['rs_2']['scaled'] = None
-                    self.data['rs_2']['warning'] = 1
-                    self.lcd_objs['rs_2'].set_text('NC')
-        except Exception as e:
-            print_colored(f"Exception from rs485 handle:", Cyan)
-            print_exception(e)
+            self._init_sd()
         finally:
-            self.uart_lock = False
-            self.last_rs485_update = time()
-            self.rs485_update_running = False
-            self.lcd_objs['rs_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
+            self.spi_bus.release()
     
-    def init_sd(self):
-        print_colored('Init sd card')
-        while self.spi_lock:
-            sleep_ms(100)
-        self.spi_lock = True
+    def _init_sd(self):
         spi2.init(baudrate=1320000, phase=0)
         
         try:
@@ -1219,22 +3197,20 @@ class App:
             self.sd_available = True
             self.data['sd_warning'] = 0
         except:
-            print_colored('no sdcard detected')
+            log.warn('no sdcard detected')
             self.sd_available = False
-            self.spi_lock = False
             self.data['sd_warning'] = 1
             return
         
         ls = os.listdir('/')
         if 'sd' not in ls:
-            print_colored('SD not mounted, trying to mount sd...')
+            log.warn('SD not mounted, trying to mount sd...')
             try:
                 os.mount(sd, '/sd')
-                print_colored('Done')
+                log.info('Done')
             except:
-                print_colored('failed to mount sd')
+                log.warn('failed to mount sd')
                 self.sd_available = False
-                self.spi_lock = False
                 self.data['sd_warning'] = 1
                 return
         
@@ -1247,133 +3223,119 @@ class App:
             result, msg = check_config(config)
             if result:
                 save_config(config)
-                print_colored('loaded config from sd card')
+                log.info('loaded config from sd card')
                 try:
                     os.remove('/sd/config.json')
                 except Exception as e:
-                    print_colored('failed to remove config file on sd')
-                    print_exception(e)
+                    log.warn('failed to remove config file on sd')
+                    log.exc(e)
             else:
-                print_colored(f'config on sd is invalid: {msg}')
+                log.warn(f'config on sd is invalid: {msg}')
         elif 'device_config.json' not in ls:
             config = load_config()
             with open('/sd/device_config.json', 'w') as f:
                 json.dump(config, f)
-            print_colored('saved config on sd card')
+            log.info('saved config on sd card')
         if 'data' not in ls:
-            print_colored('Creating "data" directory...')
+            log.info('Creating "data" directory...')
             try:
                 os.mkdir('/sd/data')
-                print_colored('Done')
-            except:
-                print_colored('failed')
-                self.sd_available = False
-                self.spi_lock = False
-                self.data['sd_warning'] = 1
-                return
-        
-        ls = os.listdir('/sd/data')
-        if 'raw' not in ls:
-            print_colored('Creating "raw" directory...')
-            try:
-                os.mkdir('/sd/data/raw')
-                print_colored('Done')
+                log.info('Done')
             except:
-                print_colored('failed')
+                log.warn('failed')
                 self.sd_available = False
-                self.spi_lock = False
                 self.data['sd_warning'] = 1
                 return
-        
-        if 'scaled' not in ls:
-            print_colored('Creating "scaled" directory...')
+    
+    def init_syslog(self):
+        cfg = self.config['log']
+        log.level = _log_levels.index(cfg.get('level', 'info'))
+        log.echo = bool(cfg.get('echo', 1))
+    
+    def init_log_writer(self):
+        sensors = self.config['sensors']
+        cols = self.config['sensor_list']
+        fmt = LogFormat(cols, [(float(sensors[s]['a']), float(sensors[s]['b'])) for s in cols],
+                        [name for name in cols if self.readings.is_wide(name)])
+        self.log_writer = LogWriter(fmt, '/sd/data',
+                                    int(self.config['log'].get('flush_records', _log_flush_records)),
+                                    int(self.config['log'].get('flush_interval', _log_flush_interval)),
+                                    self.scheduler.now)
+    
+    def flush_log(self, close=False):
+        if not self.sd_available or not self.log_writer.count and not close:
+            return
+        if not self.spi_bus.acquire('log'):
+            return
+        try:
+            spi2.init(baudrate=1320000, phase=0)
+            self.log_writer.flush()
+            if close:
+                self.log_writer.close_file()
+        except Exception as e:
+            log.error(f"Exception from flush_log:")
+            log.exc(e)
+        finally:
+            self.spi_bus.release()
+    
+    def check_log_flush(self):
+        if self.log_writer.due():
+            self.flush_log()
+        if log.pending() >= _syslog_batch:
+            self.flush_syslog()
+    
+    def flush_syslog(self):
+        if not self.sd_available or not log.pending():
+            return
+        if not self.spi_bus.acquire('syslog'):
+            return
+        try:
+            spi2.init(baudrate=1320000, phase=0)
             try:
-                os.mkdir('/sd/data/scaled')
-                print_colored('Done')
-            except:
-                print_colored('failed')
-                self.sd_available = False
-                self.spi_lock = False
-                self.data['sd_warning'] = 1
-                return
-        self.spi_lock = False
+                size = os.stat('/sd/syslog.txt')[6]
+            except OSError:
+                size = 0
+            if size > _syslog_max:
+                if 'syslog.old' in os.listdir('/sd'):
+                    os.remove('/sd/syslog.old')
+                os.rename('/sd/syslog.txt', '/sd/syslog.old')
+            log.flush('/sd/syslog.txt')
+        except Exception as e:
+            log.error("Exception from flush_syslog:")
+            log.exc(e)
+        finally:
+            self.spi_bus.release()
+    
+    def shutdown(self):
+        log.info('flushing buffers before reset')
+        self.flush_log(close=True)
+        self.flush_syslog()
 
     def log_data(self):
-        print_colored('logging data to sd', Cyan)
+        log.debug('logging data to sd')
         if not self.time_set:
-            print_colored('Time not set', Cyan)
-            self.last_sd_log = time()
+            log.warn('Time not set')
             return
-        self.lcd_objs['sd_th'].set_style_text_color(lv_green, 0)
-        self.sd_log_running = True
+        self.display.color('sd_th', lv_green)
         try:
-            while self.spi_lock:
-                sleep_ms(100)
-            self.spi_lock = True
-            spi2.init(baudrate=1320000, phase=0)
-            
             tm = rtc.datetime()
-            raw_filename = f'/sd/data/raw/{tm[0]}-{tm[1]:02d}-{tm[2]:02d}.csv'
-            scaled_filename = f'/sd/data/scaled/{tm[0]}-{tm[1]:02d}-{tm[2]:02d}.csv'
-            try:
-                f = open(raw_filename)
-                f.close()
-            except:
-                with open(raw_filename, 'w') as f:
-                    f.write("timestamp")
-                    for sensor in self.config['sensor_list']:
-                        f.write(f',{sensor}')
-                    f.write('\r\n')
-            
-            try:
-                f = open(scaled_filename)
-                f.close()
-            except:
-                with open(scaled_filename, 'w') as f:
-                    f.write("timestamp")
-                    for sensor in self.config['sensor_list']:
-                        f.write(f',{sensor}')
-                    f.write('\r\n')
-            
-            raw_file = open(raw_filename, 'a')
-            scaled_file = open(scaled_filename, 'a')
+            day = (tm[0], tm[1], tm[2])
+            writer = self.log_writer
+            if writer.pending(day):
+                self.flush_log()
             
-            raw_file.write(f'{tm[0]}-{tm[1]:02d}-{tm[2]:02d} {tm[4]:02d}:{tm[5]:02d}')
-            scaled_file.write(f'{tm[0]}-{tm[1]:02d}-{tm[2]:02d} {tm[4]:02d}:{tm[5]:02d}')
-            thread_lock.acquire()
-            for sensor in self.config['sensor_list']:
-                
-                if sensor in self.data:
-                    if self.data[sensor]["raw"] is not None:
-                        raw_file.write(f',{self.data[sensor]["raw"]:.2f}')
-                    else:
-                        raw_file.write(',')
-                        
-                    if self.data[sensor]["scaled"] is not None:
-                        scaled_file.write(f',{self.data[sensor]["scaled"]:.2f}')
-                    else:
-                        scaled_file.write(',')
-                else:
-                    raw_file.write(',')
-                    scaled_file.write(',')
-                    
-            thread_lock.release()
+            with thread_lock:
+                values = [self.readings.get_raw(sensor) for sensor in writer.fmt.columns]
+            writer.add(day, time(), values)
             
-            raw_file.write('\r\n')
-            scaled_file.write('\r\n')
-            raw_file.close()
-            scaled_file.close()
-            print_colored('done', Cyan)
+            if writer.due():
+                self.flush_log()
+            log.debug('done, %s buffered', writer.count)
         except Exception as e:
-            print_colored(f"Exception from log_data:", Cyan)
-            print_exception(e)
+            log.error(f"Exception from log_data:")
+            log.exc(e)
         finally:
-            self.last_sd_log = time()
-            self.sd_log_running = False
-            self.spi_lock = False
-            self.lcd_objs['sd_th'].set_style_text_color(lv_white, 0)
-            if thread_lock.locked():
-                thread_lock.release()
+            self.display.color('sd_th', lv_white)
     
     def generate_data_sms(self):
         tm = rtc.datetime()
@@ -1387,14 +3349,16 @@ class App:
                     break
             else:
                 break
-            if self.data[sensor]["scaled"] is not None:
-                data_sms += f',{self.data[sensor]["scaled"]:.2f}'
+            scaled = self.readings.get_scaled(sensor)
+            if scaled is not None:
+                data_sms += f',{scaled:.2f}'
             else:
                 data_sms += ','
                 
             if self.config['sensors'][sensor]['sms_raw']:
-                if self.data[sensor]["raw"] is not None:
-                    data_sms += f'({self.data[sensor]["raw"]:.2f})'
+                raw = self.readings.get_raw(sensor)
+                if raw is not None:
+                    data_sms += f'({raw:.2f})'
                 else:
                     data_sms += '()'
             idx += 1
@@ -1402,165 +3366,134 @@ class App:
             data_sms += f',{round(self.data["bat"], 2)}'
         return data_sms
     
-    def switch_uart_to(self, dst):
-        while uart.any():
-            uart.read()
-        if dst == 'sim800':
-            print_colored('switch uart to sim800')
-            if self.uart_tx == _sim800_tx and self.uart_rx == _sim800_rx:
-                print_colored('already on sim800')
-                return
-            machine.Pin(self.uart_tx, machine.Pin.OUT, value=1)
-            machine.Pin(self.uart_rx, machine.Pin.OUT, value=1)
-            uart.init(115200, tx=_sim800_tx, rx=_sim800_rx, rxbuf=2048)
-            self.uart_tx = _sim800_tx
-            self.uart_rx = _sim800_rx
-            print_colored(f'switched to sim800 {self.uart_tx} {self.uart_rx} 115200')
-            while uart.any():
-                uart.read()
-        elif dst == 'rs485':
-            print_colored('switch to rs485')
-            if self.uart_tx == _rs485_tx and self.uart_rx == _rs485_rx:
-                print_colored('already on rs485')
-                return
-            machine.Pin(self.uart_tx, machine.Pin.OUT, value=1)
-            machine.Pin(self.uart_rx, machine.Pin.OUT, value=1)
-            uart.init(_rs485_baud, tx=_rs485_tx, rx=_rs485_rx)
-            self.uart_tx = _rs485_tx
-            self.uart_rx = _rs485_rx
-            print_colored(f'switched to rs485 {self.uart_tx} {self.uart_rx} {_rs485_baud}')
-            
     def init_modem(self):
         try:
-            print_colored('check modem', Yellow)
+            log.debug('check modem')
             
             modem.check_reg()
-            print_colored('modem is initialized', Yellow)
+            log.debug('modem is initialized')
             return True
         except:
             try:
-                print_colored('initializing modem', Yellow)
-                
+                log.info('initializing modem')
+                self.gprs.invalidate()
                 modem.initialize()
                 return True
             except:
-                print_colored('failed to initialize modem', Yellow)
+                log.warn('failed to initialize modem')
                 return False
     
     def reset_timestamps(self):
-        self.last_prcip_update = time()
-        self.last_sdi12_update = time()
-        self.last_pt100_update = time()
-        self.last_rs485_update = time()
-        self.last_update_check = time()
-        self.last_ais_update   = time()
-        self.last_sms_check    = time()
-        self.last_data_post    = time()
-        self.last_get_time     = time()
-        self.last_data_sms     = time()
-        self.last_sd_log       = float('-inf')
-        self.last_loc_request  = time()
+        # the scheduler runs on its own monotonic clock, a new rtc time
+        # keeps every task's phase; only the log waits on time_set
+        self.scheduler.trigger('log')
     
     def get_time(self, *args):
-        print_colored('getting time', Yellow)
-        if not self.config['gprs']['server']:
-            self.last_get_time = time()
-            print_colored('no server set', Yellow)
+        log.info('getting time')
+        if self.sms_time_set:
+            log.info('time already set by sms')
             return
         for _ in range(3):
             try:
                 
-                modem.connect(self.config['gprs']['apn'])
+                self.gprs.connect(self.config['gprs']['apn'])
                 
                 result = modem.http_request(f'{self.config["gprs"]["server"]}/ahv_rtu/settings2.php?co={self.config["device_id"]}')
                 
-                modem.disconnect()
+                self.gprs.release()
                 
                 if result.status_code == 200:
                     tm = list(map(int, result.content.split(',')))
                     rtc.datetime(tm)
                     self.create_old_percip_record()
                     self.time_set = True
-                    print_colored(f'done {tm}', Yellow)
-                    self.last_get_time = time()
+                    log.info(f'done {tm}')
                     self.reset_timestamps()
                     break
             except Exception as e:
-                print_colored("Exception from get_time:", Yellow)
-                print_exception(e)
+                log.error("Exception from get_time:")
+                log.exc(e)
+                self.gprs.close()
+        else:
+            self.scheduler.trigger('get_time', _gprs_retry_interval)
                 
     def get_location(self, *args):
-        print_colored('getting location', Yellow)
+        log.info('getting location')
         if not self.config['gprs']['server']:
-            print_colored('no server set', Yellow)
+            log.info('no server set')
             return
         eng_data = modem.get_eng_data()
 #         eng_data = {'mccii': '432', 'mnc': '35', 'cellid': '5268', 'lac': '7747'}
         for _ in range(3):
             try:
-                modem.connect(self.config['gprs']['apn'])
+                self.gprs.connect(self.config['gprs']['apn'])
                 result = modem.http_request(f'{self.config["gprs"]["server"]}/ahv_rtu/gps3.php', mode='POST', data=json.dumps(eng_data))
-                modem.disconnect()
+                self.gprs.release()
                 if result.status_code == 200:
                     self.data['location'] = json.loads(result.content)
-                    print_colored(f'done {self.data["location"]}', Yellow)
+                    log.info(f'done {self.data["location"]}')
                     if self.data['location']['lat'] is not None:
-                        self.lcd_objs['lat'].set_text(f'{self.data["location"]["lat"]}')
-                        self.lcd_objs['lon'].set_text(f'{self.data["location"]["lon"]}')
-                        self.lcd_objs['rad'].set_text(f'{self.data["location"]["radius"]}')
+                        self.display.text('lat', f'{self.data["location"]["lat"]}')
+                        self.display.text('lon', f'{self.data["location"]["lon"]}')
+                        self.display.text('rad', f'{self.data["location"]["radius"]}')
                     break
             except Exception as e:
-                print_colored("Exception from get_location:", Yellow)
-                print_exception(e)
+                log.error("Exception from get_location:")
+                log.exc(e)
+                self.gprs.close()
     
     def check_for_sms(self, *args):
-        print_colored('checking sms command...', Yellow)
+        log.debug('checking sms command...')
                 
         for i in range(1, 16):
             
             try:
                 number, msg = modem.read_sms(i)
             except:
-                self.last_sms_check = time()
                 return
             
             modem.delete_sms(i)
             
             if '#stat' in msg:
-                print_colored('stat sms received', Yellow)
+                log.info('stat sms received')
                 sms_data = self.generate_data_sms()
                 modem.send_sms(number, sms_data)
                 
             elif '#gp' in msg:
-                print_colored('post sms received', Yellow)
-                self.add_sim800_job('post_data', ())
+                log.info('post sms received')
+                self.add_sim800_job('post_data')
             
             elif '#qu' in msg:
-                print_colored('csq sms received', Yellow)
+                log.info('csq sms received')
                 csq = modem.get_signal_strength()
                 modem.send_sms(number, f'{csq}')
                 
             elif '#reset' in msg:
-                print_colored('reset sms received', Yellow)
+                log.info('reset sms received')
+                self.shutdown()
                 sleep(1)
                 machine.reset()
                 
             elif '#update' in msg:
-                print_colored('update sms received', Yellow)
-                self.add_sim800_job('check_update', ())
+                log.info('update sms received')
+                self.add_sim800_job('check_update')
             
             elif '#zero' in msg:
-                print_colored('zero percip sms received', Yellow)
+                log.info('zero percip sms received')
                 self.zero_db()
             
             elif '#balance' in msg:
-                print_colored('check balance sms received', Yellow)
+                log.info('check balance sms received')
                 modem.ussd_code("*555*4*3*2#")
                 result = modem.ussd_code("*555*1*2#")
                 modem.send_sms(number, result)
+            
+            elif '#log' in msg:
+                log.info('log sms received')
+                modem.send_sms(number, log.recent(_log_sms_chars))
 
             elif '007B0022006C006100740022' in msg:
-                print_colored('location sms received', Yellow)
+                log.info('location sms received')
                 try:
                     while '00' in msg:
                         msg = msg.replace('00', '')
@@ -1569,7 +3502,7 @@ class App:
                         loc += chr(int(msg[2*i:2*i+2], 16))
                         
                     loc = json.loads(loc)
-                    print_colored(loc, Yellow)
+                    log.info(loc)
                     if 'ts' in loc:
                         rtc.datetime(list(map(int, loc['ts'].split(','))))
                         self.create_old_percip_record()
@@ -1579,277 +3512,378 @@ class App:
                     thread_lock.acquire()
                     self.data['location'] = {'lat':loc['lat'], 'lon':loc['lon']}
                     thread_lock.release()
-                    print_colored(self.data['location'], Yellow)
-                    self.add_sim800_job('send_gps_sms', ())
-                    self.lcd_objs['lat'].set_text(f'{self.data["location"]["lat"]}')
-                    self.lcd_objs['lon'].set_text(f'{self.data["location"]["lon"]}')
+                    log.info(self.data['location'])
+                    self.add_sim800_job('send_gps_sms')
+                    self.display.text('lat', f'{self.data["location"]["lat"]}')
+                    self.display.text('lon', f'{self.data["location"]["lon"]}')
                 except Exception as e:
-                    print_colored('Failed parsing gps sms', Yellow)
-                    print_exception(e)
-                    self.last_sms_check = time()
+                    log.warn('Failed parsing gps sms')
+                    log.exc(e)
                     if thread_lock.locked():
                         thread_lock.release()
           
     def post_data(self, *args):
-        print_colored('Posting data', Yellow)
+        log.info('Posting data')
         if not self.config['gprs']['server']:
-            self.last_data_post = time()
-            print_colored('no server set', Yellow)
+            log.info('no server set')
             return
-        thread_lock.acquire()
-        self.data['timestamp'] = time() + 946672200
-        unenc_data = bytearray(json.dumps(self.data))
-        thread_lock.release()
-#         print(f'not encrypted data: {unenc_data}')
-        
-        key = ubinascii.unhexlify(self.config['enc']['key'])
-        iv = mpyaes.generate_IV(16)
-        aes = mpyaes.new(key, mpyaes.MODE_CBC, iv)
-        aes.encrypt(unenc_data)
-#         print(f'encrypted data: {unenc_data}')
-        
-        unenc_data = ubinascii.hexlify(iv + unenc_data)
-        
-        modem.connect(self.config['gprs']['apn'])
-        
-        result = modem.http_request(f"{self.config['gprs']['server']}/ahv_rtu/getdata_p2.php", mode='POST', data=f'data={unenc_data.decode()}', content_type='application/x-www-form-urlencoded')
-        
-        modem.disconnect()
-        if result.status_code == 200:
-            print_colored('done', Yellow)
-            self.last_data_post = time()
-        else:
-            raise Exception("http request unsuccessful")
+        sealer = self.sealer.open()
+        with thread_lock:
+            self.data['timestamp'] = time() + 946672200
+            mask = None
+            if self.delta is not None and not self.delta.select(self.readings, self.outbox.dropped):
+                mask = self.delta.mask
+            if self.compact is not None:
+                sealer.write(self.compact.pack(self.data['timestamp'], self.readings, self.data, mask))
+                payload = None
+            else:
+                payload = self.readings.export(dict(self.data), mask)
+                if mask is not None:
+                    payload['delta'] = 1
+        if mask is not None:
+            log.info(f'delta post: {sum(mask)} of {len(mask)} sensors')
+        
+        if payload is not None:
+            json.dump(payload, sealer)
+            del payload
+        self.outbox.put(sealer.close())
+        log.info(f'outbox: {len(self.outbox)} records, {self.outbox.dropped} dropped')
+        self.flush_outbox()
+    
+    def flush_outbox(self, *args):
+        # records go up oldest first as data=<hex>,<hex>,... ; a 200 reply
+        # whose body is 'ack=<n>' acks the n leading records (clamped to the
+        # batch), any other 200 reply acks the whole batch
+        batch = int(self.config['gprs'].get('batch', _outbox_batch))
+        for _ in range(_outbox_max_batches):
+            if not len(self.outbox):
+                return
+            paths = self.outbox.paths(batch)
+            if self.compact is not None:
+                # compact payloads leave the device id out, it goes once per batch
+                body = self.form_body.build(paths, True, b'id=' + self.config['device_id'].encode() + b'&')
+            else:
+                body = self.form_body.build(paths)
+            self.gprs.connect(self.config['gprs']['apn'])
+            try:
+                result = modem.http_request(f"{self.config['gprs']['server']}/ahv_rtu/getdata_p2.php", mode='POST', data=body, content_type='application/x-www-form-urlencoded')
+            finally:
+                self.gprs.release()
+            del body
+            if result.status_code != 200:
+                self.scheduler.trigger('outbox', _gprs_retry_interval)
+                raise Exception("http request unsuccessful")
+            acked = len(paths)
+            reply = result.content
+            if isinstance(reply, bytes):
+                reply = reply.decode()
+            reply = reply.strip()
+            if reply.startswith('ack='):
+                try:
+                    acked = min(max(int(reply[4:]), 0), len(paths))
+                except ValueError:
+                    log.warn(f'bad ack reply {reply}')
+                    acked = 0
+            self.outbox.ack(acked)
+            log.info(f'uploaded {acked} of {len(paths)} records, {len(self.outbox)} left')
+            if acked == 0:
+                self.scheduler.trigger('outbox', _gprs_retry_interval)
+                return
+        if len(self.outbox):
+            # this job's key is queued until the handler removes it, so a
+            # new flush_outbox job would be deduped; the outbox task queues it
+            self.scheduler.trigger('outbox')
+    
+    def check_outbox(self):
+        if len(self.outbox):
+            self.add_sim800_job('flush_outbox')
 
         
     def send_data_sms(self, *args):
-        print_colored('sending data sms', Yellow)
+        log.info('sending data sms')
         data = self.generate_data_sms()
         
         if self.config['sms']['phone_1']:
-            print_colored('to phone #1', Yellow)
+            log.info('to phone #1')
             modem.send_sms(self.config['sms']['phone_1'], data)
-            print_colored('done', Yellow)
+            log.info('done')
         sleep(1)
         if self.config['sms']['phone_2']:
-            print_colored('to phone #2', Yellow)
+            log.info('to phone #2')
             modem.send_sms(self.config['sms']['phone_2'], data)
-            print_colored('done', Yellow)
-
-        self.last_data_sms = time()
+            log.info('done')
     
     def check_update(self, *args):
-        print_colored('checking for update', Yellow)
+        log.info('checking for update')
         if not self.config['gprs']['server']:
-            self.last_update_check = time()
-            print_colored('no server set', Yellow)
-            self.lcd_objs['status'].set_text("Server not set")
+            log.info('no server set')
+            self.display.text('status', "Server not set")
             return
         for _ in range(3):
-            modem.connect(self.config['gprs']['apn'])
+            self.gprs.connect(self.config['gprs']['apn'])
             result = modem.http_request(f'{self.config["gprs"]["server"]}/ahv_rtu2/version.php')
             try:
                 new_version = float(result.content)
             except:
                 new_version = 0
             if new_version <= _firmware_version:
-                self.lcd_objs['status'].set_text("No updates found")
-                print_colored('no update found', Yellow)
-                modem.disconnect()
+                self.display.text('status', "No updates found")
+                log.info('no update found')
+                self.gprs.release()
                 break
-            print_colored(f'new version found: {new_version}', Yellow)
-            self.lcd_objs['status'].set_text(f"update found {new_version}")
-            result = modem.download(f'{self.config["gprs"]["server"]}/ahv_rtu2/main_{new_version}.bin', f'main_{new_version}.py', lcd_obj=self.lcd_objs['status'])
+            log.info(f'new version found: {new_version}')
+            self.display.text('status', f"update found {new_version}")
+            result = modem.download(f'{self.config["gprs"]["server"]}/ahv_rtu2/main_{new_version}.bin', f'main_{new_version}.py',
+                                    lcd_obj=DisplayLine(self.display, 'status'))
             
-            modem.disconnect()
+            self.gprs.release()
             if result.status_code == 200:
                 update_info = {'old_version':_firmware_version,
                                'del_old_file': False,
                                'new_version':new_version}
                 with open('/update.json', 'w') as f:
                     json.dump(update_info, f)
-                print_colored('restarting to apply update', Yellow)
-                self.lcd_objs['status'].set_text("restarting to apply update")
+                log.info('restarting to apply update')
+                self.display.text('status', "restarting to apply update")
+                self.gprs.close()
+                self.shutdown()
                 sleep(1)
                 machine.reset()
-        self.last_update_check = time()
 
         
     def send_loc_request_sms(self, *args):
-        print_colored('sending location request sms', Yellow)
+        log.info('sending location request sms')
 
         cell_info = modem.get_eng_data()
         
         modem.send_sms("30004505003188", json.dumps(cell_info))
-        print_colored('done', Yellow)
+        log.info('done')
         self.loc_request_sms_sent = True
     
-    def send_alarm_sms(self, sensor, is_high):
-        print_colored(f'sending alarm sms for {sensor}', Yellow)
+    def send_alarm_sms(self, sensor, state):
+        if self.alarms.pending(sensor) != state:
+            log.info(f'alarm sms for {sensor} superseded')
+            return
+        log.info(f'sending alarm sms for {sensor}')
         tm = rtc.datetime()
-        text = f"{tm[4]:02d}:{tm[5]:02d}:{tm[6]:02d}: {self.config['device_id']} -> Alarm! {self.config['sensors'][sensor]['disp_name']}'s " + \
-               f"value is {self.data[sensor]['scaled']} and is {'higher' if is_high else 'lower'} than it's {'high' if is_high else 'low'} " + \
-               f"threshold: {self.config['sensors'][sensor]['high_th'] if is_high else self.config['sensors'][sensor]['low_th']}"
-        txt = self.lcd_objs['status'].get_text()
+        if state == _alarm_ok:
+            text = f"{tm[4]:02d}:{tm[5]:02d}:{tm[6]:02d}: {self.config['device_id']} -> Cleared. {self.config['sensors'][sensor]['disp_name']}'s " + \
+                   f"value is {self.readings.get_scaled(sensor)} and is back within it's thresholds"
+        else:
+            is_high = state == _alarm_high
+            text = f"{tm[4]:02d}:{tm[5]:02d}:{tm[6]:02d}: {self.config['device_id']} -> Alarm! {self.config['sensors'][sensor]['disp_name']}'s " + \
+                   f"value is {self.readings.get_scaled(sensor)} and is {'higher' if is_high else 'lower'} than it's {'high' if is_high else 'low'} " + \
+                   f"threshold: {self.config['sensors'][sensor]['high_th'] if is_high else self.config['sensors'][sensor]['low_th']}"
+        txt = self.display.current('status')
+        sent = True
         if self.config['sms']['phone_1']:
             for _ in range(3):
                 try:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1")
-                    print_colored('to phone_1', Yellow)
+                    self.display.text('status', f"{txt}phone_1")
+                    log.info('to phone_1')
                     modem.send_sms(self.config['sms']['phone_1'], text)
-                    print_colored('done', Yellow)
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1 done")
+                    log.info('done')
+                    self.display.text('status', f"{txt}phone_1 done")
                     break
                 except Exception as e:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1 fail")
-                    print_colored('failed', Yellow)
-                    print_exception(e)
+                    self.display.text('status', f"{txt}phone_1 fail")
+                    log.warn('failed')
+                    log.exc(e)
+            else:
+                sent = False
         
         sleep(1)
         if self.config['sms']['phone_2']:
             for _ in range(3):
                 try:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2")
-                    print_colored('to phone_2', Yellow)
+                    self.display.text('status', f"{txt}phone_2")
+                    log.info('to phone_2')
                     modem.send_sms(self.config['sms']['phone_2'], text)
-                    print_colored('done', Yellow)
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2 done")
+                    log.info('done')
+                    self.display.text('status', f"{txt}phone_2 done")
                     break
                 except Exception as e:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2 fail")
-                    print_colored('failed', Yellow)
-                    print_exception(e)
-        self.lcd_objs['status'].set_text(txt)
+                    self.display.text('status', f"{txt}phone_2 fail")
+                    log.warn('failed')
+                    log.exc(e)
+            else:
+                sent = False
+        self.display.text('status', txt)
+        if sent:
+            self.alarms.delivered(sensor, state)
+        else:
+            log.warn(f'alarm sms for {sensor} not delivered, retrying in {_alarm_retry_interval} s')
+    
+    def retry_alarms(self):
+        for sensor, state in self.alarms.undelivered():
+            self.add_sim800_job('send_alarm_sms', sensor, state)
+    
     def send_gps_sms(self, *args):
-        print_colored('sending gps sms', Yellow)
+        log.info('sending gps sms')
         data = self.generate_data_sms()
         data += f',{self.data["location"]["lat"]},{self.data["location"]["lon"]}'
         
-        txt = self.lcd_objs['status'].get_text()
+        txt = self.display.current('status')
         if self.config['sms']['phone_1']:
             for _ in range(3):
                 try:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1")
-                    print_colored('to phone_1', Yellow)
+                    self.display.text('status', f"{txt}phone_1")
+                    log.info('to phone_1')
                     modem.send_sms(self.config['sms']['phone_1'], data)
-                    print_colored('done', Yellow)
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1 done")
+                    log.info('done')
+                    self.display.text('status', f"{txt}phone_1 done")
                     break
                 except Exception as e:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_1 fail")
-                    print_colored('failed', Yellow)
-                    print_exception(e)
+                    self.display.text('status', f"{txt}phone_1 fail")
+                    log.warn('failed')
+                    log.exc(e)
         sleep(1)
         if self.config['sms']['phone_2']:
             for _ in range(3):
                 try:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2")
-                    print_colored('to phone_2', Yellow)
+                    self.display.text('status', f"{txt}phone_2")
+                    log.info('to phone_2')
                     modem.send_sms(self.config['sms']['phone_2'], data)
-                    print_colored('done', Yellow)
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2 done")
+                    log.info('done')
+                    self.display.text('status', f"{txt}phone_2 done")
                     break
                 except Exception as e:
-                    self.lcd_objs['status'].set_text(f"{txt}phone_2 fail")
-                    print_colored('failed', Yellow)
-                    print_exception(e)
-        self.lcd_objs['status'].set_text(txt)
+                    self.display.text('status', f"{txt}phone_2 fail")
+                    log.warn('failed')
+                    log.exc(e)
+        self.display.text('status', txt)
     def add_sim800_job(self, name, *args):
-        job = Job(name, getattr(self, name), args)
-        if job not in self.sim800_jobs:
-            self.sim800_jobs.append(job)
+        prio, ttl = _job_classes.get(name, (_prio_update, None))
+        now = self.scheduler.now()
+        job = Job(name, getattr(self, name), args, prio, now, None if ttl is None else now + ttl * 1000)
+        if self.sim800_jobs.push(job):
+            self.scheduler.trigger('sim800')
     
-    def update_bat(self):
-        tmp = 0
-        for _ in range(10):
-            tmp += bat.read_uv()
-            sleep_ms(10)
-        tmp /= 10
-        tmp *= 0.00000475
-        
-        self.bat_label.set_text(f"{tmp:.2f} v")
-        print_colored(f'battery voltage : {tmp}', Cyan)
+    def update_bat(self, tmp):
+        self.display.text('battery', f"{tmp:.2f} v")
+        log.debug('battery voltage : %s', tmp)
         thread_lock.acquire()
         self.data['bat'] = tmp
         thread_lock.release()
     
+    def init_readings(self):
+        names = []
+        wide = []
+        for driver in self.drivers.values():
+            names.extend(driver.channels)
+            wide.extend(driver.wide)
+        self.readings = Readings(names, self.config['sensors'], wide)
+        for driver in self.drivers.values():
+            driver.slots = self.readings.slots(driver.channels)
+        log.info(f'readings: {len(names)} channels from {len(self.drivers)} drivers')
+    
+    def init_alarms(self):
+        cfg = self.config.get('alarm', {})
+        self.alarms = AlarmEngine(self.config['sensors'],
+                                  int(cfg.get('debounce', _alarm_debounce)),
+                                  int(cfg.get('cooldown', _alarm_cooldown)),
+                                  self.scheduler.now, self.on_alarm)
+        log.info(f'alarms: {len(self.alarms.rows)} sensors with thresholds')
+    
+    def on_alarm(self, sensor, state):
+        log.info(f'alarm {sensor}: {("clear", "", "high", "low")[state]}')
+        self.add_sim800_job('send_alarm_sms', sensor, state)
+    
+    def init_outbox(self):
+        self.outbox = Outbox('/outbox', int(self.config['gprs'].get('backlog', _outbox_backlog)))
+        if self.config['gprs'].get('format', 'json') == 'compact':
+            cols = self.config['sensor_list']
+            self.compact = CompactPayload(cols, [name for name in cols if self.readings.is_wide(name)])
+            payload = len(self.compact.buf)
+        else:
+            payload = _json_base_bytes + _json_sensor_bytes * len(self.readings)
+        # sized once for a full batch so the first posts don't grow them
+        record, body = post_sizes(payload, int(self.config['gprs'].get('batch', _outbox_batch)),
+                                  self.compact is not None)
+        self.sealer = PayloadSealer(ubinascii.unhexlify(self.config['enc']['key']), record + 16)
+        self.form_body = FormBody(body)
+        if self.config['gprs'].get('delta'):
+            self.delta = DeltaFilter(self.readings, self.config['sensors'],
+                                     int(self.config['gprs'].get('keyframe', _delta_keyframe)))
+        log.info(f'post format: {"compact" if self.compact else "json"}{", delta" if self.delta else ""}')
+        log.info(f'outbox: {len(self.outbox)} records pending')
+    
+    def update_metrics(self):
+        self.display.text('metrics', metrics.summary())
+    
+    def request_location(self):
+        if 'location' not in self.data:
+            self.add_sim800_job('get_location')
+        elif self.data['location']['lat'] is None and not self.loc_request_sms_sent:
+            self.add_sim800_job('send_loc_request_sms')
+    
+    def init_tasks(self):
+        s = self.scheduler
+        d = self.drivers
+        if 'percip' in d:
+            s.add('percip', self.poll, _prcip_update_interval, threaded=True, args=(d['percip'],))
+        if 'pt100' in d:
+            s.add('pt100', self.poll, _pt100_update_interval, 2, args=(d['pt100'],))
+        if 'sdi12' in d:
+            s.add('sdi12', self.poll, _sdi12_update_interval, 4, args=(d['sdi12'],))
+            s.add('sdi12_read', self.poll, 0, _sdi12_update_interval, args=(d['sdi12'], True))
+        if 'ais' in d:
+            s.add('ais', self.poll, _ais_update_interval, 6, threaded=True, args=(d['ais'],))
+        if 'rs485' in d:
+            s.add('rs485', self.poll, _rs485_update_interval, 8, args=(d['rs485'],))
+        if self.sd_available:
+            s.add('log', self.log_data, int(self.config['log']['interval']), 10, threaded=True)
+            s.add('log_flush', self.check_log_flush, 60, 40)
+        
+        if self.config['gprs']['server']:
+            s.add('get_time', self.add_sim800_job, _get_time_interval, args=('get_time',))
+            s.add('location', self.request_location, _location_interval)
+            s.add('post', self.add_sim800_job, int(self.config['gprs']['interval']), 20, args=('post_data',))
+            s.add('outbox', self.check_outbox, _outbox_retry_interval, 40)
+        s.add('sms_check', self.add_sim800_job, _sms_check_interval, 15, args=('check_for_sms',))
+        s.add('alarm_retry', self.retry_alarms, _alarm_retry_interval, 45)
+        if self.config['sms']['phone_1'] or self.config['sms']['phone_2']:
+            s.add('data_sms', self.add_sim800_job, int(self.config['sms']['interval']), 25, args=('send_data_sms',))
+        s.add('sim800', self.sim800_handler, _sim800_poll_interval, 1)
+        s.add('gprs_idle', self.close_idle_gprs, 0, _gprs_idle_timeout)
+        s.add('metrics', self.update_metrics, _metrics_interval, 50)
+    
     def loop(self):
         while True:
             feed_wdt()
             try:
-                self.update_bat()
-                if self.config['sensors']['ra']['en']:
-                    if not self.prcip_update_running and time() - self.last_prcip_update > _prcip_update_interval:
-                        _thread.start_new_thread(self.update_percip, ())
-                
-                if self.config['sensors']['pt']['en']:
-                    if not self.pt100_update_running and time() - self.last_pt100_update > _pt100_update_interval:
-                        self.update_pt100()
-                
-                if self.config['sdi12']['en']:
-                    if not self.sdi12_update_running and time() - self.last_sdi12_update > _sdi12_update_interval:
-                        self.update_sdi()
-                
-                if not self.ais_update_running and time() - self.last_ais_update > _ais_update_interval:
-                    _thread.start_new_thread(self.update_ais, ())
-                
-                if self.config['rs485']['en']:
-                    if not self.rs485_update_running and time() - self.last_rs485_update > _rs485_update_interval:
-                        self.update_rs485()
-                
-                if self.sd_available:
-                    if not self.sd_log_running and time() - self.last_sd_log > int(self.config['log']['interval']):
-                        _thread.start_new_thread(self.log_data, ())
-                
-                if not self.sms_time_set:
-                    if time() - self.last_get_time > _get_time_interval:
-                        self.add_sim800_job('get_time', ())
-                
-                if 'location' not in self.data:
-                    self.add_sim800_job('get_location', ())
-                
-                if time() - self.last_sms_check > _sms_check_interval:
-                    self.add_sim800_job('check_for_sms', ())
-                
-                if self.config['gprs']['server']:
-                    if time() - self.last_data_post > int(self.config['gprs']['interval']):
-                        self.add_sim800_job('post_data', ())
-                        
-                if self.config['sms']['phone_1'] or self.config['sms']['phone_2']:
-                    if time() - self.last_data_sms > int(self.config['sms']['interval']):
-                        self.add_sim800_job('send_data_sms', ())
-                
-                if ('location' not in self.data or ('location' in self.data and self.data['location']['lat'] is None)):
-                    if Job('get_location', None, ()) not in self.sim800_jobs and not self.loc_request_sms_sent:
-                        self.add_sim800_job('send_loc_request_sms', ())
-                        
-                self.sim800_handler()
+                self.scheduler.run_pending()
+                self.scheduler.idle()
             except KeyboardInterrupt:
                 break
             except Exception as e:
-                print_colored("Exception from main loop:")
-                print_exception(e)
-            finally:
-                sleep(3)
+                log.error("Exception from main loop:")
+                log.exc(e)
+                sleep(1)
 
 feed_wdt()
 print_reset_cause()
-print_colored(f'firmware version: {_firmware_version}')
+log.info(f'firmware version: {_firmware_version}')
 
 main_app = App()
 main_app.init_sd()
 main_app.config = load_config()
 result, msg = check_config(main_app.config)
 if not result:
-    print_colored(f'config invalid: {msg}')
+    log.warn(f'config invalid: {msg}')
     while True:
         feed_wdt()
         sleep(1)
 main_app.data['device_id'] = main_app.config['device_id']
-print_colored('config loaded successfully')
+log.info('config loaded successfully')
+main_app.init_syslog()
 ap.config(essid=main_app.config['device_id'])
 main_app.init_display()
 main_app.init_sensors()
 main_app.init_percip_db()
+main_app.init_alarms()
+main_app.init_outbox()
+main_app.init_log_writer()
+main_app.init_tasks()
 
 main_app.loop()
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Host benchmark: PercipStore ring vs the btree code it replaced.
+
+Replays ``--days`` of App.update_percip calls (one every 30 s, random tips)
+through both implementations, checks that the 1h/12h figures agree and
+reports the time spent per update.  Under the unix MicroPython port the real
+``btree`` module is used; under CPython a sorted in-memory stand-in with the
+same access pattern (ordered key enumeration, membership probes) is used.
+
+    python tools/bench_percip.py --days 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import firmware  # noqa: E402
+
+fw = firmware.load('PercipStore', 'roundup')
+INTERVAL = fw['_write_percip_interval']
+UPDATE = fw['_prcip_update_interval']
+
+try:
+    import btree
+except ImportError:
+    btree = None
+
+
+class SortedDB:
+    def __init__(self):
+        self.d = {}
+
+    def __iter__(self):
+        return iter(sorted(self.d))
+
+    def __contains__(self, key):
+        return key in self.d
+
+    def __getitem__(self, key):
+        return self.d[key]
+
+    def __setitem__(self, key, value):
+        self.d[key] = value
+
+    def __delitem__(self, key):
+        del self.d[key]
+
+    def flush(self):
+        pass
+
+
+class BtreePercip:
+    # the update_percip body from before the ring store, minus display/alarms
+    def __init__(self, path):
+        if btree is not None:
+            self.file = open(path, 'w+b')
+            self.db = btree.open(self.file)
+        else:
+            self.file = None
+            self.db = SortedDB()
+        self.tot = 0
+        self.cur = 0
+        self.db[bytes(4)] = bytes(4)
+
+    def update(self, tm, cnt):
+        keys = list(self.db)
+        if len(keys) >= 300:
+            for i in range(10):
+                del self.db[keys[i]]
+            self.db.flush()
+        self.tot += cnt
+        self.cur += cnt
+        if cnt != 0 or tm.to_bytes(4, 'big') not in self.db:
+            self.db[tm.to_bytes(4, 'big')] = self.tot.to_bytes(4, 'big')
+            self.db.flush()
+        result = []
+        for span in (3600, 43200):
+            t = tm - span
+            while tm > t:
+                b_tm = t.to_bytes(4, 'big')
+                if b_tm in self.db:
+                    result.append(self.tot - int.from_bytes(self.db[b_tm], 'big'))
+                    break
+                t += INTERVAL
+            else:
+                result.append(self.cur)
+        return result
+
+
+class RingPercip:
+    def __init__(self, path):
+        self.store = fw['PercipStore'](path)
+        self.tot = self.store.total
+        self.cur = 0
+
+    def update(self, tm, cnt):
+        k = tm // INTERVAL
+        self.tot += cnt
+        self.cur += cnt
+        if cnt != 0 or self.store.at(k) is None:
+            self.store.record(k, self.tot)
+        result = []
+        for span in (3600, 43200):
+            pr = self.store.window(k, span // INTERVAL)
+            result.append(self.cur if pr is None else pr)
+        return result
+
+
+def run(impl, samples):
+    start = time.perf_counter()
+    out = [impl.update(tm, cnt) for tm, cnt in samples]
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    t0 = 843000000
+    n = int(args.days * 86400 / UPDATE)
+    samples = []
+    for i in range(n):
+        cnt = rng.choice((0,) * 20 + (1, 2, 5))
+        samples.append((fw['roundup'](t0 + i * UPDATE), cnt))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t_btree, r_btree = run(BtreePercip(os.path.join(tmp, 'percip.db')), samples)
+        t_ring, r_ring = run(RingPercip(os.path.join(tmp, 'percip.bin')), samples)
+
+    mismatches = sum(1 for a, b in zip(r_btree, r_ring) if a != b)
+    print(f'updates:       {n} ({args.days} days, every {UPDATE} s)')
+    print(f'btree backend: {"btree" if btree is not None else "sorted dict stand-in"}')
+    print(f'btree:         {t_btree * 1e6 / n:8.1f} us/update')
+    print(f'ring:          {t_ring * 1e6 / n:8.1f} us/update')
+    print(f'speedup:       {t_btree / t_ring:8.1f}x')
+    print(f'mismatches:    {mismatches}')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
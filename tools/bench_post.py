@@ -0,0 +1,135 @@
+"""Host benchmark: peak heap of the post_data/flush_outbox payload path.
+
+Builds ``--sensors`` readings the way App.post_data exports them, then runs
+both the old path (json.dumps, bytearray copy, one-shot encrypt, iv + data,
+hexlify/join into the form body) and the PayloadSealer/FormBody stream,
+checks that they produce the same ciphertext and body, and reports the peak
+heap of each.  The new path's peaks include the sealer and form body
+buffers, sized with post_sizes as App.init_outbox does, since the app keeps
+them for good.  Under CPython the peak comes from tracemalloc and, lacking
+cryptolib, a stand-in block cipher with the same CBC chaining is used.
+
+    python tools/bench_post.py --sensors 20 --batch 6
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import firmware  # noqa: E402
+
+try:
+    from cryptolib import aes
+except ImportError:
+    aes = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import binascii  # noqa: E402
+
+
+class XorCbc:
+    # stand-in for cryptolib.aes(key, 2, iv): cbc chaining over a xor "cipher"
+    def __init__(self, key, mode, iv):
+        self.key = bytes(key)
+        self.prev = bytearray(iv)
+
+    def encrypt(self, src, dst=None):
+        if dst is None:
+            dst = bytearray(len(src))
+        assert len(src) % 16 == 0
+        for ofs in range(0, len(src), 16):
+            for i in range(16):
+                self.prev[i] ^= src[ofs + i] ^ self.key[i]
+            dst[ofs:ofs + 16] = self.prev
+        return dst
+
+
+AES = aes or XorCbc
+IV = bytes(range(16))
+fw = firmware.load('PayloadSealer', 'FormBody', 'Outbox', 'post_sizes',
+                   aes=AES, os=os, ubinascii=binascii,
+                   mpyaes=types.SimpleNamespace(generate_IV=lambda n: IV))
+
+
+def old_record(key, payload):
+    data = bytearray(json.dumps(payload).encode())
+    pad = 16 - len(data) % 16
+    data += bytes([pad]) * pad
+    AES(key, 2, IV).encrypt(data, data)
+    return IV + data
+
+
+def old_body(outbox, batch):
+    records = []
+    for path in outbox.paths(batch):
+        with open(path, 'rb') as f:
+            records.append(f.read())
+    return 'data=' + ','.join([binascii.hexlify(r).decode() for r in records])
+
+
+def peak(func, *args):
+    if tracemalloc is None:
+        return func(*args), None
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=6)
+    args = parser.parse_args()
+
+    key = bytes(range(16, 32))
+    payload = {'firmware_version': 0.3, 'timestamp': 843000000, 'bat': 12.61,
+               'location': {'lat': 31.3183, 'lon': 48.6706}}
+    for i in range(args.sensors):
+        payload[f's{i}'] = {'raw': 1234.56 + i, 'scaled': 2469.12 + i, 'warning': 0}
+
+    record, body = fw['post_sizes'](fw['_json_base_bytes'] + fw['_json_sensor_bytes'] * args.sensors,
+                                    args.batch, False)
+
+    def new_record():
+        s = fw['PayloadSealer'](key, record + 16).open()
+        json.dump(payload, s)
+        return s.close()
+
+    def new_body(outbox):
+        return fw['FormBody'](body).build(outbox.paths(args.batch))
+
+    old, old_rec_peak = peak(old_record, key, payload)
+    new, new_rec_peak = peak(new_record)
+    mismatch = bytes(new) != old
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = fw['Outbox'](os.path.join(tmp, 'outbox'), args.batch)
+        for _ in range(args.batch):
+            outbox.put(old)
+        body_old, old_body_peak = peak(old_body, outbox, args.batch)
+        body_new, new_body_peak = peak(new_body, outbox)
+        mismatch |= bytes(body_new) != body_old.encode()
+
+    print(f'record:        {len(old)} bytes, {args.sensors} sensors')
+    print(f'body:          {len(body_old)} bytes, {args.batch} records')
+    print(f'cipher:        {"cryptolib" if aes else "xor cbc stand-in"}')
+    if old_rec_peak is not None:
+        print(f'seal peak:     {old_rec_peak:7d} -> {new_rec_peak:7d} bytes')
+        print(f'body peak:     {old_body_peak:7d} -> {new_body_peak:7d} bytes')
+        print(f'               (new path includes the {record + 16} + {body} byte buffers the app keeps)')
+    print(f'mismatch:      {mismatch}')
+    return 1 if mismatch else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
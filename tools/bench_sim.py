@@ -0,0 +1,98 @@
+"""End-to-end benchmark: the real App on the host simulator over simulated days.
+
+Runs main.py against tools/sim with a virtual clock and reports, per
+scheduler task, how late it started and how long it ran; per sim800 job,
+how long it queued and held the modem; the delay from each scripted
+threshold crossing to its alarm sms; and the upload, watchdog and heap
+figures of the run.  Needs CPython (the loader uses ast).
+
+    python tools/bench_sim.py --scenario storm --days 3
+    python tools/bench_sim.py --format compact --delta
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sim import Station, scenario  # noqa: E402
+from sim.station import ROOT, merge  # noqa: E402
+
+
+def table(title, rows, series, unit='ms'):
+    print(f'\n{title:<22}{"n":>6}{"mean":>10}{"p95":>10}{"max":>10}  {unit}')
+    for name in rows:
+        s = series[name]
+        print(f'  {name:<20}{len(s):6d}{s.mean:10.0f}{s.pct(95):10.0f}{s.max:10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', choices=sorted(scenario.SCENARIOS), default='storm')
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--config', default=os.path.join(ROOT, 'config.json'))
+    parser.add_argument('--format', choices=('json', 'compact'))
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    gprs = {}
+    if args.format:
+        gprs['format'] = args.format
+    if args.delta:
+        gprs['delta'] = 1
+    merge(config, {'gprs': gprs})
+
+    sc = scenario.SCENARIOS[args.scenario](max(1, int(args.days + 0.999)))
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(config, f)
+    try:
+        r = Station(sc, f.name, args.seed, args.verbose).run(args.days)
+    finally:
+        os.remove(f.name)
+
+    print(f'scenario:      {sc.name}, {args.days:g} days, seed {args.seed}')
+    print(f'post format:   {config["gprs"].get("format", "json")}{", delta" if config["gprs"].get("delta") else ""}')
+    table('task lateness', sorted(r.late), r.late)
+    table('task run time', sorted(r.busy), r.busy)
+    missed = {k: v for k, v in r.missed.items() if v}
+    print(f'  missed periods: {missed or "none"}')
+    table('job queue wait', sorted(r.wait), r.wait)
+    table('job service time', sorted(r.service), r.service)
+    done = sum(len(s) for s in r.service.values())
+    print(f'  jobs done: {done} ({done / args.days:.0f}/day), stale dropped: {r.dropped_jobs}')
+
+    print('\nalarm to sms')
+    for sensor, at, delay in r.alarms:
+        got = 'never sent' if delay is None else f'{delay / 1000:8.1f} s'
+        print(f'  {sensor:<8} at {at / 3600:6.2f} h  {got}')
+
+    posted = [h for h in r.http if h[1] == 'getdata_p2.php']
+    sent = sum(h[2] for h in posted)
+    failed = sum(1 for h in r.http if h[3] != 200)
+    print(f'\nhttp:          {len(r.http)} requests ({failed} failed), {len(posted)} posts, '
+          f'{sent} bytes up ({sent / args.days / 1024:.1f} KiB/day)')
+    print(f'gprs attaches: {r.attaches}')
+    print(f'uart switches: {r.uart["switches"]} ({r.uart["skips"]} skipped), '
+          f'{r.uart["switch_ms"]} ms total, {r.uart["switch_max"]} ms max')
+    print(f'display:       {r.redraws} widget writes ({r.redraws / r.days:.0f}/day)')
+    print(f'worker pool:   {r.pool["submitted"]} runs on {r.pool["workers"]} threads, '
+          f'queue max {r.pool["max_depth"]}, {r.pool["overlaps"]} overlapping, {r.pool["rejected"]} rejected')
+    print(f'outbox:        {r.outbox} left, {r.outbox_dropped} dropped')
+    print(f'sms sent:      {len(r.sms)}')
+    print(f'watchdog:      longest gap {r.wdt_worst / 1000:.1f} s, {r.wdt_trips} trips')
+    print(f'heap:          {r.heap_boot} bytes from main.py after boot, {r.heap_end} at the end')
+    print(f'               {r.heap_peak} peak in the loop, simulator included (tracemalloc)')
+    print(f'exceptions:    {len(r.exceptions)}{", reset" if r.reset else ""}')
+    if r.exceptions:
+        ms, text, _ = r.exceptions[0]
+        print(f'  first at {ms / 1000:.1f} s:\n' + text)
+    return 1 if r.exceptions or r.reset else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
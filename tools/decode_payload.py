@@ -0,0 +1,181 @@
+"""Reference decoder for the payloads App.post_data uploads.
+
+A form body is ``data=<hex>,<hex>,...`` or, for compact batches,
+``id=<device_id>&enc=b64&data=<b64>,...`` (url safe base64); every record is a 16 byte iv followed by the aes-cbc
+ciphertext of a pkcs7 padded payload.  After decryption (server side, with
+the device key) ``decode`` turns a payload back into the json layout: json
+payloads start with ``{``, format 2 (CompactPayload in main.py) with its
+version byte and is positional over the device's ``sensor_list``.  Delta
+posts (gprs.delta) carry only the sensors that moved and ``'delta': 1``;
+the full picture is the last keyframe with every later delta applied in
+order, which ``apply`` does.  With flag bit 6 a second bitmap marks the wide
+columns (32 bit integer modbus points), whose raw value is an exact int64.
+
+Run directly, it round-trips a random snapshot through the firmware encoder
+and reports the bytes on air per post for both formats:
+
+    python tools/decode_payload.py --config config.json
+"""
+import argparse
+import base64
+import binascii
+import json
+import math
+import os
+import random
+import struct
+import sys
+import types
+import zlib
+from urllib.parse import parse_qs
+
+HEADER = '<BBIIB'
+COLUMN = '<ffB'
+WIDE_COLUMN = '<qfB'
+EXTRAS = (  # flag bit, keys, layout
+    (1, ('bat',), '<f'),
+    (2, ('lat', 'lon'), '<ff'),
+    (4, ('sd_warning',), '<B'),
+    (8, ('ra_int', 'ra_int_max'), '<ff'),
+    (16, ('firmware_version',), '<f'),
+)
+
+
+def records(body):
+    """Split a form body into raw (iv + ciphertext) records."""
+    if isinstance(body, bytes):
+        body = body.decode()
+    form = parse_qs(body, keep_blank_values=True)
+    items = form.get('data', [''])[0].split(',')
+    if form.get('enc', ['hex'])[0] == 'b64':
+        return [base64.urlsafe_b64decode(item) for item in items]
+    return [binascii.unhexlify(item) for item in items]
+
+
+def unpad(plain):
+    pad = plain[-1]
+    if not 1 <= pad <= 16 or plain[-pad:] != bytes([pad]) * pad:
+        raise ValueError('bad pkcs7 padding')
+    return plain[:-pad]
+
+
+def schema(columns):
+    return zlib.crc32(','.join(columns).encode()) & 0xffffffff
+
+
+def _r2(value):
+    return None if math.isnan(value) else round(value, 2)
+
+
+def decode(payload, columns):
+    """Decode one decrypted, unpadded payload into the json layout."""
+    if payload[:1] == b'{':
+        return json.loads(payload)
+    version, flags, sid, ts, ncols = struct.unpack_from(HEADER, payload)
+    if version != 2:
+        raise ValueError(f'unsupported payload version {version}')
+    if sid != schema(columns) or ncols != len(columns):
+        raise ValueError('payload does not match this sensor_list')
+    ofs = struct.calcsize(HEADER)
+    nmap = (ncols + 7) // 8
+    bitmap = payload[ofs:ofs + nmap]
+    ofs += nmap
+    wide = bytes(nmap)
+    if flags & 64:
+        wide = payload[ofs:ofs + nmap]
+        ofs += nmap
+    out = {'timestamp': ts}
+    if flags & 32:
+        out['delta'] = 1
+    for j, name in enumerate(columns):
+        bit = 1 << (j & 7)
+        if not bitmap[j >> 3] & bit:
+            continue
+        fmt = WIDE_COLUMN if wide[j >> 3] & bit else COLUMN
+        raw, scaled, warning = struct.unpack_from(fmt, payload, ofs)
+        ofs += struct.calcsize(fmt)
+        if fmt == WIDE_COLUMN:
+            raw = None if math.isnan(scaled) else raw
+        else:
+            raw = _r2(raw)
+        out[name] = {'raw': raw, 'scaled': _r2(scaled),
+                     'warning': None if warning == 255 else warning}
+    for bit, keys, fmt in EXTRAS:
+        if not flags & bit:
+            continue
+        values = struct.unpack_from(fmt, payload, ofs)
+        ofs += struct.calcsize(fmt)
+        if keys == ('lat', 'lon'):
+            out['location'] = {k: round(v, 5) for k, v in zip(keys, values)}
+        elif fmt != '<B':
+            out.update(zip(keys, [_r2(v) for v in values]))
+        else:
+            out.update(zip(keys, values))
+    if ofs != len(payload):
+        raise ValueError(f'{len(payload) - ofs} trailing bytes')
+    return out
+
+
+def apply(state, post):
+    """Merge a decoded post into the running picture of a station."""
+    if not post.get('delta'):
+        state.clear()
+    for key, value in post.items():
+        if key != 'delta':
+            state[key] = value
+    return state
+
+
+def _roundtrip(columns, seed):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import firmware
+    from array import array
+
+    fw = firmware.load('Readings', 'CompactPayload', array=array, _nan=math.nan,
+                       ubinascii=types.SimpleNamespace(crc32=zlib.crc32))
+    rng = random.Random(seed)
+    sensors = {name: {'a': 1.0, 'b': 0.0} for name in columns}
+    wide = columns[-2:]
+    readings = fw['Readings'](columns, sensors, wide)
+    for i, name in enumerate(columns):
+        if rng.random() < 0.1:
+            readings.lost(i)
+        else:
+            readings.put(i, rng.randrange(1 << 24, 1 << 32) if name in wide else rng.uniform(-50, 5000))
+            readings.warning[i] = rng.choice((0, 0, 0, 2, 3))
+    data = {'firmware_version': 0.3, 'timestamp': 843000000, 'bat': 12.61,
+            'location': {'lat': 31.3183, 'lon': 48.6706}, 'sd_warning': 0,
+            'ra_int': 4.5, 'ra_int_max': 12.0}
+    full = readings.export(dict(data))
+    packed = bytes(fw['CompactPayload'](columns, wide).pack(data['timestamp'], readings, data))
+
+    got = decode(packed, columns)
+    return json.dumps(full).encode(), packed, got == full
+
+
+def on_air(payload, b64):
+    sealed = 16 + (len(payload) // 16 + 1) * 16
+    return 4 * math.ceil(sealed / 3) if b64 else 2 * sealed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(__file__), '..', 'config.json'))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        columns = json.load(f)['sensor_list']
+    plain_json, packed, ok = _roundtrip(columns, args.seed)
+    hex_json = on_air(plain_json, False)
+    b64_compact = on_air(packed, True)
+    print(f'columns:       {len(columns)}')
+    print(f'json:          {len(plain_json):5d} bytes, {hex_json:5d} on air (hex)')
+    print(f'compact:       {len(packed):5d} bytes, {b64_compact:5d} on air (base64)')
+    print(f'reduction:     {hex_json / b64_compact:5.1f}x')
+    print(f'round trip:    {"ok" if ok else "MISMATCH"}')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Export binary day logs written by App.log_data to the csv layout.
+
+Each ``/sd/data/<date>.bin`` file becomes ``<out>/raw/<date>.csv`` and
+``<out>/scaled/<date>.csv`` with the same columns and formatting the device
+used to write directly (``timestamp,<sensor_list>``, values to two decimals,
+empty cells for missing values, CRLF line endings).  Version 2 files mark
+the 32 bit integer modbus points in a bitmap after the column entries and
+keep their raw values as exact int64s.
+
+    python tools/export_log.py /media/sd/data out/
+"""
+import argparse
+import datetime
+import math
+import os
+import struct
+import sys
+
+MAGIC = b'RTUL'
+HEADER = '<4sBBHHI'
+COLUMN = '<8sff'
+MISSING = -0x8000000000000000
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+class DayLog:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, ncols, header_size, record_size, schema = struct.unpack_from(HEADER, data)
+        if magic != MAGIC:
+            raise ValueError(f'{path}: not a log file')
+        if version not in (1, 2):
+            raise ValueError(f'{path}: unsupported version {version}')
+        self.schema = schema
+        self.columns = []
+        self.scales = []
+        ofs = struct.calcsize(HEADER)
+        for i in range(ncols):
+            name, a, b = struct.unpack_from(COLUMN, data, ofs + i * 16)
+            self.columns.append(name.rstrip(b'\0').decode())
+            self.scales.append((a, b))
+        wide = data[ofs + ncols * 16:header_size] if version == 2 else bytes((ncols + 7) // 8)
+        self.wide = [bool(wide[i >> 3] & (1 << (i & 7))) for i in range(ncols)]
+        self.fmt = '<I' + ''.join('q' if w else 'f' for w in self.wide)
+        self.records = []
+        body = data[header_size:]
+        usable = len(body) - len(body) % record_size
+        for ofs in range(0, usable, record_size):
+            self.records.append(struct.unpack_from(self.fmt, body, ofs))
+
+    def rows(self, scaled):
+        for record in self.records:
+            tm = EPOCH + datetime.timedelta(seconds=record[0])
+            cells = [tm.strftime('%Y-%m-%d %H:%M')]
+            for (a, b), wide, raw in zip(self.scales, self.wide, record[1:]):
+                if (raw == MISSING) if wide else math.isnan(raw):
+                    cells.append('')
+                else:
+                    raw = round(raw, 2)
+                    cells.append(f'{round(a * raw + b, 2) if scaled else raw:.2f}')
+            yield ','.join(cells)
+
+
+def export(path, out):
+    log = DayLog(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    for kind in ('raw', 'scaled'):
+        os.makedirs(os.path.join(out, kind), exist_ok=True)
+        with open(os.path.join(out, kind, f'{name}.csv'), 'w', newline='') as f:
+            f.write('timestamp,' + ','.join(log.columns) + '\r\n')
+            for row in log.rows(kind == 'scaled'):
+                f.write(row + '\r\n')
+    return len(log.records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('src', help='a .bin day file or a directory of them')
+    parser.add_argument('out', help='output directory')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.src):
+        paths = sorted(os.path.join(args.src, n) for n in os.listdir(args.src) if n.endswith('.bin'))
+    else:
+        paths = [args.src]
+    for path in paths:
+        print(f'{path}: {export(path, args.out)} records')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Load pure-logic pieces of main.py on a host without touching hardware.
+
+main.py configures pins, the display and the modem at import time, so host
+tools pull just the classes/functions they need (plus every module level
+``_name = const(...)``) out of the source and execute them in a namespace of
+their own.
+"""
+import _thread
+import ast
+import io
+import os
+import struct
+import sys
+import traceback
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'main.py')
+
+
+class _Log:
+    # stands in for main.py's Logger, everything goes to stdout
+    def _print(self, msg, *args):
+        print(msg % args if args else msg)
+
+    debug = info = warn = error = _print
+
+    def exc(self, e):
+        traceback.print_exception(e, file=sys.stdout)
+
+
+def load(*names, **extra):
+    with open(MAIN) as f:
+        tree = ast.parse(f.read(), MAIN)
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef)) and node.name in names:
+            body.append(node)
+        elif (isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name)
+              and isinstance(node.value, ast.Call)
+              and getattr(node.value.func, 'id', None) == 'const'):
+            body.append(node)
+    found = {n.name for n in body if not isinstance(n, ast.Assign)}
+    missing = set(names) - found
+    if missing:
+        raise NameError(f'not defined in main.py: {", ".join(sorted(missing))}')
+    ns = {
+        '__name__': 'firmware',
+        'const': lambda x: x,
+        'io': io,
+        'struct': struct,
+        '_thread': _thread,
+        'log': _Log(),
+        'feed_wdt': lambda: None,
+    }
+    for color in ('Red', 'Green', 'Yellow', 'Magenta', 'Cyan', 'White'):
+        ns[color] = ''
+    ns.update(extra)
+    exec(compile(ast.Module(body=body, type_ignores=[]), MAIN, 'exec'), ns)
+    return ns
@@ -0,0 +1,30 @@
+"""MicroWebSrv2: routes are registered so a simulation can call them."""
+GET = 'GET'
+POST = 'POST'
+
+routes = {}
+
+
+def WebRoute(method, path, name=None):
+    def register(handler):
+        routes[(method, path)] = handler
+        return handler
+    return register
+
+
+class MicroWebSrv2:
+    def __init__(self):
+        self.NotFoundURL = None
+        self.IsRunning = False
+
+    def SetEmbeddedConfig(self):
+        pass
+
+    def StartManaged(self, *args):
+        self.IsRunning = True
+
+    def Stop(self):
+        self.IsRunning = False
+
+
+__all__ = ['GET', 'POST', 'WebRoute', 'MicroWebSrv2']
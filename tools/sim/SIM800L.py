@@ -0,0 +1,110 @@
+"""SIM800L.Modem: at command costs on the virtual clock and a scripted server."""
+import json
+
+from . import machine
+from . import world as _w
+
+COST_MS = {
+    'check_reg': 300,
+    'initialize': 8000,
+    'signal': 200,
+    'connect': 2500,
+    'disconnect': 1000,
+    'http': 1800,
+    'sms': 4000,
+    'read_sms': 300,
+    'delete_sms': 200,
+    'eng_data': 1000,
+    'ussd': 3000,
+}
+
+
+class Response:
+    def __init__(self, status_code, content=''):
+        self.status_code = status_code
+        self.content = content
+
+
+class Modem:
+    def __init__(self, uart, power_pin=None, MODEM_POWER_ON_PIN=None, log_level=None, wdt=None):
+        self.wdt = wdt
+        self.attached = False
+
+    def _cost(self, name):
+        _w.current.advance(COST_MS[name])
+
+    def check_reg(self):
+        self._cost('check_reg')
+        if not _w.current.online():
+            raise Exception('not registered')
+
+    def initialize(self):
+        self._cost('initialize')
+        if not _w.current.online():
+            raise Exception('no network')
+
+    def get_signal_strength(self):
+        self._cost('signal')
+        return int(_w.current.value('csq', 18))
+
+    def connect(self, apn):
+        self._cost('connect')
+        if not _w.current.online():
+            raise Exception('gprs attach failed')
+        self.attached = True
+
+    def disconnect(self):
+        self._cost('disconnect')
+        self.attached = False
+
+    def http_request(self, url, mode='GET', data=None, content_type=None):
+        w = _w.current
+        size = 0 if data is None else len(data)
+        w.advance(COST_MS['http'] + size * 1000 / w.scenario.gprs_bytes_per_s)
+        path = url.rsplit('/', 1)[-1].split('?')[0]
+        if not self.attached or not w.online() or w.rng.random() < w.scenario.http_fail:
+            response = Response(0, '')
+        elif path == 'settings2.php':
+            response = Response(200, ','.join(str(v) for v in machine.rtc_tuple(w.true_time())))
+        elif path == 'gps3.php':
+            response = Response(200, json.dumps(w.scenario.location))
+        elif path == 'version.php':
+            response = Response(200, '0')
+        else:
+            response = Response(200, '')
+        w.http.append((w.ms, path, size, response.status_code))
+        return response
+
+    def download(self, url, filename, lcd_obj=None):
+        self._cost('http')
+        if lcd_obj is not None:
+            lcd_obj.set_text('0%')
+        return Response(404)
+
+    def send_sms(self, number, text):
+        self._cost('sms')
+        w = _w.current
+        w.sms.append((w.ms, number, text))
+
+    def read_sms(self, index):
+        self._cost('read_sms')
+        slots = _w.current.inbox
+        if index > len(slots) or slots[index - 1] is None:
+            raise Exception('no sms')
+        return slots[index - 1]
+
+    def delete_sms(self, index):
+        self._cost('delete_sms')
+        slots = _w.current.inbox
+        if index <= len(slots):
+            slots[index - 1] = None
+        while slots and slots[-1] is None:
+            slots.pop()
+
+    def get_eng_data(self):
+        self._cost('eng_data')
+        return {'mcc': '432', 'mnc': '35', 'cellid': '5268', 'lac': '7747'}
+
+    def ussd_code(self, code):
+        self._cost('ussd')
+        return 'balance: 0'
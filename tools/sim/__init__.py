@@ -0,0 +1,15 @@
+"""Host simulation of the station: main.py on CPython against a virtual clock.
+
+Every hardware module main.py imports has a stand-in here, driven by one
+``World`` that owns the simulated time.  Sleeps and modelled device costs
+(sdi-12 measurements, modem commands, http transfer time) are the only
+things that advance it, and threads take turns at fixed points (see
+uthread), so a run is repeatable for a given config, scenario and seed.
+
+    from sim import Station, scenario
+    report = Station(scenario.storm(days=2)).run(days=2)
+"""
+from . import scenario
+from .station import Report, Station
+
+__all__ = ['Report', 'Station', 'scenario']
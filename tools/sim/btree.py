@@ -0,0 +1,5 @@
+"""btree: only the old percip.db migration uses it, which the simulation skips."""
+
+
+def open(stream, **kwargs):
+    raise OSError('btree is not simulated')
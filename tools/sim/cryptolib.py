@@ -0,0 +1,18 @@
+"""cryptolib: cbc chaining over a xor block "cipher", same shapes and costs nothing."""
+
+
+class aes:
+    def __init__(self, key, mode, iv=None):
+        self.key = bytes(key)
+        self.prev = bytearray(iv or bytes(16))
+
+    def encrypt(self, src, dst=None):
+        if len(src) % 16:
+            raise ValueError('input not a multiple of 16 bytes')
+        if dst is None:
+            dst = bytearray(len(src))
+        for ofs in range(0, len(src), 16):
+            for i in range(16):
+                self.prev[i] ^= src[ofs + i] ^ self.key[i]
+            dst[ofs:ofs + 16] = self.prev
+        return dst
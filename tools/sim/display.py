@@ -0,0 +1,15 @@
+"""ili9XXX, espidf and imagetools: the display driver is never drawn to."""
+VSPI_HOST = 3
+
+
+class ili9341:
+    def __init__(self, **kwargs):
+        pass
+
+
+def get_png_info(*args):
+    pass
+
+
+def open_png(*args):
+    pass
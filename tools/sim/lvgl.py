@@ -0,0 +1,90 @@
+"""lvgl: widgets accept any call; labels keep their text so it can be read back.
+
+Text, text colour and image writes are counted in World.redraws, each one
+standing for a redraw of the widget and its spi transfer to the panel.
+Timers run their callback on the virtual clock, as the lvgl task handler
+would between the firmware's sleeps.
+"""
+from . import world as _w
+
+
+class _Stub:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __getattr__(self, name):
+        return _Stub()
+
+
+def _redraw():
+    w = _w.current
+    if w is not None:
+        w.redraws += 1
+
+
+class label(_Stub):
+    LONG = _Stub()
+
+    def __init__(self, parent=None):
+        self.text = ''
+
+    def set_text(self, text):
+        self.text = text
+        _redraw()
+
+    def get_text(self):
+        return self.text
+
+    def ins_text(self, pos, text):
+        self.text += text
+        _redraw()
+
+    def set_style_text_color(self, color, selector):
+        _redraw()
+
+
+class img(_Stub):
+    decoder_create = staticmethod(_Stub)
+
+    def set_src(self, src):
+        _redraw()
+
+
+class _Timer(_Stub):
+    def __init__(self, callback, period):
+        self.callback = callback
+        self.period = period
+        self.deleted = False
+        self._arm(_w.current)
+
+    def _arm(self, w):
+        w.at((w.ms + self.period) / 1000.0, self._fire)
+
+    def _fire(self):
+        if self.deleted:
+            return
+        w = _w.current
+        try:
+            self.callback(self)
+        except Exception as e:
+            from . import usys
+            usys.print_exception(e)
+        self._arm(w)
+
+    def _del(self):
+        self.deleted = True
+
+
+def timer_create(callback, period, user_data=None):
+    return _Timer(callback, period)
+
+
+def color_make(r, g, b):
+    return (r, g, b)
+
+
+def __getattr__(name):
+    return _Stub()
@@ -0,0 +1,163 @@
+"""machine: pins, adcs, uart, rtc and watchdog of the esp32 board."""
+import datetime
+
+from . import world as _w
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+# adc pin -> scenario signal, in read_uv() microvolts
+ADC_CHANNELS = {8: 'a1', 7: 'a2', 6: 'a3', 14: 'c1', 3: 'c2', 1: 'bat'}
+ADC_READ_MS = 0.05
+UART_INIT_MS = 2
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, id, mode=None, pull=None, value=None):
+        self.id = id
+        self._value = 1 if value is None else value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    __call__ = value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, trigger=None, handler=None):
+        _w.current.irqs[self.id] = (self, handler)
+
+
+class Signal:
+    def __init__(self, pin, invert=False):
+        self.pin = pin
+
+    def value(self, v=None):
+        return self.pin.value(v)
+
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty=None):
+        pass
+
+    def freq(self, f=None):
+        pass
+
+    def duty(self, d=None):
+        pass
+
+
+class SPI:
+    def __init__(self, id, baudrate=None, **kwargs):
+        pass
+
+    def init(self, baudrate=None, **kwargs):
+        pass
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_11DB = 3
+
+    def __init__(self, pin, atten=None):
+        self.name = ADC_CHANNELS.get(pin.id)
+
+    def read_uv(self):
+        w = _w.current
+        w.advance(ADC_READ_MS)
+        return int(w.value(self.name))
+
+
+class UART:
+    def __init__(self, id, **kwargs):
+        pass
+
+    def init(self, *args, **kwargs):
+        _w.current.advance(UART_INIT_MS)
+
+    def any(self):
+        return 0
+
+    def read(self, n=None):
+        return None
+
+    def write(self, buf):
+        return len(buf)
+
+
+class RTC:
+    def datetime(self, tm=None):
+        w = _w.current
+        if tm is None:
+            return rtc_tuple(w.rtc_time())
+        t = datetime.datetime(tm[0], tm[1], tm[2], tm[4], tm[5], tm[6])
+        w.set_rtc(int((t - EPOCH).total_seconds()))
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        w = _w.current
+        w.wdt_timeout = timeout
+        w.wdt_last = w.ms
+
+    def feed(self):
+        _w.current.feed_wdt()
+
+
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id):
+        pass
+
+    def init(self, **kwargs):
+        pass
+
+    def deinit(self):
+        pass
+
+
+def rtc_tuple(seconds):
+    t = EPOCH + datetime.timedelta(seconds=seconds)
+    return (t.year, t.month, t.day, t.weekday(), t.hour, t.minute, t.second, 0)
+
+
+def reset():
+    raise _w.Reset()
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
@@ -0,0 +1,15 @@
+"""max31865: the pt100 front end, temperature from the 'pt' signal."""
+from . import world as _w
+
+READ_MS = 70
+
+
+class MAX31865:
+    def __init__(self, spi, cs, ref_resistor=430.0, wires=2):
+        pass
+
+    @property
+    def temperature(self):
+        w = _w.current
+        w.advance(READ_MS)
+        return w.value('pt')
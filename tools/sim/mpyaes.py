@@ -0,0 +1,6 @@
+"""mpyaes: ivs from the world's seeded rng."""
+from . import world as _w
+
+
+def generate_IV(n):
+    return bytes(_w.current.rng.getrandbits(8) for _ in range(n))
@@ -0,0 +1,16 @@
+"""network: the configuration access point."""
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface):
+        self._active = False
+
+    def active(self, on=None):
+        if on is None:
+            return self._active
+        self._active = on
+
+    def config(self, **kwargs):
+        pass
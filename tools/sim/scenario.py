@@ -0,0 +1,136 @@
+"""What happens around the station: signal levels, rain, sms and outages.
+
+Times are seconds after power on.  ``value`` answers a device read: the base
+level, replaced by the latest ``step`` that has happened, plus gaussian noise.
+Readings are in the units the stand-ins return (microvolts for adc pins,
+register counts for rs485, engineering units for pt100 and sdi-12).
+"""
+import datetime
+
+EPOCH = datetime.datetime(2000, 1, 1)
+HOUR = 3600
+DAY = 86400
+
+BASE = {
+    'pt': 24.0,
+    'a1': 500000, 'a2': 500000, 'a3': 500000,
+    'c1': 800000, 'c2': 800000,
+    'bat': 2650000,
+    'rs_1': 100, 'rs_2': 200,
+    'csq': 18,
+}
+for _i in range(1, 10):
+    BASE[f's{_i}'] = 10.0 + _i
+
+NOISE = {'pt': 0.05, 'a1': 800, 'a2': 800, 'a3': 800, 'c1': 500, 'c2': 500,
+         'bat': 2000, 'csq': 1.5}
+
+
+class Scenario:
+    def __init__(self, name, start=datetime.datetime(2026, 10, 1)):
+        self.name = name
+        self.start = int((start - EPOCH).total_seconds())
+        self.base = dict(BASE)
+        self.noise = dict(NOISE)
+        self.steps = {}
+        self.tips = []
+        self.inbox = []
+        self.outages = []
+        self.alarms = []
+        self.config = {}
+        self.sd = True
+        self.sdi12 = True
+        self.rs485 = True
+        self.gprs_bytes_per_s = 2000
+        self.http_fail = 0.0
+        self.location = {'lat': 31.3183, 'lon': 48.6706, 'radius': 550}
+
+    def value(self, name, t, default, rng):
+        v = self.base.get(name, default)
+        for at, level in self.steps.get(name, ()):
+            if at > t:
+                break
+            v = level
+        sigma = self.noise.get(name)
+        if sigma:
+            v += rng.gauss(0, sigma)
+        return v
+
+    def online(self, t):
+        for start, end in self.outages:
+            if start <= t < end:
+                return False
+        return True
+
+    def step(self, name, at, level):
+        self.steps.setdefault(name, []).append((at, level))
+        self.steps[name].sort(key=lambda s: s[0])
+
+    def threshold(self, sensor, high=None, low=None):
+        self.config.setdefault('sensors', {})[sensor] = {'high_th': high, 'low_th': low}
+
+    def alarm(self, sensor, at, level):
+        # a step that crosses a threshold; alarm-to-sms delay is measured from `at`
+        self.step(sensor, at, level)
+        self.alarms.append((at, sensor))
+
+    def rain(self, start, end, tips_per_hour, bounce=0.02):
+        # evenly spaced tips, each followed by a contact bounce `bounce` s later
+        gap = HOUR / tips_per_hour
+        t = start
+        while t < end:
+            self.tips.append(t)
+            if bounce:
+                self.tips.append(t + bounce)
+            t += gap
+
+    def sms(self, at, number, text):
+        self.inbox.append((at, number, text))
+
+    def outage(self, start, end):
+        self.outages.append((start, end))
+
+    def install(self, world):
+        for t in self.tips:
+            world.at(t, lambda: _tip(world))
+        for at, number, text in self.inbox:
+            world.at(at, lambda m=(number, text): world.inbox.append(m))
+
+
+def _tip(world):
+    pin, handler = world.irqs.get(4, (None, None))
+    if handler is not None:
+        handler(pin)
+
+
+def quiet(days=1):
+    """A dry day: steady sensors, good coverage, nothing to report."""
+    return Scenario('quiet')
+
+
+def storm(days=1):
+    """Rain bursts, threshold crossings, sms commands and network outages."""
+    sc = Scenario('storm')
+    sc.threshold('pt', high=30)
+    sc.threshold('s1', low=5)
+    sc.threshold('rs_1', high=150)
+    for day in range(days):
+        d = day * DAY
+        sc.rain(d + 6 * HOUR, d + 9 * HOUR, 90)
+        sc.rain(d + 9 * HOUR, d + 9.5 * HOUR, 400)
+        sc.alarm('pt', d + 10 * HOUR + 17, 35.0)
+        sc.step('pt', d + 12 * HOUR, 24.0)
+        sc.alarm('s1', d + 15 * HOUR + 5, 2.0)
+        sc.step('s1', d + 17 * HOUR, 11.0)
+        sc.alarm('rs_1', d + 19 * HOUR + 41, 180)
+        sc.step('rs_1', d + 20 * HOUR, 100)
+        sc.outage(d + 13 * HOUR, d + 14 * HOUR + 30 * 60)
+        sc.sms(d + 8 * HOUR, '09120000000', '#stat')
+        sc.sms(d + 16 * HOUR, '09120000000', '#qu')
+        sc.sms(d + 20 * HOUR, '09120000000', '#log')
+        sc.step('csq', d + 18 * HOUR, 8)
+        sc.step('csq', d + 21 * HOUR, 18)
+    return sc
+
+
+SCENARIOS = {'quiet': quiet, 'storm': storm}
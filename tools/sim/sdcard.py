@@ -0,0 +1,8 @@
+"""sdcard: the card is there unless the scenario says otherwise."""
+from . import world as _w
+
+
+class SDCard:
+    def __init__(self, spi, cs):
+        if not _w.current.scenario.sd:
+            raise OSError(19)
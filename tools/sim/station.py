@@ -0,0 +1,261 @@
+"""Run the real main.py against the stand-ins and report what happened.
+
+main.py is parsed and executed as a module whose imports resolve to this
+package, whose ``open`` and ``print`` go through the world, and whose last
+statement, ``main_app.loop()``, only runs once the scheduler and job queue
+are instrumented.  Scheduler.idle raises Stop when the simulated time is
+up, which App.loop treats like a ctrl-c.
+"""
+import ast
+import builtins
+import copy
+import importlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from . import uthread
+from . import world as _w
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+MAIN = os.path.join(ROOT, 'main.py')
+
+STANDINS = {
+    'json': 'ujson',
+    'time': 'utime',
+    'os': 'uos',
+    'sys': 'usys',
+    'gc': 'ugc',
+    'heapq': 'uheapq',
+    '_thread': 'uthread',
+    'micropython': 'micropython',
+    'machine': 'machine',
+    'SIM800L': 'SIM800L',
+    'SDI12': 'SDI12',
+    'max31865': 'max31865',
+    'umodbus.modbus': 'umodbus',
+    'sdcard': 'sdcard',
+    'btree': 'btree',
+    'mpyaes': 'mpyaes',
+    'cryptolib': 'cryptolib',
+    'network': 'network',
+    'lvgl': 'lvgl',
+    'imagetools': 'display',
+    'ili9XXX': 'display',
+    'espidf': 'display',
+    'MicroWebSrv2': 'MicroWebSrv2',
+    'ubinascii': 'binascii',
+}
+
+
+def _import(name, globals=None, locals=None, fromlist=(), level=0):
+    standin = STANDINS.get(name)
+    if standin is None:
+        return builtins.__import__(name, globals, locals, fromlist, level)
+    if standin == 'binascii':
+        return importlib.import_module(standin)
+    return importlib.import_module('.' + standin, __package__)
+
+
+def merge(dst, src):
+    for key, value in src.items():
+        if isinstance(value, dict) and isinstance(dst.get(key), dict):
+            merge(dst[key], value)
+        else:
+            dst[key] = value
+    return dst
+
+
+class Series:
+    def __init__(self):
+        self.values = []
+
+    def add(self, v):
+        self.values.append(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return sum(self.values) / len(self.values) if self.values else 0.0
+
+    @property
+    def max(self):
+        return max(self.values) if self.values else 0.0
+
+    def pct(self, p):
+        if not self.values:
+            return 0.0
+        s = sorted(self.values)
+        return s[min(len(s) - 1, math.ceil(p / 100 * len(s)) - 1)]
+
+
+class Report:
+    def __init__(self, scenario, days):
+        self.scenario = scenario
+        self.days = days
+        self.late = {}      # task -> Series of ms past its deadline
+        self.busy = {}      # task -> Series of ms the run took
+        self.missed = {}
+        self.wait = {}      # job -> Series of ms queued before it ran
+        self.service = {}   # job -> Series of ms it held the modem
+        self.dropped_jobs = 0
+        self.alarms = []    # (sensor, crossing s, delay ms or None)
+        self.sms = []
+        self.http = []
+        self.outbox = 0
+        self.outbox_dropped = 0
+        self.attaches = 0
+        self.uart = {}
+        self.pool = {}
+        self.redraws = 0
+        self.wdt_worst = 0.0
+        self.wdt_trips = 0
+        self.exceptions = []
+        self.heap_boot = 0  # bytes allocated by main.py lines once App is set up
+        self.heap_end = 0   # the same when the run stopped
+        self.heap_peak = 0  # peak of everything traced while the loop ran
+        self.reset = False
+
+    def task(self, name, late, busy):
+        self.late.setdefault(name, Series()).add(late)
+        self.busy.setdefault(name, Series()).add(busy)
+
+    def job(self, name, wait, service):
+        self.wait.setdefault(name, Series()).add(wait)
+        self.service.setdefault(name, Series()).add(service)
+
+
+class Station:
+    def __init__(self, scenario, config=None, seed=1, verbose=False):
+        self.scenario = scenario
+        self.config = config or os.path.join(ROOT, 'config.json')
+        self.seed = seed
+        self.verbose = verbose
+
+    def _sandbox(self, root):
+        with open(self.config) as f:
+            config = json.load(f)
+        merge(config, copy.deepcopy(self.scenario.config))
+        with open(os.path.join(root, 'config.json'), 'w') as f:
+            json.dump(config, f)
+        shutil.copytree(os.path.join(ROOT, 'icons'), os.path.join(root, 'icons'))
+        return config
+
+    def _namespace(self, w):
+        env = dict(vars(builtins))
+        env['__import__'] = _import
+        env['open'] = lambda path, *args, **kwargs: open(w.path(path), *args, **kwargs)
+        env['print'] = w.print
+        return {'__name__': '__main__', '__file__': MAIN, '__builtins__': env}
+
+    def _instrument(self, ns, w, report):
+        app = ns['main_app']
+        sched = app.scheduler
+        Task = ns['Task']
+        task_run = Task.run
+
+        def run(task):
+            due = w.popped.pop(id(task), None)
+            start = w.ms
+            late = sched.now() - due if due is not None else 0
+            task_run(task)
+            report.task(task.name, late, w.ms - start)
+        Task.run = run
+
+        jobs = app.sim800_jobs
+        peek = jobs.peek
+        remove = jobs.remove
+        picked = {}
+
+        def peek_job():
+            job = peek()
+            if job is not None:
+                picked[id(job)] = sched.now()
+            return job
+
+        def remove_job(job):
+            at = picked.pop(id(job), None)
+            remove(job)
+            if at is not None:
+                report.job(job.name, at - job.created, sched.now() - at)
+        jobs.peek = peek_job
+        jobs.remove = remove_job
+
+        idle = sched.idle
+
+        def idle_until_end():
+            if w.ms >= w.end:
+                raise _w.Stop()
+            idle()
+        sched.idle = idle_until_end
+
+    def _firmware_heap(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, MAIN)])
+        return sum(stat.size for stat in snapshot.statistics('filename'))
+
+    def run(self, days=1):
+        report = Report(self.scenario, days)
+        with open(MAIN) as f:
+            tree = ast.parse(f.read(), MAIN)
+        # the trailing main_app.loop() runs after instrumentation
+        loop = ast.Module(body=tree.body[-1:], type_ignores=[])
+        boot = ast.Module(body=tree.body[:-1], type_ignores=[])
+        with tempfile.TemporaryDirectory() as root:
+            config = self._sandbox(root)
+            w = _w.World(root, self.scenario, self.seed)
+            w.verbose = self.verbose
+            w.end = days * 86400000.0
+            _w.current = w
+            uthread.reset()
+            self.scenario.install(w)
+            ns = self._namespace(w)
+            tracemalloc.start()
+            try:
+                exec(compile(boot, MAIN, 'exec'), ns)
+                self._instrument(ns, w, report)
+                report.heap_boot = self._firmware_heap()
+                tracemalloc.reset_peak()
+                exec(compile(loop, MAIN, 'exec'), ns)
+            except _w.Reset:
+                report.reset = True
+            finally:
+                report.heap_peak = tracemalloc.get_traced_memory()[1]
+                report.heap_end = self._firmware_heap()
+                tracemalloc.stop()
+                app = ns.get('main_app')
+                if app is not None:
+                    self._collect(app, config, w, report)
+                _w.current = None
+        return report
+
+    def _collect(self, app, config, w, report):
+        for task in app.scheduler.tasks.values():
+            report.missed[task.name] = task.missed
+        report.dropped_jobs = app.sim800_jobs.dropped
+        if app.outbox is not None:
+            report.outbox = len(app.outbox)
+            report.outbox_dropped = app.outbox.dropped
+        report.attaches = app.gprs.attaches
+        report.uart = app.channels.report()
+        report.pool = app.pool.report()
+        report.redraws = w.redraws
+        report.sms = w.sms
+        report.http = w.http
+        report.wdt_worst = w.wdt_worst
+        report.wdt_trips = w.wdt_trips
+        report.exceptions = w.exceptions
+        for at, sensor in self.scenario.alarms:
+            if at * 1000 >= w.end:
+                continue
+            name = config['sensors'][sensor]['disp_name']
+            delay = None
+            for ms, number, text in w.sms:
+                if ms >= at * 1000 and 'Alarm!' in text and f' {name}\'s ' in text:
+                    delay = ms - at * 1000
+                    break
+            report.alarms.append((sensor, at, delay))
@@ -0,0 +1,22 @@
+"""gc: heap figures from tracemalloc against a fixed simulated heap size."""
+import tracemalloc
+
+HEAP = 2 * 1024 * 1024
+
+
+def collect():
+    pass
+
+
+def mem_alloc():
+    if not tracemalloc.is_tracing():
+        return 0
+    return tracemalloc.get_traced_memory()[0]
+
+
+def mem_free():
+    return HEAP - mem_alloc()
+
+
+def threshold(amount=None):
+    return -1
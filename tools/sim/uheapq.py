@@ -0,0 +1,14 @@
+"""heapq that remembers the deadline each scheduler task was popped for."""
+import heapq as _heapq
+
+from . import world as _w
+
+heappush = _heapq.heappush
+heapify = _heapq.heapify
+
+
+def heappop(heap):
+    item = _heapq.heappop(heap)
+    if type(item) is tuple and len(item) == 3 and getattr(item[2], 'seq', None) == item[1]:
+        _w.current.popped[id(item[2])] = item[0]
+    return item
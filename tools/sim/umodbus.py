@@ -0,0 +1,36 @@
+"""umodbus.modbus.ModbusRTU: registers 1.. of every slave from the rs_<n> signals.
+
+scenario.rs485 is True (every slave answers), False (none does) or the set
+of slave addresses that answer; a silent slave costs the serial read timeout
+like the real driver.  Function codes 3 and 4 read the same signals.
+"""
+from . import world as _w
+
+FRAME_MS = 15
+TIMEOUT_MS = 500
+
+
+class _Interface:
+    def _read(self, slave_addr, starting_addr, register_qty, signed):
+        w = _w.current
+        answering = w.scenario.rs485
+        if answering is not True and (not answering or slave_addr not in answering):
+            w.advance(FRAME_MS + TIMEOUT_MS)
+            raise OSError('no data received from slave')
+        w.advance(FRAME_MS + 2 * register_qty)
+        regs = [int(w.value(f'rs_{starting_addr + i}')) & 0xffff for i in range(register_qty)]
+        if signed:
+            regs = [r - 0x10000 if r & 0x8000 else r for r in regs]
+        return regs
+
+    def read_holding_registers(self, slave_addr, starting_addr, register_qty, signed=True):
+        return self._read(slave_addr, starting_addr, register_qty, signed)
+
+    def read_input_registers(self, slave_addr, starting_addr, register_qty, signed=True):
+        return self._read(slave_addr, starting_addr, register_qty, signed)
+
+
+class ModbusRTU:
+    def __init__(self, addr, uart, ctrl_pin=None, **kwargs):
+        self._itf = _Interface()
+        self._addr_list = [addr]
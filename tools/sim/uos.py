@@ -0,0 +1,37 @@
+"""os: the device filesystem rooted in the station's sandbox directory."""
+import os as _os
+
+from . import world as _w
+
+
+def listdir(path='/'):
+    return sorted(_os.listdir(_w.current.path(path)))
+
+
+def mkdir(path):
+    _os.mkdir(_w.current.path(path))
+
+
+def remove(path):
+    _os.remove(_w.current.path(path))
+
+
+def rename(old, new):
+    _os.rename(_w.current.path(old), _w.current.path(new))
+
+
+def stat(path):
+    return _os.stat(_w.current.path(path))
+
+
+def mount(dev, path):
+    _os.makedirs(_w.current.path(path), exist_ok=True)
+    _w.current.mounts.add(path)
+
+
+def umount(path):
+    _w.current.mounts.discard(path)
+
+
+def urandom(n):
+    return bytes(_w.current.rng.getrandbits(8) for _ in range(n))
@@ -0,0 +1,23 @@
+"""sys: print_exception records every exception the firmware swallows.
+
+Like the port it only writes to objects with the stream protocol (io
+classes and their subclasses), anything else raises OSError.
+"""
+import io
+import traceback
+
+from . import world as _w
+
+
+def print_exception(e, file=None):
+    if file is not None and not isinstance(file, io.IOBase):
+        raise OSError('stream operation not supported')
+    w = _w.current
+    text = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+    # count an exception once however often it is printed
+    if not w.exceptions or w.exceptions[-1][2] is not e:
+        w.exceptions.append((w.ms, text, e))
+    if file is not None:
+        file.write(text)
+    elif w.verbose:
+        print(text, end='')
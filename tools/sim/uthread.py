@@ -0,0 +1,128 @@
+"""_thread: real threads that take turns, so runs stay deterministic.
+
+Exactly one simulated thread runs at a time.  start_new_thread runs the new
+thread straight away until it finishes or blocks on a lock, then returns to
+the caller; releasing a lock somebody waits for hands it to the oldest
+waiter and runs that thread the same way.  Like the port's locks these have
+no owner, so a thread may block on a lock it took itself until another
+thread releases it.  The main thread blocking has nobody to return to and
+would hang forever, so it raises instead.
+"""
+import threading
+
+
+class _Thread:
+    def __init__(self, ident):
+        self.ident = ident
+        self.go = threading.Event()
+        self.resumer = None
+
+
+_main = _Thread(threading.get_ident())
+_current = _main
+_failure = []
+
+
+def _switch_to(thread):
+    # park the running thread and run `thread` until it blocks or ends
+    global _current
+    me = _current
+    thread.resumer = me
+    _current = thread
+    thread.go.set()
+    me.go.wait()
+    me.go.clear()
+    _current = me
+    if _failure:
+        raise _failure.pop()
+
+
+def _yield():
+    # hand control back to whoever ran the current thread
+    global _current
+    me = _current
+    resumer = me.resumer
+    me.resumer = None
+    _current = resumer
+    resumer.go.set()
+    return me
+
+
+class LockType:
+    def __init__(self):
+        self._owner = None
+        self._waiters = []
+
+    def acquire(self, waitflag=1, timeout=-1):
+        me = _current
+        if self._owner is None:
+            self._owner = me
+            return True
+        if not waitflag:
+            return False
+        if me.resumer is None:
+            raise RuntimeError('main thread would block forever')
+        self._waiters.append(me)
+        _yield()
+        me.go.wait()
+        me.go.clear()
+        return True
+
+    def release(self):
+        if self._owner is None:
+            raise RuntimeError('release of an unlocked lock')
+        if self._waiters:
+            # handoff: the waiter owns the lock when it resumes
+            waiter = self._waiters.pop(0)
+            self._owner = waiter
+            _switch_to(waiter)
+        else:
+            self._owner = None
+
+    def locked(self):
+        return self._owner is not None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def allocate_lock():
+    return LockType()
+
+
+def start_new_thread(func, args, kwargs=None):
+    thread = _Thread(None)
+
+    def body():
+        thread.ident = threading.get_ident()
+        thread.go.wait()
+        thread.go.clear()
+        try:
+            func(*args, **(kwargs or {}))
+        except Exception as e:
+            from . import usys
+            usys.print_exception(e)
+        except BaseException as e:
+            # machine.reset() and the like end the whole run
+            _failure.append(e)
+        _yield()
+
+    threading.Thread(target=body, daemon=True).start()
+    _switch_to(thread)
+
+
+def get_ident():
+    return _current.ident if _current.ident is not None else id(_current)
+
+
+def reset():
+    """Forget threads of a previous run; called when a new World starts."""
+    global _current
+    _main.ident = threading.get_ident()
+    _main.go.clear()
+    _main.resumer = None
+    _current = _main
+    del _failure[:]
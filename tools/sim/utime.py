@@ -0,0 +1,32 @@
+"""time: every sleep advances the virtual clock, time() reads the device rtc."""
+from . import world as _w
+
+_period = _w.TICKS_PERIOD
+
+
+def sleep(seconds):
+    _w.current.advance(seconds * 1000)
+
+
+def sleep_ms(ms):
+    _w.current.advance(ms)
+
+
+def sleep_us(us):
+    _w.current.advance(us / 1000)
+
+
+def time():
+    return _w.current.rtc_time()
+
+
+def ticks_ms():
+    return _w.current.ticks_ms()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _period
+
+
+def ticks_diff(end, start):
+    return ((end - start + _period // 2) % _period) - _period // 2
@@ -0,0 +1,100 @@
+"""The simulated world every stand-in module reads from and reports to.
+
+One World is active at a time (``current``).  It owns the virtual clock:
+nothing advances it but the stand-ins' sleeps and modelled device costs, so a
+run is a pure function of the config, the scenario and the seed.
+"""
+import heapq
+import os
+import random
+
+TICKS_PERIOD = 1 << 30  # ticks_ms wraps like on the esp32 port
+WDT_TIMEOUT = 15000
+
+current = None
+
+
+class Stop(KeyboardInterrupt):
+    """Raised from Scheduler.idle once the run is over; App.loop breaks on it."""
+
+
+class Reset(BaseException):
+    """machine.reset() was called."""
+
+
+class World:
+    def __init__(self, root, scenario, seed=1):
+        self.root = root
+        self.scenario = scenario
+        self.rng = random.Random(seed)
+        self.ms = 0.0
+        self.end = None
+        # device rtc starts at the 2000 epoch until get_time sets it
+        self.rtc_base = 0
+        self.events = []
+        self.event_seq = 0
+        self.irqs = {}
+        self.inbox = []
+        self.sms = []
+        self.http = []
+        self.exceptions = []
+        self.mounts = set()
+        self.wdt_timeout = None
+        self.wdt_last = 0.0
+        self.wdt_worst = 0.0
+        self.wdt_trips = 0
+        self.popped = {}
+        self.redraws = 0
+        self.verbose = False
+
+    # clock
+
+    def advance(self, ms):
+        target = self.ms + ms
+        while self.events and self.events[0][0] <= target:
+            t, _, callback = heapq.heappop(self.events)
+            self.ms = max(self.ms, t)
+            callback()
+        self.ms = target
+
+    def at(self, seconds, callback):
+        heapq.heappush(self.events, (seconds * 1000.0, self.event_seq, callback))
+        self.event_seq += 1
+
+    def ticks_ms(self):
+        return int(self.ms) % TICKS_PERIOD
+
+    def true_time(self):
+        # seconds since 2000-01-01 in the real world (what the server answers)
+        return self.scenario.start + int(self.ms // 1000)
+
+    def rtc_time(self):
+        return self.rtc_base + int(self.ms // 1000)
+
+    def set_rtc(self, seconds):
+        self.rtc_base = seconds - int(self.ms // 1000)
+
+    # devices
+
+    def online(self):
+        return self.scenario.online(self.ms / 1000.0)
+
+    def value(self, name, default=0.0):
+        return self.scenario.value(name, self.ms / 1000.0, default, self.rng)
+
+    def feed_wdt(self):
+        if self.wdt_timeout is None:
+            return
+        gap = self.ms - self.wdt_last
+        if gap > self.wdt_worst:
+            self.wdt_worst = gap
+        if gap > self.wdt_timeout:
+            self.wdt_trips += 1
+        self.wdt_last = self.ms
+
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def print(self, *args, **kwargs):
+        if self.verbose:
+            print(f'[{self.ms / 1000:10.1f}]', *args, **kwargs)